@@ -0,0 +1,308 @@
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+import click
+
+from .templates import build_template_archive
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 50_000)
+SETTINGS = {
+    'description': 'Benchmark project.',
+    'dockerhub_login': 'lycantropos',
+    'email': 'lycantropos@example.com',
+    'github_login': 'lycantropos',
+    'project': 'benchmark',
+    'spdx_license_identifier': 'MIT',
+    'version': '1.0.0',
+}
+TEMPLATE_REPOSITORY = 'benchmarks/template'
+
+
+@click.command()
+@click.option(
+    '--size',
+    '-s',
+    'sizes',
+    multiple=True,
+    default=DEFAULT_SIZES,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='Number of files in synthetic template, '
+    'can be specified multiple times.',
+)
+@click.option(
+    '--repeats',
+    '-r',
+    default=5,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='Number of times to run each benchmark.',
+)
+@click.option(
+    '--output',
+    '-o',
+    default='benchmarks.json',
+    show_default=True,
+    help='Path to JSON file to save results to.',
+)
+@click.option(
+    '--baseline',
+    '-b',
+    default=None,
+    help='Path to JSON file with results to compare with.',
+)
+def main(
+    *, sizes: tuple[int, ...], repeats: int, output: str, baseline: str | None
+) -> None:
+    """Benchmarks project generation with stand-in services."""
+    with tempfile.TemporaryDirectory() as home_directory:
+        # cache directory is resolved from home directory on import
+        os.environ['HOME'] = os.environ['USERPROFILE'] = home_directory
+        results = run_benchmarks(
+            sorted(set(sizes)), repeats=repeats, directory=home_directory
+        )
+    Path(output).write_text(
+        json.dumps(
+            {'metadata': load_metadata(), 'results': results}, indent=2
+        ),
+        encoding='utf-8',
+    )
+    if baseline is not None:
+        baseline_results = json.loads(Path(baseline).read_bytes())['results']
+        for name, statistics_ in results.items():
+            try:
+                baseline_median = baseline_results[name]['median']
+            except KeyError:
+                continue
+            click.echo(
+                f'{name}: {statistics_["median"] / baseline_median:.2f}x'
+            )
+
+
+def run_benchmarks(
+    sizes: list[int], *, repeats: int, directory: str
+) -> dict[str, dict[str, float]]:
+    import httpx
+
+    from monty import monty
+    from tests.stand_in import create_application
+
+    templates_archives = {
+        f'{TEMPLATE_REPOSITORY}-{size}': build_template_archive(size)
+        for size in sizes
+    }
+    monty.set_http_transport_factory(
+        partial(
+            httpx.WSGITransport, app=create_application(templates_archives)
+        )
+    )
+    settings_path = os.path.join(directory, 'settings.yml')
+    Path(settings_path).write_text(
+        ''.join(f'{key}: "{value}"\n' for key, value in SETTINGS.items()),
+        encoding='utf-8',
+    )
+    main_callback = monty.main.callback
+    assert main_callback is not None
+    results = {}
+    for size in sizes:
+        template_repository = f'{TEMPLATE_REPOSITORY}-{size}'
+        templates_dir = os.path.join(directory, 'templates')
+        output_dir = os.path.join(directory, 'output')
+        main = partial(
+            main_callback,
+            settings_path=settings_path,
+            templates_dir=templates_dir,
+            output_dir=output_dir,
+            github_access_token=None,
+            template_repo=template_repository,
+        )
+
+        def clean(*paths: str) -> None:
+            for path in paths:
+                shutil.rmtree(path, ignore_errors=True)
+
+        results[f'main_cold[{size}]'] = measure(
+            partial(main, overwrite=False),
+            repeats=repeats,
+            setup=partial(clean, templates_dir, output_dir),
+        )
+        results[f'main_warm[{size}]'] = measure(
+            partial(main, overwrite=True), repeats=repeats
+        )
+        results[f'main_overwrite[{size}]'] = measure(
+            partial(main, overwrite=True),
+            repeats=repeats,
+            setup=partial(
+                os.remove,
+                os.path.join(output_dir, monty.OUTPUT_MANIFEST_FILE_NAME),
+            ),
+        )
+        template_dir = monty.sync_template(
+            templates_dir, template_repository, None, offline=True
+        )
+        files_paths = list(monty.files_paths(template_dir))
+        results[f'files_paths[{size}]'] = measure(
+            partial(list_files_paths, template_dir), repeats=repeats
+        )
+        results[f'is_binary_file[{size}]'] = measure(
+            partial(detect_binary_files, files_paths), repeats=repeats
+        )
+        settings = monty.load_settings(settings_path, None)
+        renderer = partial(monty.render, settings=settings)
+        results[f'replace_files_paths[{size}]'] = measure(
+            partial(
+                replace_files_paths,
+                files_paths,
+                source_path=template_dir,
+                destination=output_dir,
+                renderer=renderer,
+            ),
+            repeats=repeats,
+        )
+        templated_sources = [
+            source
+            for path in files_paths
+            if not monty.is_binary_file(path)
+            for source in [Path(path).read_text(encoding='utf-8')]
+            if monty.has_template_syntax(source)
+        ]
+        results[f'render[{size}]'] = measure(
+            partial(render_sources, templated_sources, settings),
+            repeats=repeats,
+        )
+        paths_pairs = replace_files_paths(
+            files_paths,
+            source_path=template_dir,
+            destination=output_dir,
+            renderer=renderer,
+        )
+        results[f'render_file[{size}]'] = measure(
+            partial(render_files, paths_pairs, renderer=renderer),
+            repeats=repeats,
+            setup=partial(clean, output_dir),
+        )
+        clean(templates_dir, output_dir)
+    return results
+
+
+def list_files_paths(path: str) -> list[str]:
+    from monty import monty
+
+    return list(monty.files_paths(path))
+
+
+def detect_binary_files(paths: list[str]) -> list[bool]:
+    from monty import monty
+
+    return [monty.is_binary_file(path) for path in paths]
+
+
+def replace_files_paths(
+    paths: list[str],
+    *,
+    source_path: str,
+    destination: str,
+    renderer: Callable[[str], str],
+) -> list[tuple[str, str]]:
+    from monty import monty
+
+    return list(
+        monty.replace_files_paths(
+            paths,
+            source_path=source_path,
+            destination=destination,
+            renderer=renderer,
+        )
+    )
+
+
+def render_sources(sources: list[str], settings: dict[str, str]) -> list[str]:
+    from monty import monty
+
+    # fresh environment per source to measure compilation as well
+    return [
+        monty.render(
+            source, settings, environment=monty.TemplatesEnvironment()
+        )
+        for source in sources
+    ]
+
+
+def render_files(
+    paths_pairs: list[tuple[str, str]], *, renderer: Callable[[str], str]
+) -> None:
+    from monty import monty
+
+    for file_path, new_file_path in paths_pairs:
+        monty.render_file(file_path, new_file_path, renderer=renderer)
+
+
+def measure(
+    function: Callable[[], Any],
+    *,
+    repeats: int,
+    setup: Callable[[], Any] | None = None,
+) -> dict[str, float]:
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        with timer() as elapsed:
+            function()
+        times.append(elapsed())
+    return {
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+        'repeats': repeats,
+    }
+
+
+@contextmanager
+def timer() -> Iterator[Callable[[], float]]:
+    start = time.perf_counter()
+    end: float | None = None
+
+    def elapsed() -> float:
+        return (time.perf_counter() if end is None else end) - start
+
+    try:
+        yield elapsed
+    finally:
+        end = time.perf_counter()
+
+
+def load_metadata() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'python': sys.version,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import io
+from random import Random
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+DIRECTORIES_NAMES = ('data', 'docs', 'nested', 'src', 'tests', '{{ project }}')
+MAX_DEPTH = 8
+BINARY_FILE_SIZE = 2048
+PLAIN_FILE_LINES_COUNT = 20
+TEMPLATED_FILE_CONTENT = (
+    '"""{{ description }}"""\n'
+    "__version__ = '{{ version }}'\n"
+    '{% for index in range(3) %}'
+    "VALUE_{{ index }} = '{{ project }}-{{ index }}'\n"
+    '{% endfor %}'
+)
+
+
+def build_template_archive(
+    files_count: int, *, seed: int = 0, root: str = 'template-master'
+) -> bytes:
+    random = Random(seed)
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as zip_file:
+        for index in range(files_count):
+            directories_names = [
+                random.choice(DIRECTORIES_NAMES)
+                for _ in range(random.randrange(MAX_DEPTH))
+            ]
+            kind = random.random()
+            if kind < 0.5:
+                file_name = f'{{{{ project }}}}_{index}.py'
+                content = TEMPLATED_FILE_CONTENT.encode()
+            elif kind < 0.9:
+                file_name = f'plain_{index}.txt'
+                content = ''.join(
+                    f'line {line_index} of plain file {index}\n'
+                    for line_index in range(PLAIN_FILE_LINES_COUNT)
+                ).encode()
+            else:
+                file_name = f'binary_{index}.bin'
+                content = b'\x00' + random.randbytes(BINARY_FILE_SIZE - 1)
+            file_info = ZipInfo(
+                '/'.join([root, *directories_names, file_name])
+            )
+            file_info.compress_type = ZIP_DEFLATED
+            file_info.external_attr = 0o100644 << 16
+            zip_file.writestr(file_info, content)
+    return buffer.getvalue()
@@ -1,246 +1,2833 @@
 #!/usr/bin/env python3
 """Python project generator."""
 
+from __future__ import annotations
+
+import atexit
 import calendar
+import errno
+import glob
+import hashlib
 import io
 import json
 import os
 import posixpath
+import re
 import shutil
+import stat
 import sys
+import threading
+import time
 import warnings
-from collections.abc import Callable, Container, Iterable, Iterator
+from collections import Counter
+from collections.abc import Callable, Container, Iterable, Iterator, Mapping
+from contextlib import (
+    AbstractContextManager,
+    ExitStack,
+    contextmanager,
+    nullcontext,
+    suppress,
+)
 from datetime import datetime
-from functools import partial
-from http import HTTPMethod
-from itertools import filterfalse, tee
-from pathlib import Path
-from typing import Any, Final, cast
-from zipfile import ZipFile
+from functools import cache, partial
+from http import HTTPMethod, HTTPStatus
+from operator import attrgetter
+from pathlib import Path, PurePosixPath
+from typing import (
+    Any,
+    BinaryIO,
+    Final,
+    IO,
+    Literal,
+    NamedTuple,
+    Protocol,
+    TYPE_CHECKING,
+    TypeVar,
+    cast,
+    get_args,
+)
+
+import click
+
+import monty
+
+if TYPE_CHECKING:
+    import mmap
+    import socketserver
+    from concurrent.futures import Executor, Future
+    from email.message import Message
+    from types import TracebackType
+
+    import httpx
+    from jinja2 import Template
+    from strictyaml.yamllocation import (  # type: ignore[import-untyped]
+        YAMLChunk,
+    )
+
+__version__ = '3.0.0'
+
+
+FULL_NAME_KEY = 'full_name'
+GITHUB_API_ENDPOINT = 'https://api.github.com'
+TROVE_LICENSE_CLASSIFIER_KEY = 'trove_license_classifier'
+TROVE_CLASSIFIER_SEPARATOR = ' :: '
+TEMPLATE_SYNTAX_MARKERS = ('{{', '{%', '{#')
+TEMPLATE_SYNTAX_BINARY_MARKERS = tuple(
+    marker.encode() for marker in TEMPLATE_SYNTAX_MARKERS
+)
+LinkMode = Literal['copy', 'hardlink', 'reflink']
+LINK_MODES: Final[tuple[LinkMode, ...]] = get_args(LinkMode)
+JobsBackend = Literal['thread', 'process']
+JOBS_BACKENDS: Final[tuple[JobsBackend, ...]] = get_args(JobsBackend)
+ArchiveFormat = Literal['tar.gz', 'zip']
+FileKind = Literal['binary', 'plain', 'template']
+TemplatesBackend = Literal['tree', 'archive']
+TEMPLATES_BACKENDS: Final[tuple[TemplatesBackend, ...]] = get_args(
+    TemplatesBackend
+)
+ARCHIVE_FORMATS: Final[tuple[ArchiveFormat, ...]] = get_args(ArchiveFormat)
+VERSION_PATTERN = r'\d+\.\d+(\.\d+)?(-(alpha|beta))?'
+TEMPLATE_REPOSITORY_PATTERN = r'[\w.-]+/[\w.-]+'
+
+
+class SchemaTypes(NamedTuple):
+    NonEmptySingleLineStr: type[Any]
+    SpdxLicenseIdentifier: type[Any]
+    TroveLicenseClassifier: type[Any]
+
+
+@cache
+def load_schema_types() -> SchemaTypes:
+    from strictyaml import Str  # type: ignore[import-untyped]
+
+    class NonEmptySingleLineStr(Str):  # type: ignore[misc]
+        def validate_scalar(self, chunk: YAMLChunk) -> str:
+            contents = (
+                chunk.contents
+                if isinstance(chunk.contents, str)
+                else chunk.contents.value
+            )
+            if not contents:
+                chunk.expecting_but_found(
+                    'when expecting non-empty string', contents
+                )
+            elif len(contents.splitlines()) > 1:
+                chunk.expecting_but_found(
+                    'when expecting single-line string', contents
+                )
+            return contents
+
+    class SpdxLicenseIdentifier(Str):  # type: ignore[misc]
+        def __init__(self, identifiers: Container[str]) -> None:
+            self.identifiers = identifiers
+
+        def validate_scalar(self, chunk: YAMLChunk) -> str:
+            contents = chunk.contents
+            assert isinstance(contents, str), contents
+            if contents not in self.identifiers:
+                chunk.expecting_but_found(
+                    'when expecting SPDX license identifier', contents
+                )
+            return contents
+
+    class TroveLicenseClassifier(Str):  # type: ignore[misc]
+        def __init__(self, identifiers: Container[str]) -> None:
+            self.classifiers = identifiers
+
+        def validate_scalar(self, chunk: YAMLChunk) -> str:
+            contents = chunk.contents
+            assert isinstance(contents, str), contents
+            if contents not in self.classifiers:
+                chunk.expecting_but_found(
+                    'when expecting license Trove classifier', contents
+                )
+            return contents
+
+    return SchemaTypes(
+        NonEmptySingleLineStr, SpdxLicenseIdentifier, TroveLicenseClassifier
+    )
+
+
+def __getattr__(name: str) -> Any:
+    if name in SchemaTypes._fields:
+        return getattr(load_schema_types(), name)
+    if name == 'RetryingTransport':
+        return load_retrying_transport_class()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class TemplatesEnvironment:
+    def __init__(self, *, bytecode_cache_directory: str | None = None) -> None:
+        from jinja2 import (
+            BytecodeCache,
+            Environment,
+            FileSystemBytecodeCache,
+            StrictUndefined,
+        )
+
+        bytecode_cache: BytecodeCache | None
+        if bytecode_cache_directory is None:
+            bytecode_cache = None
+        else:
+            os.makedirs(bytecode_cache_directory, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_directory)
+        self.bytecode_cache = bytecode_cache
+        self.bytecode_cache_directory = bytecode_cache_directory
+        self.environment = Environment(
+            bytecode_cache=bytecode_cache,
+            keep_trailing_newline=True,
+            trim_blocks=True,
+            undefined=StrictUndefined,
+        )
+        self.statistics: Counter[str] = Counter()
+        self._templates: dict[tuple[str | None, str], Template] = {}
+
+    def compile_source(self, source: str, name: str | None = None) -> Template:
+        key = (name, source)
+        try:
+            result = self._templates[key]
+        except KeyError:
+            self.statistics['misses'] += 1
+        else:
+            self.statistics['hits'] += 1
+            return result
+        environment = self.environment
+        with profile_span('compile_template'):
+            if name is None or self.bytecode_cache is None:
+                result = environment.from_string(source)
+            else:
+                bucket = self.bytecode_cache.get_bucket(
+                    environment, name, name, source
+                )
+                code = bucket.code
+                if code is None:
+                    code = bucket.code = environment.compile(
+                        source, name, name
+                    )
+                    self.bytecode_cache.set_bucket(bucket)
+                result = environment.template_class.from_code(
+                    environment, code, environment.make_globals(None)
+                )
+        self._templates[key] = result
+        return result
+
+
+OVERWRITE_FLAG_NAME = '--overwrite'
+OUTPUT_MANIFEST_FILE_NAME = '.monty.json'
+PROFILE_FILE_NAME = 'profile.json'
+PROFILE_TRACE_FILE_NAME = 'trace.json'
+SERVER_DEFAULT_HOST = '127.0.0.1'
+SERVER_DEFAULT_PORT: Final[int] = 8000
+SERVER_DEFAULT_JOBS: Final[int] = 4
+SERVER_TEMPLATES_DEFAULT_TTL: Final[float] = 60.0
+SERVER_LATENCIES_WINDOW_SIZE: Final[int] = 1024
+SERVER_MAX_REQUEST_SIZE: Final[int] = 1 << 20
+SERVER_LOOPBACK_HOSTS: Final[frozenset[str]] = frozenset(
+    {'127.0.0.1', '::1', 'localhost'}
+)
+HTTP_DEFAULT_TIMEOUT: Final[float] = 30.0
+HTTP_DEFAULT_RETRIES: Final[int] = 3
+USERS_CACHE_DIRECTORY_NAME = 'users'
+USERS_CACHE_TTL: Final[float] = 7 * 24 * 60 * 60
+LICENSES_CACHE_TTL: Final[float] = 24 * 60 * 60
+TEMPLATE_COMMITS_INFO_FILE_NAME = '.commits.json'
+TEMPLATE_LOCK_FILE_NAME = '.lock'
+TEMPLATES_CACHE_DEFAULT_SIZE: Final[int] = 512 * 1024 * 1024
+TEMPLATES_OBJECTS_DIRECTORY_NAME = '.objects'
+TEMPLATE_MANIFEST_VERSION: Final[int] = 2
+TEMPLATE_DELTA_MAX_BLOBS_COUNT: Final[int] = 100
+TEMPLATE_DELTA_MAX_RATE_LIMIT_SHARE: Final[float] = 0.25
+TEMPLATE_DELTA_UNAUTHENTICATED_MAX_BLOBS_COUNT: Final[int] = 10
+TEMPLATE_DELTA_MAX_SIZE_RATIO: Final[float] = 0.5
+OBJECTS_CHUNK_SIZE: Final[int] = 1 << 16
+TEMPLATE_COMMITS_INFO_KEYS: Final[frozenset[str]] = frozenset(
+    {'etag', 'last_modified', 'timestamp', 'fetched_at'}
+)
+
+
+def show_version(
+    context: click.Context,
+    _parameter: click.Parameter,
+    value: bool,  # noqa: FBT001
+) -> bool:
+    if value and not context.resilient_parsing:
+        sys.stdout.write(__version__)
+        context.exit()
+    return value
+
+
+_OptionsTarget = TypeVar('_OptionsTarget', bound=Callable[..., Any])
+
+
+def compose_options(
+    *options: Callable[[_OptionsTarget], _OptionsTarget],
+) -> Callable[[_OptionsTarget], _OptionsTarget]:
+    def decorate(function: _OptionsTarget) -> _OptionsTarget:
+        for option in reversed(options):
+            function = option(function)
+        return function
+
+    return decorate
+
+
+templates_dir_option = click.option(
+    '--templates-dir',
+    default='.templates',
+    help='Path (absolute or relative) to templates.',
+)
+
+
+def templates_options(
+    *, ttl: float
+) -> Callable[[_OptionsTarget], _OptionsTarget]:
+    return compose_options(
+        click.option(
+            '--offline',
+            is_flag=True,
+            help='Uses the latest cached version of template '
+            'without accessing the network.',
+        ),
+        click.option(
+            '--templates-ttl',
+            default=ttl,
+            show_default=True,
+            type=click.FloatRange(min=0),
+            help='Number of seconds to use cached version of template for '
+            'without checking for template updates.',
+        ),
+        click.option(
+            '--templates-cache-size',
+            default=TEMPLATES_CACHE_DEFAULT_SIZE,
+            show_default=True,
+            type=click.IntRange(min=0),
+            help='Number of bytes to keep least recently used '
+            'cached templates versions within.',
+        ),
+    )
+
+
+services_options = compose_options(
+    click.option(
+        '--users-ttl',
+        default=USERS_CACHE_TTL,
+        show_default=True,
+        type=click.FloatRange(min=0),
+        help='Number of seconds to use cached GitHub and DockerHub users for '
+        'without revalidating them.',
+    ),
+    click.option(
+        '--http2',
+        is_flag=True,
+        help='Uses HTTP/2 for requests to services '
+        '(requires "http2" extra to be installed).',
+    ),
+    click.option(
+        '--http-timeout',
+        default=HTTP_DEFAULT_TIMEOUT,
+        show_default=True,
+        type=click.FloatRange(min=0, min_open=True),
+        help='Number of seconds to wait for services responses for.',
+    ),
+    click.option(
+        '--http-retries',
+        default=HTTP_DEFAULT_RETRIES,
+        show_default=True,
+        type=click.IntRange(min=0),
+        help='Number of times to retry failed requests to services '
+        'with exponential backoff.',
+    ),
+    click.option(
+        '--bundled-spdx-licenses',
+        is_flag=True,
+        help='Uses SPDX licenses list bundled with the package '
+        'instead of fetching the latest one.',
+    ),
+    click.option(
+        '--github-access-token',
+        '-g',
+        envvar='GITHUB_ACCESS_TOKEN',
+        default=None,
+        help='Personal access token '
+        'that can be used to access the GitHub API.',
+    ),
+)
+
+
+@click.command()
+@click.option(
+    '--version',
+    '-v',
+    is_flag=True,
+    is_eager=True,
+    expose_value=False,
+    callback=show_version,
+    help='Displays script version information and exits.',
+)
+@click.option(
+    '--settings-path',
+    '-s',
+    default='settings.yml',
+    help='Path (absolute or relative) to settings.',
+)
+@templates_dir_option
+@click.option(
+    '--output-dir',
+    '-o',
+    default=None,
+    help='Path (absolute or relative) to output directory '
+    '(defaults to current working directory).',
+)
+@click.option(
+    '--archive',
+    '-a',
+    default=None,
+    help='Path (absolute or relative) to archive to stream project files to '
+    'instead of writing them to output directory '
+    '("-" for standard output).',
+)
+@click.option(
+    '--archive-format',
+    default=None,
+    type=click.Choice(ARCHIVE_FORMATS),
+    help='Format of archive '
+    '(defaults to one inferred from archive extension or "tar.gz").',
+)
+@click.option(
+    OVERWRITE_FLAG_NAME,
+    is_flag=True,
+    help='Overwrites files if output directory exists.',
+)
+@click.option(
+    '--link-mode',
+    default='copy',
+    type=click.Choice(LINK_MODES),
+    help='How to put files without template syntax to output directory: '
+    'by copying, hardlinking or reflinking (copy-on-write cloning, '
+    'falls back to copying if not supported by file system). '
+    'Hardlinked files are shared with templates directory, '
+    'so they should not be modified in place.',
+)
+@click.option(
+    '--jobs',
+    '-j',
+    default=1,
+    type=click.IntRange(min=1),
+    help='Number of files to render concurrently.',
+)
+@click.option(
+    '--jobs-backend',
+    default='thread',
+    type=click.Choice(JOBS_BACKENDS),
+    help='Pool of workers to render files concurrently with.',
+)
+@templates_options(ttl=0)
+@click.option(
+    '--templates-backend',
+    default='tree',
+    type=click.Choice(TEMPLATES_BACKENDS),
+    help='How to cache new templates versions: '
+    'as extracted files trees or as downloaded archives '
+    'which files are read from on demand.',
+)
+@click.option(
+    '--incremental-sync',
+    is_flag=True,
+    help='Fetches only files changed since cached version of template '
+    'via GitHub API, falls back to downloading whole template archive '
+    'if there are too many of them.',
+)
+@click.option(
+    '--profile',
+    'profile_dir',
+    default=None,
+    help='Path (absolute or relative) to directory to save '
+    f'phases, files & requests timings summary ({PROFILE_FILE_NAME!r}) '
+    f'and Chrome trace events ({PROFILE_TRACE_FILE_NAME!r}) to.',
+)
+@services_options
+@click.argument('template-repo')
+def main(
+    *,
+    settings_path: str,
+    templates_dir: str,
+    output_dir: str | None,
+    overwrite: bool,
+    archive: str | None = None,
+    archive_format: ArchiveFormat | None = None,
+    link_mode: LinkMode = 'copy',
+    jobs: int = 1,
+    jobs_backend: JobsBackend = 'thread',
+    offline: bool = False,
+    templates_ttl: float = 0,
+    templates_cache_size: int = TEMPLATES_CACHE_DEFAULT_SIZE,
+    templates_backend: TemplatesBackend = 'tree',
+    incremental_sync: bool = False,
+    users_ttl: float = USERS_CACHE_TTL,
+    http2: bool = False,
+    http_timeout: float = HTTP_DEFAULT_TIMEOUT,
+    http_retries: int = HTTP_DEFAULT_RETRIES,
+    bundled_spdx_licenses: bool = False,
+    profile_dir: str | None = None,
+    github_access_token: str | None,
+    template_repo: str,
+) -> None:
+    """Generates project from template."""
+    if archive is not None and output_dir is not None:
+        raise click.UsageError(
+            'Archive and output directory are mutually exclusive.'
+        )
+    configure_http_client(
+        http2=http2, timeout=http_timeout, retries=http_retries
+    )
+    from concurrent.futures import ThreadPoolExecutor
+
+    templates_dir = os.path.normpath(templates_dir)
+    with (
+        profiling(profile_dir),
+        profile_span('main'),
+        ExitStack() as template_stack,
+    ):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            template_dir_future = executor.submit(
+                sync_template,
+                templates_dir,
+                template_repo,
+                github_access_token,
+                offline=offline,
+                ttl=templates_ttl,
+                cache_size=templates_cache_size,
+                backend=templates_backend,
+                incremental=incremental_sync,
+                exit_stack=template_stack,
+            )
+            user_full_name_future = executor.submit(
+                prefetch_user_full_name,
+                settings_path,
+                github_access_token=github_access_token,
+                ttl=users_ttl,
+                offline=offline,
+            )
+            with profile_span('load_licenses_info'):
+                licenses_info = load_licenses_info(
+                    offline=offline,
+                    bundled_spdx_licenses=bundled_spdx_licenses,
+                )
+            with profile_span('load_settings'):
+                settings = load_settings(
+                    settings_path,
+                    github_access_token,
+                    spdx_licenses_info=licenses_info.spdx_licenses_info,
+                    trove_licenses_classifiers=(
+                        licenses_info.trove_licenses_classifiers
+                    ),
+                    trove_licenses_index=licenses_info.trove_licenses_index,
+                    user_full_name_loader=partial(
+                        load_prefetched_user_full_name,
+                        user_full_name_future,
+                        github_access_token=github_access_token,
+                        ttl=users_ttl,
+                        offline=offline,
+                    ),
+                )
+            template_dir = template_dir_future.result()
+        if archive is not None:
+            with (
+                click.open_file(
+                    archive, 'wb', atomic=archive != '-'
+                ) as archive_file,
+                profile_span('generate_project_archive'),
+            ):
+                generate_project_archive(
+                    template_dir,
+                    archive_file,
+                    settings,
+                    archive_format=(
+                        to_archive_format(archive)
+                        if archive_format is None
+                        else archive_format
+                    ),
+                    environment=load_templates_environment(
+                        templates_dir, template_dir
+                    ),
+                )
+            return
+        if output_dir is None:
+            output_dir = settings['project']
+        with profile_span('generate_project'):
+            generate_project(
+                template_dir,
+                output_dir,
+                settings,
+                environment=load_templates_environment(
+                    templates_dir, template_dir
+                ),
+                link_mode=link_mode,
+                jobs=jobs,
+                jobs_backend=jobs_backend,
+                overwrite=overwrite,
+            )
+
+
+class ProjectSpecification(NamedTuple):
+    settings_path: str
+    template_repo: str
+    output_dir: str | None = None
+
+
+class GenerationReport(NamedTuple):
+    project: ProjectSpecification
+    output_dir: str | None = None
+    error: Exception | None = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+@click.command()
+@click.option(
+    '--manifest',
+    '-m',
+    default=None,
+    help='Path (absolute or relative) to manifest '
+    'with settings path, template repository '
+    'and optional output directory for each project.',
+)
+@click.option(
+    '--settings-path',
+    '-s',
+    multiple=True,
+    help='Path (absolute or relative) to settings, '
+    'can be specified multiple times.',
+)
+@templates_dir_option
+@click.option(
+    '--output-dir',
+    '-o',
+    default=None,
+    help='Path (absolute or relative) to directory '
+    'to generate projects without explicit output directory in '
+    '(defaults to current working directory).',
+)
+@click.option(
+    OVERWRITE_FLAG_NAME,
+    is_flag=True,
+    help='Overwrites files if output directory exists.',
+)
+@click.option(
+    '--link-mode',
+    default='copy',
+    type=click.Choice(LINK_MODES),
+    help='How to put files without template syntax to output directory: '
+    'by copying, hardlinking or reflinking (copy-on-write cloning, '
+    'falls back to copying if not supported by file system). '
+    'Hardlinked files are shared with templates directory, '
+    'so they should not be modified in place.',
+)
+@click.option(
+    '--jobs',
+    '-j',
+    default=1,
+    type=click.IntRange(min=1),
+    help='Number of projects to generate concurrently.',
+)
+@templates_options(ttl=0)
+@services_options
+@click.argument('template-repo', required=False)
+def batch(
+    *,
+    manifest: str | None,
+    settings_path: tuple[str, ...],
+    templates_dir: str,
+    output_dir: str | None,
+    overwrite: bool,
+    link_mode: LinkMode,
+    jobs: int,
+    offline: bool,
+    templates_ttl: float,
+    templates_cache_size: int,
+    users_ttl: float,
+    http2: bool,
+    http_timeout: float,
+    http_retries: int,
+    bundled_spdx_licenses: bool,
+    github_access_token: str | None,
+    template_repo: str | None,
+) -> None:
+    """Generates multiple projects from templates."""
+    projects = [] if manifest is None else load_manifest(manifest)
+    if template_repo is None:
+        if settings_path:
+            raise click.UsageError(
+                'Template repository should be specified '
+                'for settings passed via command line.'
+            )
+    else:
+        projects = [
+            project._replace(template_repo=template_repo)
+            if not project.template_repo
+            else project
+            for project in projects
+        ]
+        projects.extend(
+            ProjectSpecification(path, template_repo) for path in settings_path
+        )
+    if not projects:
+        raise click.UsageError('No projects to generate.')
+    for project in projects:
+        if not project.template_repo:
+            raise click.UsageError(
+                'No template repository specified for project '
+                f'with settings {project.settings_path!r}.'
+            )
+    configure_http_client(
+        http2=http2, timeout=http_timeout, retries=http_retries
+    )
+    reports = generate_projects(
+        projects,
+        templates_dir=templates_dir,
+        output_dir=output_dir,
+        overwrite=overwrite,
+        link_mode=link_mode,
+        jobs=jobs,
+        offline=offline,
+        templates_ttl=templates_ttl,
+        templates_cache_size=templates_cache_size,
+        users_ttl=users_ttl,
+        bundled_spdx_licenses=bundled_spdx_licenses,
+        github_access_token=github_access_token,
+    )
+    for report in reports:
+        if report.succeeded:
+            click.echo(
+                f'OK {report.project.settings_path} -> {report.output_dir}'
+            )
+        else:
+            click.echo(
+                f'FAILED {report.project.settings_path}: {report.error}',
+                err=True,
+            )
+    if not all(report.succeeded for report in reports):
+        raise click.exceptions.Exit(1)
+
+
+@click.group('cache')
+def cache_command() -> None:
+    """Inspects and prunes templates cache."""
+
+
+@cache_command.command('stats')
+@templates_dir_option
+def cache_stats(*, templates_dir: str) -> None:
+    """Displays templates cache statistics."""
+    statistics = load_templates_cache_statistics(
+        os.path.normpath(templates_dir)
+    )
+    for name, value in statistics.items():
+        click.echo(f'{name}: {value}')
+
+
+@cache_command.command('prune')
+@templates_dir_option
+@click.option(
+    '--max-size',
+    default=0,
+    show_default=True,
+    type=click.IntRange(min=0),
+    help='Number of bytes to keep least recently used '
+    'cached templates versions within.',
+)
+def cache_prune(*, templates_dir: str, max_size: int) -> None:
+    """Removes least recently used templates versions."""
+    for template_path in prune_templates(
+        os.path.normpath(templates_dir), max_size=max_size
+    ):
+        click.echo(f'Removed {template_path}')
+
+
+@click.command()
+@click.option(
+    '--host',
+    default=SERVER_DEFAULT_HOST,
+    show_default=True,
+    help='Host to listen on.',
+)
+@click.option(
+    '--port',
+    '-p',
+    default=SERVER_DEFAULT_PORT,
+    show_default=True,
+    type=click.IntRange(0, 65535),
+    help='Port to listen on.',
+)
+@click.option(
+    '--unix-socket',
+    default=None,
+    help='Path (absolute or relative) to Unix socket to listen on '
+    'instead of host & port.',
+)
+@click.option(
+    '--root',
+    default=os.curdir,
+    help='Path (absolute or relative) to directory '
+    'which requested settings paths & output directories should be within '
+    '(defaults to current working directory).',
+)
+@templates_dir_option
+@click.option(
+    '--jobs',
+    '-j',
+    default=SERVER_DEFAULT_JOBS,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='Number of projects to generate concurrently.',
+)
+@templates_options(ttl=SERVER_TEMPLATES_DEFAULT_TTL)
+@services_options
+def serve(
+    *,
+    host: str,
+    port: int,
+    unix_socket: str | None,
+    root: str,
+    templates_dir: str,
+    jobs: int,
+    offline: bool,
+    templates_ttl: float,
+    templates_cache_size: int,
+    users_ttl: float,
+    http2: bool,
+    http_timeout: float,
+    http_retries: int,
+    bundled_spdx_licenses: bool,
+    github_access_token: str | None,
+) -> None:
+    """Serves generation requests over HTTP with warm caches."""
+    configure_http_client(
+        http2=http2, timeout=http_timeout, retries=http_retries
+    )
+    service = GenerationService(
+        templates_dir=templates_dir,
+        jobs=jobs,
+        offline=offline,
+        templates_ttl=templates_ttl,
+        templates_cache_size=templates_cache_size,
+        users_ttl=users_ttl,
+        bundled_spdx_licenses=bundled_spdx_licenses,
+        github_access_token=github_access_token,
+        root=root,
+    )
+    with create_generation_server(
+        service, host=host, port=port, unix_socket=unix_socket
+    ) as server:
+        click.echo(
+            f'Serving on http://{host}:{server.server_address[1]}'
+            if unix_socket is None
+            else f'Serving on {unix_socket}'
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if unix_socket is not None:
+                with suppress(FileNotFoundError):
+                    os.unlink(unix_socket)
+
+
+def generate_projects(
+    projects: Iterable[ProjectSpecification],
+    *,
+    templates_dir: str = '.templates',
+    output_dir: str | None = None,
+    overwrite: bool = False,
+    link_mode: LinkMode = 'copy',
+    jobs: int = 1,
+    offline: bool = False,
+    templates_ttl: float = 0,
+    templates_cache_size: int | None = TEMPLATES_CACHE_DEFAULT_SIZE,
+    users_ttl: float = USERS_CACHE_TTL,
+    bundled_spdx_licenses: bool = False,
+    github_access_token: str | None = None,
+) -> list[GenerationReport]:
+    projects = list(projects)
+    templates_dir = os.path.normpath(templates_dir)
+    templates_repositories = list(
+        dict.fromkeys(project.template_repo for project in projects)
+    )
+    with ExitStack() as templates_stack:
+        return _generate_projects(
+            projects,
+            templates_dir=templates_dir,
+            templates_repositories=templates_repositories,
+            templates_stack=templates_stack,
+            output_dir=output_dir,
+            overwrite=overwrite,
+            link_mode=link_mode,
+            jobs=jobs,
+            offline=offline,
+            templates_ttl=templates_ttl,
+            templates_cache_size=templates_cache_size,
+            users_ttl=users_ttl,
+            bundled_spdx_licenses=bundled_spdx_licenses,
+            github_access_token=github_access_token,
+        )
+
+
+def _generate_projects(
+    projects: list[ProjectSpecification],
+    *,
+    templates_dir: str,
+    templates_repositories: list[str],
+    templates_stack: ExitStack,
+    output_dir: str | None,
+    overwrite: bool,
+    link_mode: LinkMode,
+    jobs: int,
+    offline: bool,
+    templates_ttl: float,
+    templates_cache_size: int | None,
+    users_ttl: float,
+    bundled_spdx_licenses: bool,
+    github_access_token: str | None,
+) -> list[GenerationReport]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    templates_dirs: dict[str, str | Exception] = {}
+    templates_environments: dict[str, TemplatesEnvironment] = {}
+    with ThreadPoolExecutor(
+        max_workers=max(len(templates_repositories), 1)
+    ) as executor:
+        templates_dirs_futures = {
+            template_repo: executor.submit(
+                sync_template,
+                templates_dir,
+                template_repo,
+                github_access_token,
+                offline=offline,
+                ttl=templates_ttl,
+                cache_size=None,
+                exit_stack=templates_stack,
+            )
+            for template_repo in templates_repositories
+        }
+        licenses_info = load_licenses_info(
+            offline=offline, bundled_spdx_licenses=bundled_spdx_licenses
+        )
+        for template_repo, template_future in templates_dirs_futures.items():
+            try:
+                template_path = template_future.result()
+            except Exception as error:
+                templates_dirs[template_repo] = error
+            else:
+                templates_dirs[template_repo] = template_path
+                templates_environments[template_repo] = (
+                    load_templates_environment(templates_dir, template_path)
+                )
+    if templates_cache_size is not None:
+        prune_templates(
+            templates_dir,
+            max_size=templates_cache_size,
+            keep=[
+                template_path
+                for template_path in templates_dirs.values()
+                if isinstance(template_path, str)
+            ],
+        )
+    user_full_name_loader = cache(
+        partial(
+            load_user_full_name,
+            github_access_token=github_access_token,
+            ttl=users_ttl,
+            offline=offline,
+        )
+    )
+    reports: list[GenerationReport | None] = [None] * len(projects)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures: dict[Future[None], tuple[int, str]] = {}
+        for index, project in enumerate(projects):
+            template_dir = templates_dirs[project.template_repo]
+            if isinstance(template_dir, Exception):
+                reports[index] = GenerationReport(project, error=template_dir)
+                continue
+            try:
+                settings = load_settings(
+                    project.settings_path,
+                    github_access_token,
+                    spdx_licenses_info=licenses_info.spdx_licenses_info,
+                    trove_licenses_classifiers=(
+                        licenses_info.trove_licenses_classifiers
+                    ),
+                    trove_licenses_index=licenses_info.trove_licenses_index,
+                    user_full_name_loader=user_full_name_loader,
+                )
+            except Exception as error:
+                reports[index] = GenerationReport(project, error=error)
+                continue
+            project_output_dir = (
+                os.path.join(output_dir or os.curdir, settings['project'])
+                if project.output_dir is None
+                else project.output_dir
+            )
+            future = executor.submit(
+                generate_project,
+                template_dir,
+                project_output_dir,
+                settings,
+                environment=templates_environments[project.template_repo],
+                link_mode=link_mode,
+                overwrite=overwrite,
+            )
+            futures[future] = index, project_output_dir
+        for future, (index, project_output_dir) in futures.items():
+            try:
+                future.result()
+            except Exception as error:
+                reports[index] = GenerationReport(projects[index], error=error)
+            else:
+                reports[index] = GenerationReport(
+                    projects[index], output_dir=project_output_dir
+                )
+    assert all(report is not None for report in reports), reports
+    return cast(list[GenerationReport], reports)
+
+
+class WarmTemplate(NamedTuple):
+    path: str
+    environment: TemplatesEnvironment
+    synced_at: float
+    lock: ExitStack
+
+
+class GenerationService:
+    def __init__(
+        self,
+        *,
+        templates_dir: str = '.templates',
+        jobs: int = SERVER_DEFAULT_JOBS,
+        offline: bool = False,
+        templates_ttl: float = SERVER_TEMPLATES_DEFAULT_TTL,
+        templates_cache_size: int | None = TEMPLATES_CACHE_DEFAULT_SIZE,
+        users_ttl: float = USERS_CACHE_TTL,
+        licenses_ttl: float = LICENSES_CACHE_TTL,
+        bundled_spdx_licenses: bool = False,
+        github_access_token: str | None = None,
+        root: str = os.curdir,
+    ) -> None:
+        from collections import deque
+
+        self.bundled_spdx_licenses = bundled_spdx_licenses
+        self.github_access_token = github_access_token
+        self.licenses_ttl = licenses_ttl
+        self.offline = offline
+        self.root = os.path.realpath(root)
+        self.templates_cache_size = templates_cache_size
+        self.templates_dir = os.path.normpath(templates_dir)
+        self.templates_ttl = templates_ttl
+        self.users_ttl = users_ttl
+        self._caches_statistics: Counter[tuple[str, str]] = Counter()
+        self._generation_semaphore = threading.BoundedSemaphore(jobs)
+        self._latencies: deque[float] = deque(
+            maxlen=SERVER_LATENCIES_WINDOW_SIZE
+        )
+        self._licenses_info: LicensesInfo | None = None
+        self._licenses_loaded_at = 0.0
+        self._licenses_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._requests_statistics: Counter[str] = Counter()
+        self._templates: dict[str, WarmTemplate] = {}
+        self._templates_locks: dict[str, threading.Lock] = {}
+        self._users: dict[tuple[str, str], tuple[float, str]] = {}
+
+    def handle(
+        self, method: str, path: str, body: bytes
+    ) -> tuple[HTTPStatus, dict[str, Any]]:
+        if path == '/generate':
+            if method != HTTPMethod.POST:
+                return HTTPStatus.METHOD_NOT_ALLOWED, {
+                    'error': f'Method {method!r} is not allowed.'
+                }
+            start = time.perf_counter()
+            with self._lock:
+                self._requests_statistics['in_flight'] += 1
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            try:
+                status, response = self.generate(body)
+            finally:
+                duration = time.perf_counter() - start
+                with self._lock:
+                    self._requests_statistics['in_flight'] -= 1
+                    self._requests_statistics['total'] += 1
+                    if status != HTTPStatus.OK:
+                        self._requests_statistics['failed'] += 1
+                    self._latencies.append(duration)
+            return status, {**response, 'duration': duration}
+        if method != HTTPMethod.GET:
+            return HTTPStatus.METHOD_NOT_ALLOWED, {
+                'error': f'Method {method!r} is not allowed.'
+            }
+        if path == '/health':
+            return HTTPStatus.OK, {'status': 'ok'}
+        if path == '/metrics':
+            return HTTPStatus.OK, self.load_metrics()
+        return HTTPStatus.NOT_FOUND, {'error': f'Path {path!r} is not found.'}
+
+    def generate(self, body: bytes) -> tuple[HTTPStatus, dict[str, Any]]:
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {'error': 'Invalid JSON body.'}
+        if not (
+            isinstance(request, dict)
+            and isinstance(request.get('settings_path'), str)
+            and isinstance(request.get('template_repo'), str)
+            and isinstance(request.get('output_dir', ''), str)
+            and isinstance(request.get('overwrite', False), bool)
+            and request.get('link_mode', 'copy') in LINK_MODES
+        ):
+            return HTTPStatus.BAD_REQUEST, {
+                'error': 'Request should be an object '
+                'with "settings_path" & "template_repo" strings, '
+                'optional "output_dir" string, "overwrite" boolean '
+                f'and "link_mode" one of {LINK_MODES!r}.'
+            }
+        if not is_template_repository_name(request['template_repo']):
+            return HTTPStatus.BAD_REQUEST, {
+                'error': 'Template repository should be '
+                'in "owner/name" format.'
+            }
+        settings_path = to_confined_path(self.root, request['settings_path'])
+        if settings_path is None:
+            return HTTPStatus.FORBIDDEN, {
+                'error': 'Settings path should be within '
+                f'{self.root!r} directory.'
+            }
+        try:
+            template = self.load_template(request['template_repo'])
+            licenses_info = self.load_licenses_info()
+            settings = load_settings(
+                settings_path,
+                self.github_access_token,
+                spdx_licenses_info=licenses_info.spdx_licenses_info,
+                trove_licenses_classifiers=(
+                    licenses_info.trove_licenses_classifiers
+                ),
+                trove_licenses_index=licenses_info.trove_licenses_index,
+                user_full_name_loader=self.load_user_full_name,
+            )
+            output_dir = to_confined_path(
+                self.root, request.get('output_dir') or settings['project']
+            )
+            if output_dir is None:
+                return HTTPStatus.FORBIDDEN, {
+                    'error': 'Output directory should be within '
+                    f'{self.root!r} directory.'
+                }
+            with (
+                self._generation_semaphore,
+                lock_template_version(template.path),
+            ):
+                generate_project(
+                    template.path,
+                    output_dir,
+                    settings,
+                    environment=template.environment,
+                    link_mode=request.get('link_mode', 'copy'),
+                    overwrite=request.get('overwrite', False),
+                )
+        except click.BadOptionUsage as error:
+            return HTTPStatus.CONFLICT, {'error': error.format_message()}
+        except Exception as error:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(error)}
+        return HTTPStatus.OK, {'output_dir': output_dir}
+
+    def load_licenses_info(self) -> LicensesInfo:
+        with self._licenses_lock:
+            if (
+                self._licenses_info is not None
+                and time.monotonic() - self._licenses_loaded_at
+                < self.licenses_ttl
+            ):
+                self._count_cache_access('licenses', hit=True)
+                return self._licenses_info
+            self._count_cache_access('licenses', hit=False)
+            result = self._licenses_info = load_licenses_info(
+                ttl=self.licenses_ttl,
+                offline=self.offline,
+                bundled_spdx_licenses=self.bundled_spdx_licenses,
+            )
+            self._licenses_loaded_at = time.monotonic()
+        return result
+
+    def load_metrics(self) -> dict[str, Any]:
+        with self._lock:
+            caches_statistics = self._caches_statistics.copy()
+            latencies = sorted(self._latencies)
+            requests_statistics = self._requests_statistics.copy()
+            templates_environments = [
+                template.environment for template in self._templates.values()
+            ]
+        for environment in templates_environments:
+            for name, value in environment.statistics.items():
+                caches_statistics['compiled_templates', name] += value
+        return {
+            'requests': {
+                name: requests_statistics[name]
+                for name in ('total', 'failed', 'in_flight')
+            },
+            'latency': {
+                'count': len(latencies),
+                'mean': (
+                    sum(latencies) / len(latencies) if latencies else None
+                ),
+                'max': latencies[-1] if latencies else None,
+                **{
+                    f'p{round(quantile * 100)}': (
+                        latencies[
+                            min(
+                                int(quantile * len(latencies)),
+                                len(latencies) - 1,
+                            )
+                        ]
+                        if latencies
+                        else None
+                    )
+                    for quantile in (0.5, 0.95, 0.99)
+                },
+            },
+            'caches': {
+                cache_name: {
+                    name: caches_statistics[cache_name, name]
+                    for name in ('hits', 'misses')
+                }
+                for cache_name in (
+                    'templates',
+                    'compiled_templates',
+                    'licenses',
+                    'users',
+                )
+            },
+        }
+
+    def load_template(self, template_repo: str) -> WarmTemplate:
+        with self._lock:
+            template_lock = self._templates_locks.setdefault(
+                template_repo, threading.Lock()
+            )
+        with template_lock:
+            cached_template = self._templates.get(template_repo)
+            if (
+                cached_template is not None
+                and time.monotonic() - cached_template.synced_at
+                < self.templates_ttl
+            ):
+                self._count_cache_access('templates', hit=True)
+                return cached_template
+            self._count_cache_access('templates', hit=False)
+            # keeps warm template from being pruned by other processes
+            template_stack = ExitStack()
+            template_dir = sync_template(
+                self.templates_dir,
+                template_repo,
+                self.github_access_token,
+                offline=self.offline,
+                ttl=self.templates_ttl,
+                cache_size=None,
+                exit_stack=template_stack,
+            )
+            if cached_template is not None:
+                cached_template.lock.close()
+            result = WarmTemplate(
+                template_dir,
+                (
+                    cached_template.environment
+                    if (
+                        cached_template is not None
+                        and cached_template.path == template_dir
+                    )
+                    else load_templates_environment(
+                        self.templates_dir, template_dir
+                    )
+                ),
+                time.monotonic(),
+                template_stack,
+            )
+            with self._lock:
+                self._templates[template_repo] = result
+                warm_templates_dirs = [
+                    template.path for template in self._templates.values()
+                ]
+        if self.templates_cache_size is not None:
+            prune_templates(
+                self.templates_dir,
+                max_size=self.templates_cache_size,
+                keep=warm_templates_dirs,
+            )
+        return result
+
+    def load_user_full_name(
+        self, github_login: str, dockerhub_login: str
+    ) -> str:
+        key = github_login, dockerhub_login
+        with self._lock:
+            cached_user = self._users.get(key)
+        if (
+            cached_user is not None
+            and time.monotonic() - cached_user[0] < self.users_ttl
+        ):
+            self._count_cache_access('users', hit=True)
+            return cached_user[1]
+        self._count_cache_access('users', hit=False)
+        result = load_user_full_name(
+            github_login,
+            dockerhub_login,
+            github_access_token=self.github_access_token,
+            ttl=self.users_ttl,
+            offline=self.offline,
+        )
+        with self._lock:
+            self._users[key] = time.monotonic(), result
+        return result
+
+    def _count_cache_access(self, name: str, *, hit: bool) -> None:
+        with self._lock:
+            self._caches_statistics[name, 'hits' if hit else 'misses'] += 1
+
+
+def to_request_headers_error(
+    method: str,
+    headers: Message[str, str],
+    *,
+    allowed_hosts: Container[str] | None,
+) -> tuple[HTTPStatus, dict[str, Any]] | None:
+    from urllib.parse import urlsplit
+
+    # no pages are served, so any request from a web page is foreign,
+    # while checking host protects against DNS rebinding
+    if allowed_hosts is not None and (
+        urlsplit(f'//{headers.get("Host", "")}').hostname not in allowed_hosts
+    ):
+        return HTTPStatus.FORBIDDEN, {'error': 'Host is not allowed.'}
+    if 'Origin' in headers:
+        return HTTPStatus.FORBIDDEN, {'error': 'Origin is not allowed.'}
+    if (
+        method == HTTPMethod.POST
+        and headers.get('Content-Type', '')
+        .split(';', maxsplit=1)[0]
+        .strip()
+        .lower()
+        != 'application/json'
+    ):
+        return HTTPStatus.UNSUPPORTED_MEDIA_TYPE, {
+            'error': 'Content type should be "application/json".'
+        }
+    return None
+
+
+def to_confined_path(root: str, path: str) -> str | None:
+    result = os.path.realpath(os.path.join(root, path))
+    return result if os.path.commonpath([root, result]) == root else None
+
+
+def is_template_repository_name(name: str) -> bool:
+    return re.fullmatch(TEMPLATE_REPOSITORY_PATTERN, name) is not None and all(
+        part.strip('.') for part in name.split('/')
+    )
+
+
+def create_generation_server(
+    service: GenerationService,
+    *,
+    host: str = SERVER_DEFAULT_HOST,
+    port: int = SERVER_DEFAULT_PORT,
+    unix_socket: str | None = None,
+) -> socketserver.TCPServer:
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit
+
+    class GenerationRequestHandler(BaseHTTPRequestHandler):
+        server_version = f'{monty.__name__}/{__version__}'
+
+        def address_string(self) -> str:
+            return (
+                str(self.client_address[0])
+                if isinstance(self.client_address, tuple)
+                else str(unix_socket)
+            )
+
+        def do_GET(self) -> None:
+            self._handle()
+
+        def do_POST(self) -> None:
+            self._handle()
+
+        def _handle(self) -> None:
+            content_length = self.headers.get('Content-Length', '0')
+            headers_error = to_request_headers_error(
+                self.command,
+                self.headers,
+                allowed_hosts=(
+                    None
+                    if unix_socket is not None
+                    else SERVER_LOOPBACK_HOSTS | {host.lower()}
+                ),
+            )
+            if headers_error is not None:
+                status, response = headers_error
+            elif not (content_length.isascii() and content_length.isdigit()):
+                status, response = (
+                    HTTPStatus.BAD_REQUEST,
+                    {'error': 'Invalid Content-Length header.'},
+                )
+            elif int(content_length) > SERVER_MAX_REQUEST_SIZE:
+                status, response = (
+                    HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                    {'error': 'Request body is too large.'},
+                )
+            else:
+                status, response = service.handle(
+                    self.command,
+                    urlsplit(self.path).path,
+                    self.rfile.read(int(content_length)),
+                )
+            content = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    if unix_socket is None:
+        return ThreadingHTTPServer((host, port), GenerationRequestHandler)
+    with suppress(FileNotFoundError):
+        os.unlink(unix_socket)
+    result = socketserver.ThreadingUnixStreamServer(
+        unix_socket, GenerationRequestHandler
+    )
+    result.daemon_threads = True
+    return result
+
+
+def generate_project(
+    template_dir: str,
+    output_dir: str,
+    settings: dict[str, str],
+    *,
+    environment: TemplatesEnvironment | None = None,
+    link_mode: LinkMode = 'copy',
+    jobs: int = 1,
+    jobs_backend: JobsBackend = 'thread',
+    overwrite: bool,
+) -> None:
+    output_dir = os.path.normpath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    if environment is None:
+        environment = default_templates_environment()
+    renderer = cast(
+        Callable[..., str],
+        partial(render, settings=settings, environment=environment),
+    )
+    template_manifest = load_template_manifest(template_dir)
+    with profile_span('list_files'):
+        files_plans = plan_template_files(
+            template_dir,
+            destination=output_dir,
+            renderer=renderer,
+            manifest=template_manifest,
+        )
+    template_archive_path = to_template_archive_path(template_dir)
+    with (
+        TemplateArchive(template_archive_path)
+        if os.path.isfile(template_archive_path)
+        else nullcontext()
+    ) as template_archive:
+        _generate_project(
+            template_dir,
+            output_dir,
+            settings,
+            files_plans=files_plans,
+            template_manifest=template_manifest,
+            template_archive=template_archive,
+            environment=environment,
+            renderer=renderer,
+            link_mode=link_mode,
+            jobs=jobs,
+            jobs_backend=jobs_backend,
+            overwrite=overwrite,
+        )
+
+
+def _generate_project(
+    template_dir: str,
+    output_dir: str,
+    settings: dict[str, str],
+    *,
+    files_plans: list[tuple[str, str, FileKind | None]],
+    template_manifest: dict[str, Any] | None,
+    template_archive: TemplateArchive | None,
+    environment: TemplatesEnvironment,
+    renderer: Callable[..., str],
+    link_mode: LinkMode,
+    jobs: int,
+    jobs_backend: JobsBackend,
+    overwrite: bool,
+) -> None:
+    paths_pairs = [
+        (file_path, new_file_path)
+        for file_path, new_file_path, _ in files_plans
+    ]
+    if not overwrite:
+        for _, new_file_path in paths_pairs:
+            if os.path.exists(new_file_path):
+                raise click.BadOptionUsage(
+                    'overwrite',
+                    f'Trying to overwrite {new_file_path!r}, '
+                    f'but no {OVERWRITE_FLAG_NAME!r} flag was set.',
+                )
+    manifest_path = os.path.join(output_dir, OUTPUT_MANIFEST_FILE_NAME)
+    generation_key = to_generation_key(link_mode=link_mode)
+    previous_files_infos = load_output_files_infos(
+        manifest_path, generation_key
+    )
+    templates_files_digests = to_template_files_digests(template_manifest)
+    settings_digest = to_settings_digest(settings)
+    files_digests = {}
+    stale_paths_pairs = []
+    with profile_span('check_output_files'):
+        for file_path, new_file_path, file_kind in files_plans:
+            output_file_name = to_template_name(new_file_path, output_dir)
+            file_digest = templates_files_digests.get(
+                to_template_name(file_path, template_dir)
+            ) or to_file_digest(file_path)
+            if file_kind not in ('binary', 'plain'):
+                # only rendered files depend on settings
+                file_digest = f'{file_digest}:{settings_digest}'
+            files_digests[output_file_name] = file_digest
+            if not is_output_file_up_to_date(
+                new_file_path,
+                previous_files_infos.get(output_file_name),
+                file_digest,
+            ):
+                stale_paths_pairs.append((file_path, new_file_path))
+    with profile_span('render_files', count=len(stale_paths_pairs)):
+        render_files(
+            stale_paths_pairs,
+            template_dir=template_dir,
+            settings=settings,
+            environment=environment,
+            renderer=renderer,
+            link_mode=link_mode,
+            jobs=jobs,
+            jobs_backend=jobs_backend,
+            files_kinds={
+                file_path: file_kind
+                for file_path, _, file_kind in files_plans
+                if file_kind is not None
+            },
+            template_archive=template_archive,
+        )
+    with profile_span('save_output_manifest'):
+        save_json_object(
+            manifest_path,
+            {
+                'key': generation_key,
+                'files': {
+                    output_file_name: {
+                        'source': file_digest,
+                        **to_output_file_info(
+                            os.path.join(
+                                output_dir, *output_file_name.split('/')
+                            )
+                        ),
+                    }
+                    for output_file_name, file_digest in files_digests.items()
+                },
+            },
+        )
+
+
+def render_files(
+    paths_pairs: list[tuple[str, str]],
+    *,
+    template_dir: str,
+    settings: dict[str, str],
+    environment: TemplatesEnvironment,
+    renderer: Callable[..., str],
+    link_mode: LinkMode,
+    jobs: int,
+    jobs_backend: JobsBackend,
+    files_kinds: Mapping[str, FileKind] | None = None,
+    template_archive: TemplateArchive | None = None,
+) -> None:
+    if files_kinds is None:
+        files_kinds = {}
+    if jobs == 1 or len(paths_pairs) <= 1:
+        for file_path, new_file_path in paths_pairs:
+            render_file_with(
+                file_path,
+                new_file_path,
+                to_template_name(file_path, template_dir),
+                files_kinds.get(file_path),
+                renderer=renderer,
+                link_mode=link_mode,
+                template_archive=template_archive,
+            )
+        return
+    from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+    executor: Executor
+    if jobs_backend == 'process':
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=initialize_rendering_worker,
+            initargs=(
+                settings,
+                environment.bytecode_cache_directory,
+                link_mode,
+                None if template_archive is None else template_archive.path,
+            ),
+        )
+        task = render_file_in_worker
+    else:
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        task = partial(
+            render_file_with,
+            renderer=renderer,
+            link_mode=link_mode,
+            template_archive=template_archive,
+        )
+    with executor:
+        futures = [
+            executor.submit(
+                task,
+                file_path,
+                new_file_path,
+                to_template_name(file_path, template_dir),
+                files_kinds.get(file_path),
+            )
+            for file_path, new_file_path in paths_pairs
+        ]
+        done_futures, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        if any(future.exception() is not None for future in done_futures):
+            executor.shutdown(cancel_futures=True)
+    for future in futures:
+        if not future.cancelled():
+            future.result()
+
+
+def generate_project_archive(
+    template_dir: str,
+    destination: IO[bytes],
+    settings: dict[str, str],
+    *,
+    archive_format: ArchiveFormat = 'tar.gz',
+    root: str | None = None,
+    environment: TemplatesEnvironment | None = None,
+    encoding: str = 'utf-8',
+) -> None:
+    if environment is None:
+        environment = default_templates_environment()
+    if root is None:
+        root = settings['project']
+    renderer = cast(
+        Callable[..., str],
+        partial(render, settings=settings, environment=environment),
+    )
+    with profile_span('list_files'):
+        files_plans = plan_template_files(
+            template_dir,
+            destination=root,
+            renderer=renderer,
+            manifest=load_template_manifest(template_dir),
+        )
+    template_archive_path = to_template_archive_path(template_dir)
+    with (
+        (
+            TemplateArchive(template_archive_path)
+            if os.path.isfile(template_archive_path)
+            else nullcontext()
+        ) as template_archive,
+        open_archive(destination, archive_format) as add_file,
+    ):
+        for file_path, archive_path, file_kind in files_plans:
+            name = to_template_name(file_path, template_dir)
+            with (
+                profile_span(
+                    os.path.basename(file_path), 'file', path=file_path
+                ),
+                (
+                    open(file_path, 'rb', buffering=0)
+                    if template_archive is None
+                    else template_archive.open(name)
+                ) as source,
+            ):
+                file_stat = (
+                    to_template_file_stat(os.fstat(source.fileno()))
+                    if template_archive is None
+                    else template_archive.stat(name)
+                )
+                archive_name = Path(archive_path).as_posix()
+                _, source_bytes = classify_source(source, file_kind)
+                if source_bytes is not None:
+                    rendered_bytes = render_bytes(
+                        source_bytes,
+                        renderer=partial(renderer, name=name),
+                        encoding=encoding,
+                    )
+                    add_file(
+                        archive_name,
+                        io.BytesIO(rendered_bytes),
+                        size=len(rendered_bytes),
+                        mode=file_stat.mode,
+                        mtime=file_stat.mtime,
+                    )
+                    continue
+                source.seek(0)
+                add_file(
+                    archive_name,
+                    source,
+                    size=file_stat.size,
+                    mode=file_stat.mode,
+                    mtime=file_stat.mtime,
+                )
+
+
+class TemplateFileStat(NamedTuple):
+    size: int
+    mode: int
+    mtime: float
+
+
+def to_template_file_stat(file_stat: os.stat_result) -> TemplateFileStat:
+    return TemplateFileStat(
+        file_stat.st_size, stat.S_IMODE(file_stat.st_mode), file_stat.st_mtime
+    )
+
+
+class MemoryMappedFile(io.RawIOBase):
+    def __init__(self, mapping: mmap.mmap) -> None:
+        super().__init__()
+        self._mapping = mapping
+
+    def close(self) -> None:
+        if not self.closed:
+            self._mapping.close()
+        super().close()
+
+    def read(self, size: int | None = -1) -> bytes:
+        return self._mapping.read(None if size is None or size < 0 else size)
+
+    def readable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        self._mapping.seek(offset, cast(Literal[0, 1, 2], whence))
+        return self._mapping.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._mapping.tell()
+
+
+class TemplateArchive:
+    def __init__(self, path: str) -> None:
+        import mmap
+        from zipfile import ZipFile
+
+        self.path = path
+        with open(path, 'rb') as file:
+            self._file = MemoryMappedFile(
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+        try:
+            self._zip_file = ZipFile(self._file)
+        except BaseException:
+            self._file.close()
+            raise
+        self._files_infos = {
+            to_template_archive_name(file_info.filename): file_info
+            for file_info in self._zip_file.infolist()
+            if not file_info.is_dir()
+        }
+
+    def __enter__(self) -> TemplateArchive:
+        return self
+
+    def __exit__(
+        self,
+        exception_type: type[BaseException] | None,
+        exception: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._zip_file.close()
+        self._file.close()
+
+    def open(self, name: str) -> IO[bytes]:
+        return self._zip_file.open(self._files_infos[name])
+
+    def stat(self, name: str) -> TemplateFileStat:
+        file_info = self._files_infos[name]
+        return TemplateFileStat(
+            file_info.file_size,
+            to_object_mode(file_info.external_attr >> 16),
+            time.mktime((*file_info.date_time, 0, 0, -1)),
+        )
+
+
+def to_template_archive_name(path: str) -> str:
+    # archives of repositories have single root directory
+    return PurePosixPath(*PurePosixPath(path).parts[1:]).as_posix()
+
+
+def to_template_archive_path(template_path: str) -> str:
+    return template_path + '.zip'
+
+
+class ArchiveFileAdder(Protocol):
+    def __call__(
+        self,
+        name: str,
+        source: IO[bytes],
+        /,
+        *,
+        size: int,
+        mode: int,
+        mtime: float,
+    ) -> None: ...
+
+
+ZipDateTime = tuple[int, int, int, int, int, int]
+ZIP_MIN_DATE_TIME: Final[ZipDateTime] = (1980, 1, 1, 0, 0, 0)
+
+
+@contextmanager
+def open_archive(
+    destination: IO[bytes], archive_format: ArchiveFormat
+) -> Iterator[ArchiveFileAdder]:
+    if archive_format == 'zip':
+        from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+        with ZipFile(destination, 'w', ZIP_DEFLATED) as zip_file:
+
+            def add_zip_file(
+                name: str,
+                source: IO[bytes],
+                /,
+                *,
+                size: int,
+                mode: int,
+                mtime: float,
+            ) -> None:
+                local_time = time.localtime(mtime)
+                file_info = ZipInfo(
+                    name,
+                    date_time=max(
+                        (
+                            local_time.tm_year,
+                            local_time.tm_mon,
+                            local_time.tm_mday,
+                            local_time.tm_hour,
+                            local_time.tm_min,
+                            local_time.tm_sec,
+                        ),
+                        ZIP_MIN_DATE_TIME,
+                    ),
+                )
+                file_info.compress_type = ZIP_DEFLATED
+                file_info.external_attr = (stat.S_IFREG | mode) << 16
+                file_info.file_size = size
+                with zip_file.open(file_info, 'w') as archive_file:
+                    shutil.copyfileobj(
+                        source, archive_file, OBJECTS_CHUNK_SIZE
+                    )
+
+            yield add_zip_file
+    else:
+        import tarfile
+
+        with tarfile.open(fileobj=destination, mode='w|gz') as tar_file:
+
+            def add_tar_file(
+                name: str,
+                source: IO[bytes],
+                /,
+                *,
+                size: int,
+                mode: int,
+                mtime: float,
+            ) -> None:
+                file_info = tarfile.TarInfo(name)
+                file_info.mode = mode
+                file_info.mtime = int(mtime)
+                file_info.size = size
+                tar_file.addfile(file_info, source)
+
+            yield add_tar_file
+
+
+def to_archive_format(path: str) -> ArchiveFormat:
+    return 'zip' if path.endswith('.zip') else 'tar.gz'
+
+
+def plan_template_files(
+    template_dir: str,
+    *,
+    destination: str,
+    renderer: Callable[[str], str],
+    manifest: dict[str, Any] | None,
+) -> list[tuple[str, str, FileKind | None]]:
+    if (
+        manifest is None
+        or manifest.get('version') != TEMPLATE_MANIFEST_VERSION
+    ):
+        return [
+            (file_path, new_file_path, None)
+            for file_path, new_file_path in replace_files_paths(
+                files_paths(template_dir),
+                source_path=template_dir,
+                destination=destination,
+                renderer=renderer,
+            )
+        ]
+    rendered_paths_parts: dict[str, str] = {}
+
+    def render_path_part(path_part: str) -> str:
+        try:
+            return rendered_paths_parts[path_part]
+        except KeyError:
+            result = rendered_paths_parts[path_part] = renderer(path_part)
+            return result
+
+    result: list[tuple[str, str, FileKind | None]] = []
+    for file_info in manifest['files']:
+        path_parts = file_info['path'].split('/')
+        templated_parts_indices = set(file_info['templated_parts'])
+        result.append(
+            (
+                os.path.join(template_dir, *path_parts),
+                os.path.join(
+                    destination,
+                    *[
+                        render_path_part(path_part)
+                        if index in templated_parts_indices
+                        else path_part
+                        for index, path_part in enumerate(path_parts)
+                    ],
+                ),
+                to_file_kind(file_info),
+            )
+        )
+    return result
+
+
+def to_file_kind(file_info: dict[str, Any]) -> FileKind:
+    return (
+        'binary'
+        if file_info['binary']
+        else 'template'
+        if file_info['templated']
+        else 'plain'
+    )
+
+
+def to_template_file_classification(
+    path: str, kind: FileKind
+) -> dict[str, Any]:
+    return {
+        'binary': kind == 'binary',
+        'templated': kind == 'template',
+        'templated_parts': [
+            index
+            for index, path_part in enumerate(path.split('/'))
+            if has_template_syntax(path_part)
+        ],
+    }
+
+
+class ContentsClassifier:
+    def __init__(self) -> None:
+        self._head = b''
+        self._tail = b''
+        self._templated = False
+
+    def update(self, chunk: bytes) -> None:
+        if len(self._head) < BINARY_FILE_HEAD_SIZE:
+            self._head += chunk[: BINARY_FILE_HEAD_SIZE - len(self._head)]
+        if not self._templated:
+            # markers can be split between chunks
+            self._templated = has_template_syntax(
+                self._tail + chunk[:1]
+            ) or has_template_syntax(chunk)
+            self._tail = chunk[-1:]
+
+    def to_kind(self) -> FileKind:
+        if is_binary_string(self._head):
+            return 'binary'
+        return 'template' if self._templated else 'plain'
+
+
+def to_generation_key(*, link_mode: LinkMode) -> str:
+    from jinja2 import __version__ as jinja2_version
+
+    return hashlib.sha1(
+        json.dumps(
+            {
+                'monty': __version__,
+                'jinja2': jinja2_version,
+                'link_mode': link_mode,
+            },
+            sort_keys=True,
+        ).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+
+
+def to_settings_digest(settings: dict[str, str]) -> str:
+    return hashlib.sha1(
+        json.dumps(settings, sort_keys=True).encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+def load_output_files_infos(
+    manifest_path: str, generation_key: str
+) -> dict[str, Any]:
+    manifest = load_json_object(manifest_path)
+    if (
+        manifest is None
+        or manifest.get('key') != generation_key
+        or not isinstance(manifest.get('files'), dict)
+    ):
+        return {}
+    return cast(dict[str, Any], manifest['files'])
+
+
+def to_template_files_digests(
+    manifest: dict[str, Any] | None,
+) -> dict[str, str]:
+    if manifest is None:
+        return {}
+    return {
+        file_info['path']: f'{file_info["object"]}-{file_info["mode"]:o}'
+        for file_info in manifest['files']
+    }
+
+
+def to_file_digest(path: str) -> str:
+    digest = hashlib.sha1(usedforsecurity=False)
+    with open(path, 'rb') as file:
+        mode = to_object_mode(os.fstat(file.fileno()).st_mode)
+        for chunk in iter(partial(file.read, OBJECTS_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return f'{digest.hexdigest()}-{mode:o}'
+
+
+def to_output_file_info(path: str) -> dict[str, int]:
+    file_stat = os.stat(path)
+    return {'size': file_stat.st_size, 'mtime_ns': file_stat.st_mtime_ns}
+
+
+def is_output_file_up_to_date(
+    path: str, file_info: dict[str, Any] | None, source_digest: str
+) -> bool:
+    if file_info is None or file_info.get('source') != source_digest:
+        return False
+    try:
+        output_file_info = to_output_file_info(path)
+    except OSError:
+        return False
+    return all(
+        file_info.get(key) == value for key, value in output_file_info.items()
+    )
+
+
+def render_file_with(
+    source_path: str,
+    destination_path: str,
+    name: str,
+    kind: FileKind | None = None,
+    *,
+    renderer: Callable[..., str],
+    link_mode: LinkMode,
+    template_archive: TemplateArchive | None = None,
+) -> None:
+    if template_archive is None:
+        render_file(
+            source_path,
+            destination_path,
+            renderer=partial(renderer, name=name),
+            link_mode=link_mode,
+            kind=kind,
+        )
+    else:
+        render_archive_file(
+            template_archive,
+            name,
+            destination_path,
+            renderer=partial(renderer, name=name),
+            kind=kind,
+        )
+
+
+_rendering_worker_state: (
+    tuple[Callable[..., str], LinkMode, TemplateArchive | None] | None
+) = None
+
+
+def initialize_rendering_worker(
+    settings: dict[str, str],
+    bytecode_cache_directory: str | None,
+    link_mode: LinkMode,
+    template_archive_path: str | None = None,
+) -> None:
+    global _rendering_worker_state
+    _rendering_worker_state = (
+        partial(
+            render,
+            settings=settings,
+            environment=TemplatesEnvironment(
+                bytecode_cache_directory=bytecode_cache_directory
+            ),
+        ),
+        link_mode,
+        (
+            None
+            if template_archive_path is None
+            else TemplateArchive(template_archive_path)
+        ),
+    )
+
+
+def render_file_in_worker(
+    source_path: str,
+    destination_path: str,
+    name: str,
+    kind: FileKind | None = None,
+) -> None:
+    assert _rendering_worker_state is not None, (
+        'Rendering worker should be initialized.'
+    )
+    renderer, link_mode, template_archive = _rendering_worker_state
+    render_file_with(
+        source_path,
+        destination_path,
+        name,
+        kind,
+        renderer=renderer,
+        link_mode=link_mode,
+        template_archive=template_archive,
+    )
+
+
+def load_manifest(path: str) -> list[ProjectSpecification]:
+    from strictyaml import Map, Optional as OptionalKey, Seq, load
+
+    types = load_schema_types()
+    manifest_schema = Seq(
+        Map(
+            {
+                'settings_path': types.NonEmptySingleLineStr(),
+                OptionalKey('template_repo'): types.NonEmptySingleLineStr(),
+                OptionalKey('output_dir'): types.NonEmptySingleLineStr(),
+            }
+        )
+    )
+    entries = load(
+        Path(path).read_text(encoding='utf-8'), schema=manifest_schema
+    ).data
+    assert isinstance(entries, list), entries
+    return [
+        ProjectSpecification(
+            settings_path=entry['settings_path'],
+            template_repo=entry.get('template_repo', ''),
+            output_dir=entry.get('output_dir'),
+        )
+        for entry in entries
+    ]
+
+
+def sync_template(
+    templates_path: str,
+    repository_path: str,
+    github_access_token: str | None,
+    *,
+    offline: bool = False,
+    ttl: float = 0,
+    cache_size: int | None = TEMPLATES_CACHE_DEFAULT_SIZE,
+    backend: TemplatesBackend = 'tree',
+    incremental: bool = False,
+    exit_stack: ExitStack | None = None,
+) -> str:
+    if not is_template_repository_name(repository_path):
+        raise ValueError(
+            f'Invalid template repository: {repository_path!r}, '
+            'should be in "owner/name" format.'
+        )
+    with profile_span('sync_template', repository=repository_path):
+        template_dir = _lock_template(
+            templates_path,
+            repository_path,
+            github_access_token,
+            offline=offline,
+            ttl=ttl,
+            backend=backend,
+            incremental=incremental,
+            exit_stack=exit_stack,
+        )
+        if cache_size is not None:
+            with profile_span('prune_templates'):
+                prune_templates(
+                    templates_path, max_size=cache_size, keep=[template_dir]
+                )
+    return template_dir
+
+
+def _lock_template(
+    templates_path: str,
+    repository_path: str,
+    github_access_token: str | None,
+    *,
+    offline: bool,
+    ttl: float,
+    backend: TemplatesBackend,
+    incremental: bool,
+    exit_stack: ExitStack | None,
+) -> str:
+    # single-flights downloads of parallel processes
+    repository_lock_path = os.path.join(
+        templates_path, repository_path, TEMPLATE_LOCK_FILE_NAME
+    )
+    while True:
+        with ExitStack() as version_stack:
+            with lock_file(repository_lock_path):
+                template_dir = _sync_template(
+                    templates_path,
+                    repository_path,
+                    github_access_token,
+                    offline=offline,
+                    ttl=ttl,
+                    backend=backend,
+                    incremental=incremental,
+                )
+                version_stack.enter_context(
+                    lock_template_version(template_dir)
+                )
+                if not has_template_version(template_dir):
+                    # retired by other process before it was locked
+                    continue
+                upgrade_template_manifest(template_dir)
+                touch_template_version(template_dir)
+            if exit_stack is not None:
+                exit_stack.push(version_stack.pop_all())
+            return template_dir
+
+
+def _sync_template(
+    templates_path: str,
+    repository_path: str,
+    github_access_token: str | None,
+    *,
+    offline: bool,
+    ttl: float,
+    backend: TemplatesBackend,
+    incremental: bool,
+) -> str:
+    base_template_dir = os.path.join(templates_path, repository_path)
+    cached_timestamps = load_template_timestamps(base_template_dir)
+    if offline:
+        if not cached_timestamps:
+            raise ValueError(
+                f'No cached versions of template {repository_path!r} '
+                f'found in {templates_path!r}.'
+            )
+        return os.path.join(base_template_dir, str(cached_timestamps[-1]))
+    commits_info_path = os.path.join(
+        base_template_dir, TEMPLATE_COMMITS_INFO_FILE_NAME
+    )
+    commits_info = load_json_object(commits_info_path)
+    if commits_info is not None and not (
+        commits_info.keys() >= TEMPLATE_COMMITS_INFO_KEYS
+    ):
+        commits_info = None
+    if (
+        commits_info is not None
+        and commits_info['timestamp'] in cached_timestamps
+        and time.time() - commits_info['fetched_at'] < ttl
+    ):
+        return os.path.join(base_template_dir, str(commits_info['timestamp']))
+    headers = _to_github_headers(github_access_token) or {}
+    if commits_info is not None:
+        if commits_info['etag'] is not None:
+            headers['If-None-Match'] = commits_info['etag']
+        if commits_info['last_modified'] is not None:
+            headers['If-Modified-Since'] = commits_info['last_modified']
+    latest_commit_info_response = http_client().get(
+        GITHUB_API_ENDPOINT + f'/repos/{repository_path}/commits?per_page=1',
+        headers=headers,
+    )
+    if (
+        commits_info is not None
+        and latest_commit_info_response.status_code == HTTPStatus.NOT_MODIFIED
+    ):
+        latest_commit_timestamp = commits_info['timestamp']
+        latest_commit_sha = commits_info.get('sha')
+    else:
+        latest_commit_info_response.raise_for_status()
+        latest_commits_info = latest_commit_info_response.json()
+        (latest_commit_info,) = latest_commits_info
+        latest_commit_sha = latest_commit_info['sha']
+        latest_commit_datetime_string = latest_commit_info['commit'][
+            'committer'
+        ]['date']
+        latest_commit_timestamp = calendar.timegm(
+            datetime.strptime(
+                latest_commit_datetime_string, '%Y-%m-%dT%H:%M:%SZ'
+            ).utctimetuple()
+        )
+    os.makedirs(base_template_dir, exist_ok=True)
+    template_dir = os.path.join(
+        base_template_dir, str(latest_commit_timestamp)
+    )
+    objects_path = os.path.join(
+        templates_path, TEMPLATES_OBJECTS_DIRECTORY_NAME
+    )
+    if latest_commit_timestamp not in cached_timestamps and not (
+        incremental
+        and backend == 'tree'
+        and latest_commit_sha is not None
+        and cached_timestamps
+        and load_template_delta(
+            repository_path,
+            template_dir,
+            commit_sha=latest_commit_sha,
+            previous_template_path=os.path.join(
+                base_template_dir, str(cached_timestamps[-1])
+            ),
+            objects_path=objects_path,
+            github_access_token=github_access_token,
+        )
+    ):
+        load_github_repository(
+            repository_path,
+            template_dir,
+            objects_path=objects_path,
+            extract=backend == 'tree',
+        )
+    save_json_object(
+        commits_info_path,
+        {
+            'etag': latest_commit_info_response.headers.get('ETag'),
+            'last_modified': latest_commit_info_response.headers.get(
+                'Last-Modified'
+            ),
+            'sha': latest_commit_sha,
+            'timestamp': latest_commit_timestamp,
+            'fetched_at': time.time(),
+        },
+    )
+    return template_dir
+
+
+def load_template_timestamps(base_template_path: str) -> list[int]:
+    try:
+        names = os.listdir(base_template_path)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        {
+            int(name)
+            for name in names
+            if (
+                name.isdigit()
+                and os.path.isdir(os.path.join(base_template_path, name))
+            )
+        }
+        | {
+            int(name.removesuffix('.zip'))
+            for name in names
+            if name.endswith('.zip') and name.removesuffix('.zip').isdigit()
+        }
+    )
+
+
+def load_json_object(path: str) -> dict[str, Any] | None:
+    try:
+        result = json.loads(Path(path).read_bytes())
+    except (OSError, ValueError):
+        return None
+    return result if isinstance(result, dict) else None
+
+
+def save_json_object(path: str, value: dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    Path(temporary_path).write_text(json.dumps(value), encoding='utf-8')
+    os.replace(temporary_path, path)
+
+
+def to_object_path(objects_path: str, object_id: str, mode: int) -> str:
+    return os.path.join(
+        objects_path, object_id[:2], f'{object_id[2:]}-{mode:o}'
+    )
+
+
+def to_object_mode(mode: int) -> int:
+    return 0o755 if mode & 0o111 else 0o644
+
+
+def store_object(
+    objects_path: str,
+    source: IO[bytes],
+    *,
+    size: int,
+    mode: int,
+    classifier: ContentsClassifier | None = None,
+) -> str:
+    os.makedirs(objects_path, exist_ok=True)
+    import tempfile
 
-import click
-import httpx
-from jinja2 import StrictUndefined, Template
-from strictyaml import (  # type: ignore[import-untyped]
-    Map,
-    MapPattern,
-    Optional as OptionalKey,
-    Regex,
-    Str,
-    load,
-)
-from strictyaml.yamllocation import YAMLChunk  # type: ignore[import-untyped]
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        suffix='.tmp', dir=objects_path
+    )
+    try:
+        with open(file_descriptor, 'wb') as temporary_file:
+            result = hash_object(
+                source,
+                size=size,
+                classifier=classifier,
+                sink=temporary_file.write,
+            )
+        object_path = to_object_path(objects_path, result, mode)
+        if os.path.exists(object_path):
+            os.unlink(temporary_path)
+        else:
+            os.chmod(temporary_path, mode)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(temporary_path, object_path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(temporary_path)
+        raise
+    return result
 
-import monty
 
-__version__ = '3.0.0'
+def hash_object(
+    source: IO[bytes],
+    *,
+    size: int,
+    classifier: ContentsClassifier | None = None,
+    sink: Callable[[bytes], Any] | None = None,
+) -> str:
+    digest = hashlib.sha1(b'blob %d\0' % size, usedforsecurity=False)
+    for chunk in iter(partial(source.read, OBJECTS_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        if classifier is not None:
+            classifier.update(chunk)
+        if sink is not None:
+            sink(chunk)
+    return digest.hexdigest()
 
 
-FULL_NAME_KEY = 'full_name'
-GITHUB_API_ENDPOINT = 'https://api.github.com'
-TROVE_LICENSE_CLASSIFIER_KEY = 'trove_license_classifier'
-TROVE_CLASSIFIER_SEPARATOR = ' :: '
-VERSION_PATTERN = r'\d+\.\d+(\.\d+)?(-(alpha|beta))?'
+def materialize_template_version(
+    objects_path: str, manifest: dict[str, Any], destination_path: str
+) -> None:
+    temporary_destination_path = (
+        f'{destination_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    )
+    shutil.rmtree(temporary_destination_path, ignore_errors=True)
+    for file_info in manifest['files']:
+        file_path = os.path.join(
+            temporary_destination_path, *file_info['path'].split('/')
+        )
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        object_path = to_object_path(
+            objects_path, file_info['object'], file_info['mode']
+        )
+        try:
+            os.link(object_path, file_path)
+        except OSError:
+            shutil.copyfile(object_path, file_path)
+            os.chmod(file_path, file_info['mode'])
+    shutil.rmtree(destination_path, ignore_errors=True)
+    os.replace(temporary_destination_path, destination_path)
 
 
-class NonEmptySingleLineStr(Str):  # type: ignore[misc]
-    def validate_scalar(self, chunk: YAMLChunk) -> str:
-        contents = (
-            chunk.contents
-            if isinstance(chunk.contents, str)
-            else chunk.contents.value
-        )
-        if not contents:
-            chunk.expecting_but_found(
-                'when expecting non-empty string', contents
-            )
-        elif len(contents.splitlines()) > 1:
-            chunk.expecting_but_found(
-                'when expecting single-line string', contents
-            )
-        return contents
+def to_template_manifest_path(template_path: str) -> str:
+    return template_path + '.json'
+
 
+def load_template_manifest(template_path: str) -> dict[str, Any] | None:
+    result = load_json_object(to_template_manifest_path(template_path))
+    return (
+        result
+        if result is not None and isinstance(result.get('files'), list)
+        else None
+    )
 
-class SpdxLicenseIdentifier(Str):  # type: ignore[misc]
-    def __init__(self, identifiers: Container[str]) -> None:
-        self.identifiers = identifiers
 
-    def validate_scalar(self, chunk: YAMLChunk) -> str:
-        contents = chunk.contents
-        assert isinstance(contents, str), contents
-        if contents not in self.identifiers:
-            chunk.expecting_but_found(
-                'when expecting SPDX license identifier', contents
+def upgrade_template_manifest(template_path: str) -> None:
+    manifest = load_template_manifest(template_path)
+    if (
+        manifest is None
+        or manifest.get('version') == TEMPLATE_MANIFEST_VERSION
+    ):
+        return
+    for file_info in manifest['files']:
+        file_info.update(
+            to_template_file_classification(
+                file_info['path'],
+                classify_file(
+                    os.path.join(template_path, *file_info['path'].split('/'))
+                ),
             )
-        return contents
+        )
+    manifest['version'] = TEMPLATE_MANIFEST_VERSION
+    save_json_object(to_template_manifest_path(template_path), manifest)
 
 
-class TroveLicenseClassifier(Str):  # type: ignore[misc]
-    def __init__(self, identifiers: Container[str]) -> None:
-        self.classifiers = identifiers
+def classify_file(path: str) -> FileKind:
+    classifier = ContentsClassifier()
+    with open(path, 'rb') as file:
+        for chunk in iter(partial(file.read, OBJECTS_CHUNK_SIZE), b''):
+            classifier.update(chunk)
+    return classifier.to_kind()
 
-    def validate_scalar(self, chunk: YAMLChunk) -> str:
-        contents = chunk.contents
-        assert isinstance(contents, str), contents
-        if contents not in self.classifiers:
-            chunk.expecting_but_found(
-                'when expecting license Trove classifier', contents
-            )
-        return contents
 
+def touch_template_version(template_path: str) -> None:
+    manifest_path = to_template_manifest_path(template_path)
+    os.utime(manifest_path if os.path.exists(manifest_path) else template_path)
 
-OVERWRITE_FLAG_NAME = '--overwrite'
 
+def has_template_version(template_path: str) -> bool:
+    return os.path.isdir(template_path) or os.path.isfile(
+        to_template_archive_path(template_path)
+    )
 
-@click.command()
-@click.option(
-    '--version',
-    '-v',
-    is_flag=True,
-    help='Displays script version information and exits.',
-)
-@click.option(
-    '--settings-path',
-    '-s',
-    default='settings.yml',
-    help='Path (absolute or relative) to settings.',
-)
-@click.option(
-    '--templates-dir',
-    default='.templates',
-    help='Path (absolute or relative) to templates.',
-)
-@click.option(
-    '--output-dir',
-    '-o',
-    default=None,
-    help='Path (absolute or relative) to output directory '
-    '(defaults to current working directory).',
-)
-@click.option(
-    OVERWRITE_FLAG_NAME,
-    is_flag=True,
-    help='Overwrites files if output directory exists.',
-)
-@click.option(
-    '--github-access-token',
-    '-g',
-    envvar='GITHUB_ACCESS_TOKEN',
-    default=None,
-    help='Personal access token that can be used to access the GitHub API.',
-)
-@click.argument('template-repo')
-def main(
-    *,
-    version: bool,
-    settings_path: str,
-    templates_dir: str,
-    output_dir: str | None,
-    overwrite: bool,
-    github_access_token: str | None,
-    template_repo: str,
-) -> None:
-    """Generates project from template."""
-    if version:
-        sys.stdout.write(__version__)
+
+def to_template_lock_path(template_path: str) -> str:
+    return template_path + '.lock'
+
+
+def lock_template_version(template_path: str) -> AbstractContextManager[bool]:
+    return lock_file(to_template_lock_path(template_path), shared=True)
+
+
+@contextmanager
+def lock_file(
+    path: str, *, shared: bool = False, blocking: bool = True
+) -> Iterator[bool]:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a+b') as file:
+        region = to_file_lock_region(shared=shared)
+        locked = acquire_file_lock(
+            file, region, shared=shared, blocking=blocking
+        )
+        try:
+            yield locked
+        finally:
+            if locked:
+                release_file_lock(file, region)
+
+
+FILE_LOCK_POLLING_INTERVAL: Final[float] = 0.1
+FILE_LOCK_REGION_SIZE: Final[int] = 1 << 30
+
+
+def to_file_lock_region(*, shared: bool) -> tuple[int, int]:
+    if not shared:
+        return 0, FILE_LOCK_REGION_SIZE
+    import random
+
+    # without shared locks support readers lock distinct bytes,
+    # so exclusive lock of the whole region conflicts with any of them
+    return random.randrange(FILE_LOCK_REGION_SIZE), 1
+
+
+def acquire_file_lock(
+    file: IO[bytes], region: tuple[int, int], *, shared: bool, blocking: bool
+) -> bool:
+    if sys.platform == 'win32':
+        import msvcrt
+
+        offset, size = region
+        while True:
+            file.seek(offset)
+            try:
+                msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, size)
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(FILE_LOCK_POLLING_INTERVAL)
+            else:
+                return True
+    import fcntl
+
+    try:
+        fcntl.flock(
+            file.fileno(),
+            (fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            | (0 if blocking else fcntl.LOCK_NB),
+        )
+    except BlockingIOError:
+        return False
+    return True
+
+
+def release_file_lock(file: IO[bytes], region: tuple[int, int]) -> None:
+    if sys.platform == 'win32':
+        import msvcrt
+
+        offset, size = region
+        file.seek(offset)
+        msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, size)
         return
-    templates_dir = os.path.normpath(templates_dir)
-    template_dir = sync_template(
-        templates_dir, template_repo, github_access_token
-    )
-    settings = load_settings(settings_path, github_access_token)
-    if output_dir is None:
-        output_dir = settings['project']
-    output_dir = os.path.normpath(output_dir)
-    os.makedirs(output_dir, exist_ok=True)
-    non_binary_files_paths = filterfalse(
-        is_binary_file, files_paths(template_dir)
-    )
-    renderer = cast(Callable[[str], str], partial(render, settings=settings))
-    paths_pairs = replace_files_paths(
-        non_binary_files_paths,
-        source_path=template_dir,
-        destination=output_dir,
-        renderer=renderer,
-    )
-    for file_path, new_file_path in paths_pairs:
-        if not overwrite and os.path.exists(new_file_path):
-            raise click.BadOptionUsage(
-                'overwrite',
-                f'Trying to overwrite {new_file_path!r}, '
-                f'but no {OVERWRITE_FLAG_NAME!r} flag was set.',
+    import fcntl
+
+    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class TemplateVersion(NamedTuple):
+    path: str
+    last_used: float
+    objects: dict[str, int]
+    size: int
+
+
+def load_templates_versions(templates_path: str) -> list[TemplateVersion]:
+    result = []
+    for template_path in glob.glob(
+        os.path.join(glob.escape(templates_path), '*', '*', '[0-9]*')
+    ):
+        template_path = template_path.removesuffix('.zip')
+        if not os.path.basename(template_path).isdigit():
+            continue
+        try:
+            version = load_template_version(template_path)
+        except FileNotFoundError:
+            # retired by other process while scanning
+            continue
+        if version is not None:
+            result.append(version)
+    return result
+
+
+def load_template_version(template_path: str) -> TemplateVersion | None:
+    template_archive_path = to_template_archive_path(template_path)
+    if os.path.isfile(template_archive_path):
+        # archived versions do not reference objects
+        return TemplateVersion(
+            template_path,
+            os.path.getmtime(to_template_manifest_path(template_path)),
+            {},
+            os.path.getsize(template_archive_path),
+        )
+    if not os.path.isdir(template_path):
+        return None
+    manifest = load_template_manifest(template_path)
+    if manifest is None:
+        return TemplateVersion(
+            template_path,
+            os.path.getmtime(template_path),
+            {},
+            sum(
+                os.path.getsize(file_path)
+                for file_path in files_paths(template_path)
+            ),
+        )
+    return TemplateVersion(
+        template_path,
+        os.path.getmtime(to_template_manifest_path(template_path)),
+        {
+            to_object_path('', file_info['object'], file_info['mode']): (
+                file_info['size']
             )
-        render_file(file_path, new_file_path, renderer=renderer)
+            for file_info in manifest['files']
+        },
+        0,
+    )
 
 
-def sync_template(
-    templates_path: str, repository_path: str, github_access_token: str | None
-) -> str:
-    base_template_dir = os.path.join(templates_path, repository_path)
-    latest_commit_info_response = httpx.get(
-        GITHUB_API_ENDPOINT + f'/repos/{repository_path}/commits?per_page=1',
-        headers=_to_github_headers(github_access_token),
+def prune_templates(
+    templates_path: str, *, max_size: int, keep: Iterable[str] = ()
+) -> list[str]:
+    kept_paths = {os.path.normpath(path) for path in keep}
+    versions = sorted(
+        load_templates_versions(templates_path), key=attrgetter('last_used')
     )
-    latest_commit_info_response.raise_for_status()
-    latest_commits_info = latest_commit_info_response.json()
-    (latest_commit_info,) = latest_commits_info
-    latest_commit_datetime_string = latest_commit_info['commit']['committer'][
-        'date'
-    ]
-    latest_commit_timestamp = calendar.timegm(
-        datetime.strptime(
-            latest_commit_datetime_string, '%Y-%m-%dT%H:%M:%SZ'
-        ).utctimetuple()
+    objects_references = Counter(
+        object_path for version in versions for object_path in version.objects
     )
-    os.makedirs(base_template_dir, exist_ok=True)
-    template_dir = os.path.join(
-        base_template_dir, str(latest_commit_timestamp)
+    objects_sizes = {
+        object_path: object_size
+        for version in versions
+        for object_path, object_size in version.objects.items()
+    }
+    total_size = sum(objects_sizes.values()) + sum(
+        version.size for version in versions
     )
-    try:
-        (previous_timestamp_string,) = os.listdir(base_template_dir)
-    except ValueError:
-        load_github_repository(repository_path, template_dir)
-    else:
-        previous_timestamp = int(previous_timestamp_string)
-        if previous_timestamp < latest_commit_timestamp:
-            shutil.rmtree(
-                os.path.join(base_template_dir, previous_timestamp_string)
+    result = []
+    for version in versions:
+        if total_size <= max_size:
+            break
+        if os.path.normpath(version.path) in kept_paths:
+            continue
+        with ExitStack() as locks_stack:
+            # skips versions which are synced or read by other processes
+            if not (
+                locks_stack.enter_context(
+                    lock_file(
+                        os.path.join(
+                            os.path.dirname(version.path),
+                            TEMPLATE_LOCK_FILE_NAME,
+                        ),
+                        blocking=False,
+                    )
+                )
+                and locks_stack.enter_context(
+                    lock_file(
+                        to_template_lock_path(version.path), blocking=False
+                    )
+                )
+            ):
+                continue
+            retire_template_version(templates_path, version.path)
+        total_size -= version.size
+        for object_path in version.objects:
+            objects_references[object_path] -= 1
+            if not objects_references[object_path]:
+                total_size -= objects_sizes[object_path]
+        result.append(version.path)
+    objects_path = os.path.join(
+        templates_path, TEMPLATES_OBJECTS_DIRECTORY_NAME
+    )
+    with lock_file(
+        to_objects_lock_path(objects_path), blocking=False
+    ) as objects_locked:
+        if objects_locked:
+            # references are reloaded to include versions
+            # extracted by other processes in the meantime
+            collect_objects_garbage(
+                objects_path,
+                {
+                    object_path
+                    for version in load_templates_versions(templates_path)
+                    for object_path in version.objects
+                },
             )
-            load_github_repository(repository_path, template_dir)
-    return template_dir
+    return result
+
+
+def retire_template_version(templates_path: str, template_path: str) -> None:
+    # manifest is removed last, so scanning processes never walk
+    # a partially removed tree as a version without manifest
+    with suppress(FileNotFoundError):
+        os.unlink(to_template_archive_path(template_path))
+    shutil.rmtree(template_path, ignore_errors=True)
+    with suppress(FileNotFoundError):
+        os.unlink(to_template_manifest_path(template_path))
+    shutil.rmtree(
+        to_template_bytecode_directory_path(templates_path, template_path),
+        ignore_errors=True,
+    )
+    with suppress(OSError):
+        os.unlink(to_template_lock_path(template_path))
+
+
+def to_objects_lock_path(objects_path: str) -> str:
+    return objects_path + '.lock'
+
+
+def collect_objects_garbage(
+    objects_path: str, referenced_objects_paths: Container[str]
+) -> None:
+    for object_path in files_paths(objects_path):
+        relative_object_path = os.path.relpath(object_path, objects_path)
+        if relative_object_path not in referenced_objects_paths:
+            os.unlink(object_path)
+            with suppress(OSError):
+                os.rmdir(os.path.dirname(object_path))
+
+
+def load_templates_cache_statistics(templates_path: str) -> dict[str, int]:
+    versions = load_templates_versions(templates_path)
+    objects_sizes = [
+        os.path.getsize(object_path)
+        for object_path in files_paths(
+            os.path.join(templates_path, TEMPLATES_OBJECTS_DIRECTORY_NAME)
+        )
+    ]
+    return {
+        'versions': len(versions),
+        'objects': len(objects_sizes),
+        'size': sum(objects_sizes) + sum(version.size for version in versions),
+        'logical_size': sum(
+            sum(version.objects.values()) + version.size
+            for version in versions
+        ),
+    }
 
 
 def load_settings(
-    settings_path: str, github_access_token: str | None
+    settings_path: str,
+    github_access_token: str | None,
+    *,
+    spdx_licenses_info: dict[str, Any] | None = None,
+    trove_licenses_classifiers: list[str] | None = None,
+    trove_licenses_index: dict[str, list[str]] | None = None,
+    user_full_name_loader: Callable[[str, str], str] | None = None,
 ) -> dict[str, str]:
-    spdx_licenses_info = load_spdx_licenses_info()
-    trove_licenses_classifiers = load_trove_licenses_classifiers()
+    if spdx_licenses_info is None:
+        spdx_licenses_info = load_spdx_licenses_info()
+    if trove_licenses_classifiers is None:
+        trove_licenses_classifiers = load_trove_licenses_classifiers()
+    if trove_licenses_index is None:
+        trove_licenses_index = build_trove_licenses_index(
+            spdx_licenses_info, trove_licenses_classifiers
+        )
+    from strictyaml import (
+        Map,
+        MapPattern,
+        Optional as OptionalKey,
+        Regex,
+        load,
+    )
+
+    types = load_schema_types()
     settings_schema = Map(
         {
-            'description': NonEmptySingleLineStr(),
-            'dockerhub_login': NonEmptySingleLineStr(),
-            'email': NonEmptySingleLineStr(),
-            'github_login': NonEmptySingleLineStr(),
+            'description': types.NonEmptySingleLineStr(),
+            'dockerhub_login': types.NonEmptySingleLineStr(),
+            'email': types.NonEmptySingleLineStr(),
+            'github_login': types.NonEmptySingleLineStr(),
             'project': Regex(r'\w+([\.-]\w+)*'),
-            'spdx_license_identifier': SpdxLicenseIdentifier(
+            'spdx_license_identifier': types.SpdxLicenseIdentifier(
                 spdx_licenses_info.keys()
             ),
             'version': Regex(VERSION_PATTERN),
-            OptionalKey(FULL_NAME_KEY): NonEmptySingleLineStr(),
+            OptionalKey(FULL_NAME_KEY): types.NonEmptySingleLineStr(),
             OptionalKey('max_version_of'): MapPattern(
-                NonEmptySingleLineStr(), Regex(VERSION_PATTERN)
+                types.NonEmptySingleLineStr(), Regex(VERSION_PATTERN)
             ),
             OptionalKey('min_version_of'): MapPattern(
-                NonEmptySingleLineStr(), Regex(VERSION_PATTERN)
-            ),
-            OptionalKey(TROVE_LICENSE_CLASSIFIER_KEY): TroveLicenseClassifier(
-                trove_licenses_classifiers
+                types.NonEmptySingleLineStr(), Regex(VERSION_PATTERN)
             ),
+            OptionalKey(
+                TROVE_LICENSE_CLASSIFIER_KEY
+            ): types.TroveLicenseClassifier(trove_licenses_classifiers),
         }
     )
-    settings = load(
-        Path(settings_path).read_text(encoding='utf-8'), schema=settings_schema
-    ).data
+    with profile_span('parse_settings'):
+        settings = load(
+            Path(settings_path).read_text(encoding='utf-8'),
+            schema=settings_schema,
+        ).data
     assert isinstance(settings, dict), settings
     spdx_license_info = spdx_licenses_info[settings['spdx_license_identifier']]
     spdx_license_name = spdx_license_info['name']
@@ -252,34 +2839,9 @@ def load_settings(
         )
     settings['spdx_license_name'] = spdx_license_name
     if TROVE_LICENSE_CLASSIFIER_KEY not in settings:
-        osi_approved = spdx_license_info['osi_approved']
-        candidates = [
-            classifier
-            for classifier in trove_licenses_classifiers
-            if (
-                (
-                    spdx_license_name
-                    in classifier.rsplit(
-                        TROVE_CLASSIFIER_SEPARATOR, maxsplit=1
-                    )[1]
-                )
-                and (
-                    (
-                        classifier.split(
-                            TROVE_CLASSIFIER_SEPARATOR, maxsplit=2
-                        )[1]
-                        == 'OSI Approved'
-                    )
-                    if osi_approved
-                    else (
-                        classifier.split(
-                            TROVE_CLASSIFIER_SEPARATOR, maxsplit=2
-                        )[1]
-                        != 'OSI Approved'
-                    )
-                )
-            )
-        ]
+        candidates = trove_licenses_index.get(
+            settings['spdx_license_identifier'], []
+        )
         try:
             (trove_license_classifier,) = candidates
         except ValueError:
@@ -306,28 +2868,123 @@ def load_settings(
     dockerhub_login = settings['dockerhub_login']
     github_login = settings['github_login']
     if FULL_NAME_KEY not in settings:
-        settings[FULL_NAME_KEY] = (
-            load_github_user(github_login, access_token=github_access_token)[
-                'name'
-            ]
-            or load_dockerhub_user(dockerhub_login)['full_name']
-        )
+        with profile_span('load_user_full_name'):
+            settings[FULL_NAME_KEY] = (
+                partial(
+                    load_user_full_name,
+                    github_access_token=github_access_token,
+                )
+                if user_full_name_loader is None
+                else user_full_name_loader
+            )(github_login, dockerhub_login)
     return settings
 
 
+def load_user_full_name(
+    github_login: str,
+    dockerhub_login: str,
+    *,
+    github_access_token: str | None,
+    ttl: float = USERS_CACHE_TTL,
+    offline: bool = False,
+) -> str:
+    from concurrent.futures import ThreadPoolExecutor
+
+    # speculative DockerHub request is waited for on exit
+    # to not leave threads holding HTTP client locks behind
+    # for the process pool forked later on
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        dockerhub_user_future = executor.submit(
+            load_dockerhub_user, dockerhub_login, ttl=ttl, offline=offline
+        )
+        result = load_github_user(
+            github_login,
+            access_token=github_access_token,
+            ttl=ttl,
+            offline=offline,
+        )['name']
+        if not result:
+            result = dockerhub_user_future.result()['full_name']
+    assert isinstance(result, str), result
+    return result
+
+
+def load_settings_logins(settings_path: str) -> tuple[str, str] | None:
+    from strictyaml import YAMLError, load
+
+    try:
+        settings = load(Path(settings_path).read_text(encoding='utf-8')).data
+    except (OSError, ValueError, YAMLError):
+        return None
+    if not isinstance(settings, dict) or FULL_NAME_KEY in settings:
+        return None
+    github_login = settings.get('github_login')
+    dockerhub_login = settings.get('dockerhub_login')
+    if not (
+        isinstance(github_login, str) and isinstance(dockerhub_login, str)
+    ):
+        return None
+    return github_login, dockerhub_login
+
+
+def prefetch_user_full_name(
+    settings_path: str,
+    *,
+    github_access_token: str | None,
+    ttl: float,
+    offline: bool,
+) -> tuple[tuple[str, str], str] | None:
+    logins = load_settings_logins(settings_path)
+    if logins is None:
+        return None
+    return logins, load_user_full_name(
+        *logins,
+        github_access_token=github_access_token,
+        ttl=ttl,
+        offline=offline,
+    )
+
+
+def load_prefetched_user_full_name(
+    prefetched: Future[tuple[tuple[str, str], str] | None],
+    github_login: str,
+    dockerhub_login: str,
+    *,
+    github_access_token: str | None,
+    ttl: float,
+    offline: bool,
+) -> str:
+    prefetched_result = prefetched.result()
+    if prefetched_result is not None:
+        logins, result = prefetched_result
+        if logins == (github_login, dockerhub_login):
+            return result
+    return load_user_full_name(
+        github_login,
+        dockerhub_login,
+        github_access_token=github_access_token,
+        ttl=ttl,
+        offline=offline,
+    )
+
+
 def api_method_url(method: str, *, base_url: str, version: str) -> str:
     return urljoin(base_url, version, method)
 
 
 def files_paths(path: str) -> Iterator[str]:
-    for root, _, files_names in os.walk(path):
-        for file_name in files_names:
+    for root, directories_names, files_names in os.walk(path):
+        directories_names.sort()
+        for file_name in sorted(files_names):
             yield os.path.join(root, file_name)
 
 
+BINARY_FILE_HEAD_SIZE: Final[int] = 1024
+
+
 def is_binary_file(path: str) -> bool:
     with open(path, mode='rb') as file:
-        return is_binary_string(file.read(1024))
+        return is_binary_string(file.read(BINARY_FILE_HEAD_SIZE))
 
 
 def is_binary_string(
@@ -345,13 +3002,19 @@ def load_dockerhub_user(
     *,
     base_url: str = 'https://hub.docker.com',
     version: str = 'v2',
+    ttl: float = USERS_CACHE_TTL,
+    offline: bool = False,
 ) -> dict[str, Any]:
+    import httpx
+
     users_method_url = partial(api_method_url, 'users')
     response = fetch_user_request(
         login=login,
         base_url=base_url,
         version=version,
         users_method_url=users_method_url,
+        ttl=ttl,
+        offline=offline,
     )
     try:
         response.raise_for_status()
@@ -367,23 +3030,333 @@ def load_dockerhub_user(
         return result
 
 
-def load_github_repository(name: str, destination_path: str) -> None:
-    archive_url = f'https://github.com/{name}/archive/master.zip'
-    archive_bytes_stream = io.BytesIO(
-        httpx.get(archive_url, follow_redirects=True)
-        .raise_for_status()
-        .content
-    )
-    with ZipFile(archive_bytes_stream) as zip_file:
-        for resource_info in zip_file.infolist():
-            is_directory = resource_info.filename[-1] == '/'
-            if is_directory:
-                continue
-            top_level_directory_name = Path(resource_info.filename).parts[0]
-            resource_info.filename = os.path.relpath(
-                resource_info.filename, top_level_directory_name
+ARCHIVE_DOWNLOAD_ATTEMPTS: Final[int] = 5
+ARCHIVE_DOWNLOAD_CHUNK_SIZE: Final[int] = 1 << 16
+ARCHIVE_DOWNLOAD_INITIAL_BACKOFF: Final[float] = 0.5
+
+
+def load_github_repository(
+    name: str,
+    destination_path: str,
+    *,
+    objects_path: str | None = None,
+    extract: bool = True,
+) -> None:
+    if objects_path is None:
+        objects_path = os.path.join(
+            os.path.dirname(destination_path), TEMPLATES_OBJECTS_DIRECTORY_NAME
+        )
+    archive_url = f'https://github.com/{name}/archive/master.zip'
+    archive_path = destination_path + '.zip.part'
+    with profile_span('download_archive', url=archive_url):
+        download_file(archive_url, archive_path)
+    # keeps stored objects from being collected before manifest is saved
+    with lock_file(to_objects_lock_path(objects_path), shared=True):
+        files_infos: list[dict[str, Any]] = []
+        try:
+            from zipfile import ZipFile
+
+            with (
+                profile_span(
+                    'extract_archive' if extract else 'index_archive'
+                ),
+                ZipFile(archive_path) as zip_file,
+            ):
+                for resource_info in zip_file.infolist():
+                    if resource_info.is_dir():
+                        continue
+                    mode = to_object_mode(resource_info.external_attr >> 16)
+                    classifier = ContentsClassifier()
+                    with zip_file.open(resource_info) as resource:
+                        object_id = (
+                            store_object(
+                                objects_path,
+                                resource,
+                                size=resource_info.file_size,
+                                mode=mode,
+                                classifier=classifier,
+                            )
+                            if extract
+                            else hash_object(
+                                resource,
+                                size=resource_info.file_size,
+                                classifier=classifier,
+                            )
+                        )
+                    path = to_template_archive_name(resource_info.filename)
+                    files_infos.append(
+                        {
+                            'path': path,
+                            'object': object_id,
+                            'mode': mode,
+                            'size': resource_info.file_size,
+                            **to_template_file_classification(
+                                path, classifier.to_kind()
+                            ),
+                        }
+                    )
+        except Exception:
+            os.unlink(archive_path)
+            raise
+        manifest = {'version': TEMPLATE_MANIFEST_VERSION, 'files': files_infos}
+        if not extract:
+            save_json_object(
+                to_template_manifest_path(destination_path), manifest
+            )
+            os.replace(
+                archive_path, to_template_archive_path(destination_path)
+            )
+            return
+        with profile_span('materialize_template'):
+            materialize_template_version(
+                objects_path, manifest, destination_path
+            )
+        save_json_object(to_template_manifest_path(destination_path), manifest)
+        os.unlink(archive_path)
+
+
+GIT_BLOBS_MODES: Final[dict[str, int]] = {'100644': 0o644, '100755': 0o755}
+
+
+def load_template_delta(
+    repository_path: str,
+    destination_path: str,
+    *,
+    commit_sha: str,
+    previous_template_path: str,
+    objects_path: str,
+    github_access_token: str | None = None,
+) -> bool:
+    import httpx
+
+    previous_manifest = load_template_manifest(previous_template_path)
+    if previous_manifest is None or not os.path.isdir(previous_template_path):
+        return False
+    repository_url = f'{GITHUB_API_ENDPOINT}/repos/{repository_path}'
+    headers = _to_github_headers(github_access_token)
+    with profile_span('load_template_tree'):
+        tree_response = http_client().get(
+            f'{repository_url}/git/trees/{commit_sha}',
+            params={'recursive': '1'},
+            headers=headers,
+        )
+    if tree_response.status_code != HTTPStatus.OK:
+        return False
+    tree_info = tree_response.json()
+    if tree_info['truncated']:
+        return False
+    blobs_infos = [
+        entry_info
+        for entry_info in tree_info['tree']
+        if entry_info['type'] != 'tree'
+    ]
+    if any(
+        blob_info['mode'] not in GIT_BLOBS_MODES for blob_info in blobs_infos
+    ):
+        # symbolic links & submodules are resolved by archives only
+        return False
+    previous_objects_kinds = (
+        {
+            file_info['object']: to_file_kind(file_info)
+            for file_info in previous_manifest['files']
+        }
+        if previous_manifest.get('version') == TEMPLATE_MANIFEST_VERSION
+        else {}
+    )
+    # keeps reused objects from being collected before manifest is saved
+    with lock_file(to_objects_lock_path(objects_path), shared=True):
+        missing_blobs_infos = [
+            blob_info
+            for blob_info in blobs_infos
+            if not os.path.exists(
+                to_object_path(
+                    objects_path,
+                    blob_info['sha'],
+                    GIT_BLOBS_MODES[blob_info['mode']],
+                )
+            )
+        ]
+        if len(missing_blobs_infos) > to_template_delta_max_blobs_count(
+            tree_response.headers,
+            authenticated=github_access_token is not None,
+        ) or sum(
+            blob_info['size'] for blob_info in missing_blobs_infos
+        ) > TEMPLATE_DELTA_MAX_SIZE_RATIO * sum(
+            blob_info['size'] for blob_info in blobs_infos
+        ):
+            return False
+        objects_kinds = {}
+        with profile_span('download_blobs', count=len(missing_blobs_infos)):
+            for blob_info in missing_blobs_infos:
+                classifier = ContentsClassifier()
+                try:
+                    store_template_blob(
+                        f'{repository_url}/git/blobs/{blob_info["sha"]}',
+                        blob_info,
+                        objects_path=objects_path,
+                        classifier=classifier,
+                        headers=headers,
+                    )
+                except httpx.HTTPStatusError:
+                    return False
+                objects_kinds[blob_info['sha']] = classifier.to_kind()
+        files_infos = []
+        for blob_info in blobs_infos:
+            mode = GIT_BLOBS_MODES[blob_info['mode']]
+            object_id = blob_info['sha']
+            kind = objects_kinds.get(object_id) or previous_objects_kinds.get(
+                object_id
+            )
+            if kind is None:
+                kind = classify_file(
+                    to_object_path(objects_path, object_id, mode)
+                )
+            files_infos.append(
+                {
+                    'path': blob_info['path'],
+                    'object': object_id,
+                    'mode': mode,
+                    'size': blob_info['size'],
+                    **to_template_file_classification(blob_info['path'], kind),
+                }
+            )
+        manifest = {'version': TEMPLATE_MANIFEST_VERSION, 'files': files_infos}
+        with profile_span('materialize_template'):
+            materialize_template_version(
+                objects_path, manifest, destination_path
+            )
+        save_json_object(to_template_manifest_path(destination_path), manifest)
+    return True
+
+
+def to_template_delta_max_blobs_count(
+    headers: Mapping[str, str], *, authenticated: bool
+) -> int:
+    try:
+        remaining_requests_count = int(headers['X-RateLimit-Remaining'])
+    except (KeyError, ValueError):
+        return (
+            TEMPLATE_DELTA_MAX_BLOBS_COUNT
+            if authenticated
+            else TEMPLATE_DELTA_UNAUTHENTICATED_MAX_BLOBS_COUNT
+        )
+    # blobs are requested one by one, so the rest of the quota
+    # is left for commits checks & users lookups
+    return min(
+        TEMPLATE_DELTA_MAX_BLOBS_COUNT,
+        int(remaining_requests_count * TEMPLATE_DELTA_MAX_RATE_LIMIT_SHARE),
+    )
+
+
+def store_template_blob(
+    url: str,
+    blob_info: dict[str, Any],
+    *,
+    objects_path: str,
+    classifier: ContentsClassifier,
+    headers: dict[str, str] | None,
+) -> None:
+    mode = GIT_BLOBS_MODES[blob_info['mode']]
+    for other_mode in GIT_BLOBS_MODES.values():
+        # same contents can be stored with other mode
+        with (
+            suppress(FileNotFoundError),
+            open(
+                to_object_path(objects_path, blob_info['sha'], other_mode),
+                'rb',
+            ) as source,
+        ):
+            store_object(
+                objects_path,
+                source,
+                size=blob_info['size'],
+                mode=mode,
+                classifier=classifier,
+            )
+            return
+    response = http_client().get(
+        url,
+        headers={**(headers or {}), 'Accept': 'application/vnd.github.raw'},
+    )
+    response.raise_for_status()
+    object_id = store_object(
+        objects_path,
+        io.BytesIO(response.content),
+        size=len(response.content),
+        mode=mode,
+        classifier=classifier,
+    )
+    if object_id != blob_info['sha']:
+        error_message = (
+            f'Downloaded blob from {url!r} has SHA {object_id!r}, '
+            f'but expected {blob_info["sha"]!r}.'
+        )
+        raise ValueError(error_message)
+
+
+def download_file(
+    url: str,
+    destination_path: str,
+    *,
+    attempts: int = ARCHIVE_DOWNLOAD_ATTEMPTS,
+    chunk_size: int = ARCHIVE_DOWNLOAD_CHUNK_SIZE,
+) -> None:
+    import httpx
+
+    info_path = destination_path + '.json'
+    info = load_json_object(info_path) or {}
+    for attempt in range(attempts):
+        try:
+            offset = os.path.getsize(destination_path)
+        except OSError:
+            offset = 0
+        headers = {}
+        if offset and info.get('etag') is not None:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = info['etag']
+        try:
+            with http_client().stream(
+                HTTPMethod.GET, url, headers=headers, follow_redirects=True
+            ) as response:
+                if (
+                    response.status_code
+                    == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+                ):
+                    os.unlink(destination_path)
+                    continue
+                if response.status_code != HTTPStatus.PARTIAL_CONTENT:
+                    response.raise_for_status()
+                    offset = 0
+                    info = {'etag': response.headers.get('ETag')}
+                    save_json_object(info_path, info)
+                content_length = (
+                    None
+                    if 'Content-Encoding' in response.headers
+                    else response.headers.get('Content-Length')
+                )
+                with open(destination_path, 'ab' if offset else 'wb') as file:
+                    file.writelines(response.iter_bytes(chunk_size))
+                    downloaded_size = file.tell() - offset
+        except httpx.TransportError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(ARCHIVE_DOWNLOAD_INITIAL_BACKOFF * (1 << attempt))
+            continue
+        if content_length is not None and downloaded_size != int(
+            content_length
+        ):
+            os.unlink(destination_path)
+            error_message = (
+                f'Downloaded {downloaded_size} bytes from {url!r}, '
+                f'but expected {content_length}.'
             )
-            zip_file.extract(resource_info, destination_path)
+            raise ValueError(error_message)
+        break
+    else:
+        error_message = f'Failed to download {url!r} in {attempts} attempts.'
+        raise ValueError(error_message)
+    with suppress(FileNotFoundError):
+        os.unlink(info_path)
 
 
 def load_github_user(
@@ -391,6 +3364,8 @@ def load_github_user(
     *,
     base_url: str = GITHUB_API_ENDPOINT,
     access_token: str | None = None,
+    ttl: float = USERS_CACHE_TTL,
+    offline: bool = False,
 ) -> dict[str, Any]:
     users_method_url = partial(api_method_url, 'users')
     response = fetch_user_request(
@@ -399,20 +3374,180 @@ def load_github_user(
         version='',
         users_method_url=users_method_url,
         headers=_to_github_headers(access_token),
+        ttl=ttl,
+        offline=offline,
     )
     user = response.json()
     assert isinstance(user, dict), user
     return user
 
 
+SPDX_LICENSES_CACHE_FILE_NAME = 'spdx_licenses_info.json'
+TROVE_LICENSES_CACHE_FILE_NAME = 'trove_licenses_classifiers.json'
+TROVE_LICENSES_INDEX_FILE_NAME = 'trove_licenses_index.json'
+CACHED_RESOURCE_KEYS: Final[frozenset[str]] = frozenset(
+    {'etag', 'last_modified', 'fetched_at', 'updated_at', 'status', 'value'}
+)
+TROVE_LICENSES_INDEX_KEYS: Final[frozenset[str]] = frozenset(
+    {'spdx_updated_at', 'trove_updated_at', 'index'}
+)
+OSI_APPROVED_TROVE_LICENSES_GROUP = 'OSI Approved'
+SPDX_LICENSES_URL = 'https://raw.githubusercontent.com/spdx/license-list-data/master/json/licenses.json'
+TROVE_CLASSIFIERS_URL = 'https://pypi.org/pypi?%3Aaction=list_classifiers'
+
+
+class LicensesInfo(NamedTuple):
+    spdx_licenses_info: dict[str, Any]
+    trove_licenses_classifiers: list[str]
+    trove_licenses_index: dict[str, list[str]]
+
+
+def load_licenses_info(
+    *,
+    ttl: float = LICENSES_CACHE_TTL,
+    offline: bool = False,
+    bundled_spdx_licenses: bool = False,
+) -> LicensesInfo:
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        trove_licenses_cache_info_future = executor.submit(
+            load_trove_licenses_cache_info, ttl=ttl, offline=offline
+        )
+        spdx_licenses_cache_info = (
+            None
+            if bundled_spdx_licenses
+            else load_spdx_licenses_cache_info(ttl=ttl, offline=offline)
+        )
+        trove_licenses_cache_info = trove_licenses_cache_info_future.result()
+    trove_licenses_classifiers = trove_licenses_cache_info['value']
+    if spdx_licenses_cache_info is None:
+        spdx_licenses_info = load_bundled_spdx_licenses_info()
+        return LicensesInfo(
+            spdx_licenses_info,
+            trove_licenses_classifiers,
+            build_trove_licenses_index(
+                spdx_licenses_info, trove_licenses_classifiers
+            ),
+        )
+    spdx_licenses_info = spdx_licenses_cache_info['value']
+    index_file_path = str(
+        CACHE_DIRECTORY_PATH / TROVE_LICENSES_INDEX_FILE_NAME
+    )
+    index_info = load_json_object(index_file_path)
+    if (
+        index_info is not None
+        and index_info.keys() >= TROVE_LICENSES_INDEX_KEYS
+        and (
+            index_info['spdx_updated_at']
+            == spdx_licenses_cache_info['updated_at']
+        )
+        and (
+            index_info['trove_updated_at']
+            == trove_licenses_cache_info['updated_at']
+        )
+    ):
+        trove_licenses_index = index_info['index']
+    else:
+        trove_licenses_index = build_trove_licenses_index(
+            spdx_licenses_info, trove_licenses_classifiers
+        )
+        save_json_object(
+            index_file_path,
+            {
+                'spdx_updated_at': spdx_licenses_cache_info['updated_at'],
+                'trove_updated_at': trove_licenses_cache_info['updated_at'],
+                'index': trove_licenses_index,
+            },
+        )
+    return LicensesInfo(
+        spdx_licenses_info, trove_licenses_classifiers, trove_licenses_index
+    )
+
+
+def build_trove_licenses_index(
+    spdx_licenses_info: dict[str, Any], trove_licenses_classifiers: list[str]
+) -> dict[str, list[str]]:
+    osi_approved_licenses_names: list[tuple[str, str]] = []
+    other_licenses_names: list[tuple[str, str]] = []
+    for classifier in trove_licenses_classifiers:
+        (
+            osi_approved_licenses_names
+            if (
+                classifier.split(TROVE_CLASSIFIER_SEPARATOR, maxsplit=2)[1]
+                == OSI_APPROVED_TROVE_LICENSES_GROUP
+            )
+            else other_licenses_names
+        ).append(
+            (
+                classifier.rsplit(TROVE_CLASSIFIER_SEPARATOR, maxsplit=1)[1],
+                classifier,
+            )
+        )
+    result = {}
+    for identifier, spdx_license_info in spdx_licenses_info.items():
+        spdx_license_name = spdx_license_info['name']
+        candidates = [
+            classifier
+            for license_name, classifier in (
+                osi_approved_licenses_names
+                if spdx_license_info['osi_approved']
+                else other_licenses_names
+            )
+            if spdx_license_name in license_name
+        ]
+        if candidates:
+            result[identifier] = candidates
+    return result
+
+
 def load_spdx_licenses_info(
-    json_url: str = (
-        'https://raw.githubusercontent.com/spdx/license-list-data/master/json/licenses.json'
-    ),
+    json_url: str = SPDX_LICENSES_URL,
+    *,
+    ttl: float = LICENSES_CACHE_TTL,
+    offline: bool = False,
+    bundled: bool = False,
+) -> dict[str, Any]:
+    cache_info = (
+        None
+        if bundled
+        else load_spdx_licenses_cache_info(json_url, ttl=ttl, offline=offline)
+    )
+    return (
+        load_bundled_spdx_licenses_info()
+        if cache_info is None
+        else cache_info['value']
+    )
+
+
+def load_spdx_licenses_cache_info(
+    json_url: str = SPDX_LICENSES_URL, *, ttl: float, offline: bool
+) -> dict[str, Any] | None:
+    return load_cached_resource(
+        str(CACHE_DIRECTORY_PATH / SPDX_LICENSES_CACHE_FILE_NAME),
+        json_url,
+        parse=lambda response: parse_spdx_licenses_info(
+            response.json()['licenses']
+        ),
+        ttl=ttl,
+        offline=offline,
+    )
+
+
+def load_bundled_spdx_licenses_info() -> dict[str, Any]:
+    from importlib.resources import files
+
+    return cast(
+        dict[str, Any],
+        json.loads(
+            files(monty).joinpath(SPDX_LICENSES_CACHE_FILE_NAME).read_bytes()
+        ),
+    )
+
+
+def parse_spdx_licenses_info(
+    raw_licenses: list[dict[str, Any]],
 ) -> dict[str, Any]:
-    response = httpx.get(json_url)
-    response.raise_for_status()
-    raw_licenses = response.json()['licenses']
     result = {
         raw_license['licenseId']: {
             'name': raw_license['name'],
@@ -428,34 +3563,386 @@ def load_spdx_licenses_info(
 
 
 CACHE_DIRECTORY_PATH: Final[Path] = Path.home() / '.cache' / monty.__name__
-CACHE_DIRECTORY_PATH.mkdir(exist_ok=True, parents=True)
 
 
 def load_trove_licenses_classifiers(
-    *, url: str = 'https://pypi.org/pypi?%3Aaction=list_classifiers'
+    *,
+    url: str = TROVE_CLASSIFIERS_URL,
+    ttl: float = LICENSES_CACHE_TTL,
+    offline: bool = False,
 ) -> list[str]:
-    cache_file_path = CACHE_DIRECTORY_PATH / 'trove_licenses_classifiers.json'
-    try:
-        result = json.loads(cache_file_path.read_bytes())
-        if isinstance(result, list) and all(
-            isinstance(element, str) for element in result
-        ):
-            return result
-    except (OSError, TypeError, ValueError):
-        pass
-    with httpx.stream(HTTPMethod.GET, url) as response:
-        result = [
-            line
-            for line in response.iter_lines()
-            if (
-                line.split(TROVE_CLASSIFIER_SEPARATOR, maxsplit=1)[0]
-                == 'License'
+    return cast(
+        list[str],
+        load_trove_licenses_cache_info(url=url, ttl=ttl, offline=offline)[
+            'value'
+        ],
+    )
+
+
+def load_trove_licenses_cache_info(
+    *, url: str = TROVE_CLASSIFIERS_URL, ttl: float, offline: bool
+) -> dict[str, Any]:
+    result = load_cached_resource(
+        str(CACHE_DIRECTORY_PATH / TROVE_LICENSES_CACHE_FILE_NAME),
+        url,
+        parse=parse_trove_licenses_classifiers,
+        ttl=ttl,
+        offline=offline,
+    )
+    if result is None:
+        raise ValueError(f'No cached Trove classifiers from {url!r} found.')
+    return result
+
+
+def parse_trove_licenses_classifiers(response: httpx.Response) -> list[str]:
+    return [
+        line
+        for line in response.iter_lines()
+        if (line.split(TROVE_CLASSIFIER_SEPARATOR, maxsplit=1)[0] == 'License')
+    ]
+
+
+def load_cached_resource(
+    cache_file_path: str,
+    url: str,
+    *,
+    parse: Callable[[httpx.Response], Any],
+    ttl: float,
+    offline: bool,
+    headers: dict[str, str] | None = None,
+    negative_statuses: Container[int] = frozenset(),
+) -> dict[str, Any] | None:
+    cache_info = load_json_object(cache_file_path)
+    if cache_info is not None and not (
+        cache_info.keys() >= CACHED_RESOURCE_KEYS
+    ):
+        cache_info = None
+    if offline or (
+        cache_info is not None and time.time() - cache_info['fetched_at'] < ttl
+    ):
+        return cache_info
+    headers = {} if headers is None else dict(headers)
+    if cache_info is not None:
+        if cache_info['etag'] is not None:
+            headers['If-None-Match'] = cache_info['etag']
+        if cache_info['last_modified'] is not None:
+            headers['If-Modified-Since'] = cache_info['last_modified']
+    response = http_client().get(url, headers=headers)
+    fetched_at = time.time()
+    if (
+        cache_info is not None
+        and response.status_code == HTTPStatus.NOT_MODIFIED
+    ):
+        status, value, updated_at = (
+            cache_info['status'],
+            cache_info['value'],
+            cache_info['updated_at'],
+        )
+    elif response.status_code in negative_statuses:
+        status, value, updated_at = response.status_code, None, fetched_at
+    else:
+        response.raise_for_status()
+        status, value, updated_at = (
+            response.status_code,
+            parse(response),
+            fetched_at,
+        )
+    result = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'fetched_at': fetched_at,
+        'updated_at': updated_at,
+        'status': status,
+        'value': value,
+    }
+    save_json_object(cache_file_path, result)
+    return result
+
+
+HTTP_RETRY_INITIAL_BACKOFF: Final[float] = 0.5
+HTTP_RETRY_MAX_BACKOFF: Final[float] = 30.0
+HTTP_RETRY_METHODS: Final[frozenset[str]] = frozenset(
+    {HTTPMethod.GET, HTTPMethod.HEAD}
+)
+HTTP_RETRY_STATUSES: Final[frozenset[int]] = frozenset(
+    {
+        HTTPStatus.TOO_MANY_REQUESTS,
+        HTTPStatus.INTERNAL_SERVER_ERROR,
+        HTTPStatus.BAD_GATEWAY,
+        HTTPStatus.SERVICE_UNAVAILABLE,
+        HTTPStatus.GATEWAY_TIMEOUT,
+    }
+)
+
+
+class RetryingTransportFactory(Protocol):
+    def __call__(
+        self,
+        transport: httpx.BaseTransport,
+        *,
+        retries: int = ...,
+        initial_backoff: float = ...,
+    ) -> httpx.BaseTransport: ...
+
+
+@cache
+def load_retrying_transport_class() -> RetryingTransportFactory:
+    import httpx
+
+    class RetryingTransport(httpx.BaseTransport):
+        def __init__(
+            self,
+            transport: httpx.BaseTransport,
+            *,
+            retries: int = HTTP_DEFAULT_RETRIES,
+            initial_backoff: float = HTTP_RETRY_INITIAL_BACKOFF,
+        ) -> None:
+            self.initial_backoff = initial_backoff
+            self.retries = retries
+            self.transport = transport
+
+        def close(self) -> None:
+            self.transport.close()
+
+        def handle_request(self, request: httpx.Request) -> httpx.Response:
+            retries = (
+                self.retries if request.method in HTTP_RETRY_METHODS else 0
             )
-        ]
-    cache_file_path.write_text(json.dumps(result))
+            for attempt in range(retries + 1):
+                backoff = min(
+                    self.initial_backoff * (1 << attempt),
+                    HTTP_RETRY_MAX_BACKOFF,
+                )
+                try:
+                    with profile_span(
+                        f'{request.method} {request.url.host}',
+                        'request',
+                        method=request.method,
+                        url=str(request.url),
+                        attempt=attempt,
+                    ) as arguments:
+                        response = self.transport.handle_request(request)
+                        arguments['status'] = response.status_code
+                except httpx.TransportError:
+                    if attempt == retries:
+                        raise
+                else:
+                    if (
+                        attempt == retries
+                        or response.status_code not in HTTP_RETRY_STATUSES
+                    ):
+                        return response
+                    response.close()
+                    retry_after = response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        backoff = min(int(retry_after), HTTP_RETRY_MAX_BACKOFF)
+                time.sleep(backoff)
+            raise AssertionError('Unreachable')
+
+    return RetryingTransport
+
+
+_http_client: httpx.Client | None = None
+_http_client_lock = threading.Lock()
+_http_transport_factory: Callable[[], httpx.BaseTransport] | None = None
+
+
+def set_http_transport_factory(
+    factory: Callable[[], httpx.BaseTransport] | None,
+) -> Callable[[], httpx.BaseTransport] | None:
+    global _http_transport_factory
+    result, _http_transport_factory = _http_transport_factory, factory
+    configure_http_client()
     return result
 
 
+def configure_http_client(
+    *,
+    transport: httpx.BaseTransport | None = None,
+    http2: bool = False,
+    timeout: float = HTTP_DEFAULT_TIMEOUT,
+    retries: int = HTTP_DEFAULT_RETRIES,
+) -> httpx.Client:
+    global _http_client
+    client = create_http_client(
+        transport=transport, http2=http2, timeout=timeout, retries=retries
+    )
+    with _http_client_lock:
+        previous_client, _http_client = _http_client, client
+    if previous_client is not None:
+        previous_client.close()
+    return client
+
+
+def create_http_client(
+    *,
+    transport: httpx.BaseTransport | None = None,
+    http2: bool = False,
+    timeout: float = HTTP_DEFAULT_TIMEOUT,
+    retries: int = HTTP_DEFAULT_RETRIES,
+) -> httpx.Client:
+    import httpx
+
+    if transport is None:
+        transport = (
+            httpx.HTTPTransport(http2=http2)
+            if _http_transport_factory is None
+            else _http_transport_factory()
+        )
+    return httpx.Client(
+        timeout=timeout,
+        transport=load_retrying_transport_class()(transport, retries=retries),
+    )
+
+
+def http_client() -> httpx.Client:
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = create_http_client()
+        return _http_client
+
+
+@atexit.register
+def close_http_client() -> None:
+    global _http_client
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
+
+
+PROFILE_TOP_EVENTS_COUNT: Final[int] = 20
+ProfileCategory = Literal['phase', 'file', 'request']
+
+
+class ProfileEvent(NamedTuple):
+    name: str
+    category: ProfileCategory
+    start: int
+    duration: int
+    thread_id: int
+    arguments: dict[str, Any]
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.events: list[ProfileEvent] = []
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(
+        self, name: str, category: ProfileCategory, **arguments: Any
+    ) -> Iterator[dict[str, Any]]:
+        start = time.perf_counter_ns()
+        try:
+            yield arguments
+        finally:
+            event = ProfileEvent(
+                name,
+                category,
+                start - self.origin,
+                time.perf_counter_ns() - start,
+                threading.get_ident(),
+                arguments,
+            )
+            with self._lock:
+                self.events.append(event)
+
+    def to_summary(
+        self, *, top: int = PROFILE_TOP_EVENTS_COUNT
+    ) -> dict[str, Any]:
+        phases: dict[str, dict[str, float]] = {}
+        for event in self.events:
+            if event.category != 'phase':
+                continue
+            duration = event.duration / 1e9
+            phase_summary = phases.setdefault(
+                event.name, {'count': 0, 'total': 0.0, 'max': 0.0}
+            )
+            phase_summary['count'] += 1
+            phase_summary['total'] += duration
+            phase_summary['max'] = max(phase_summary['max'], duration)
+        return {
+            'phases': phases,
+            'files': self._to_category_summary('file', top=top),
+            'requests': self._to_category_summary('request', top=top),
+        }
+
+    def to_trace(self) -> dict[str, Any]:
+        process_id = os.getpid()
+        return {
+            'displayTimeUnit': 'ms',
+            'traceEvents': [
+                {
+                    'name': event.name,
+                    'cat': event.category,
+                    'ph': 'X',
+                    'ts': event.start / 1e3,
+                    'dur': event.duration / 1e3,
+                    'pid': process_id,
+                    'tid': event.thread_id,
+                    'args': event.arguments,
+                }
+                for event in self.events
+            ],
+        }
+
+    def _to_category_summary(
+        self, category: ProfileCategory, *, top: int
+    ) -> dict[str, Any]:
+        events = [event for event in self.events if event.category == category]
+        return {
+            'count': len(events),
+            'total': sum(event.duration for event in events) / 1e9,
+            'slowest': [
+                {
+                    'name': event.name,
+                    'duration': event.duration / 1e9,
+                    **event.arguments,
+                }
+                for event in sorted(
+                    events, key=attrgetter('duration'), reverse=True
+                )[:top]
+            ],
+        }
+
+
+_profiler: Profiler | None = None
+
+
+@contextmanager
+def profiling(directory: str | None) -> Iterator[Profiler | None]:
+    global _profiler
+    if directory is None:
+        yield None
+        return
+    profiler = _profiler = Profiler()
+    try:
+        yield profiler
+    finally:
+        _profiler = None
+        save_json_object(
+            os.path.join(directory, PROFILE_FILE_NAME), profiler.to_summary()
+        )
+        save_json_object(
+            os.path.join(directory, PROFILE_TRACE_FILE_NAME),
+            profiler.to_trace(),
+        )
+
+
+def profile_span(
+    name: str, category: ProfileCategory = 'phase', **arguments: Any
+) -> AbstractContextManager[dict[str, Any]]:
+    profiler = _profiler
+    return (
+        nullcontext(arguments)
+        if profiler is None
+        else profiler.span(name, category, **arguments)
+    )
+
+
 def _to_github_headers(access_token: str | None) -> dict[str, str] | None:
     return (
         None
@@ -471,20 +3958,80 @@ def fetch_user_request(
     version: str,
     users_method_url: Callable[..., str],
     headers: dict[str, str] | None = None,
+    ttl: float = USERS_CACHE_TTL,
+    offline: bool = False,
 ) -> httpx.Response:
+    import httpx
+
     users_url = users_method_url(base_url=base_url, version=version)
     user_url = urljoin(users_url, login)
-    with httpx.Client(headers=headers) as client:
-        return client.get(user_url).raise_for_status()
+    cache_info = load_cached_resource(
+        str(
+            CACHE_DIRECTORY_PATH
+            / USERS_CACHE_DIRECTORY_NAME
+            / (
+                hashlib.sha1(
+                    user_url.encode(), usedforsecurity=False
+                ).hexdigest()
+                + '.json'
+            )
+        ),
+        user_url,
+        parse=httpx.Response.json,
+        ttl=ttl,
+        offline=offline,
+        headers=headers,
+        negative_statuses={HTTPStatus.NOT_FOUND},
+    )
+    if cache_info is None:
+        assert offline, cache_info
+        raise ValueError(
+            f'No cached user {login!r} from {user_url!r} found, '
+            'in case of offline generation specify '
+            f'{FULL_NAME_KEY!r} key in settings explicitly.'
+        )
+    return httpx.Response(
+        cache_info['status'],
+        json=cache_info['value'],
+        request=httpx.Request(HTTPMethod.GET, user_url),
+    ).raise_for_status()
+
+
+@cache
+def default_templates_environment() -> TemplatesEnvironment:
+    return TemplatesEnvironment()
+
 
+def load_templates_environment(
+    templates_path: str, template_path: str
+) -> TemplatesEnvironment:
+    return TemplatesEnvironment(
+        bytecode_cache_directory=to_template_bytecode_directory_path(
+            templates_path, template_path
+        )
+    )
+
+
+def to_template_bytecode_directory_path(
+    templates_path: str, template_path: str
+) -> str:
+    return str(
+        CACHE_DIRECTORY_PATH
+        / 'bytecode'
+        / os.path.relpath(template_path, templates_path)
+    )
 
-def render(source: str, settings: dict[str, str]) -> str:
-    return Template(
-        source,
-        keep_trailing_newline=True,
-        trim_blocks=True,
-        undefined=StrictUndefined,
-    ).render(**settings)
+
+def render(
+    source: str,
+    settings: dict[str, str],
+    *,
+    environment: TemplatesEnvironment | None = None,
+    name: str | None = None,
+) -> str:
+    if environment is None:
+        environment = default_templates_environment()
+    return environment.compile_source(source, name).render(**settings)
 
 
 def render_file(
@@ -493,20 +4040,281 @@ def render_file(
     *,
     encoding: str = 'utf-8',
     renderer: Callable[[str], str],
+    link_mode: LinkMode = 'copy',
+    kind: FileKind | None = None,
+) -> None:
+    with profile_span(
+        os.path.basename(source_path), 'file', path=source_path
+    ) as arguments:
+        prepare_destination(destination_path)
+        with open(source_path, 'rb', buffering=0) as source:
+            kind, source_bytes = classify_source(source, kind)
+            arguments['kind'] = kind
+            if source_bytes is None:
+                source.seek(0)
+                with profile_span('copy_file'):
+                    write_file_copy(
+                        source, destination_path, link_mode=link_mode
+                    )
+                return
+            source_mode = os.fstat(source.fileno()).st_mode
+        write_rendered_file(
+            source_bytes,
+            destination_path,
+            mode=stat.S_IMODE(source_mode),
+            renderer=renderer,
+            encoding=encoding,
+        )
+
+
+def render_archive_file(
+    template_archive: TemplateArchive,
+    name: str,
+    destination_path: str,
+    *,
+    encoding: str = 'utf-8',
+    renderer: Callable[[str], str],
+    kind: FileKind | None = None,
+) -> None:
+    with profile_span(
+        posixpath.basename(name), 'file', path=name
+    ) as arguments:
+        prepare_destination(destination_path)
+        size, mode, _ = template_archive.stat(name)
+        with template_archive.open(name) as source:
+            kind, source_bytes = classify_source(source, kind)
+            arguments['kind'] = kind
+            if source_bytes is None:
+                source.seek(0)
+                with profile_span('copy_file'):
+                    if has_file_stream_contents(
+                        destination_path, source, size=size
+                    ):
+                        os.chmod(destination_path, mode)
+                        return
+                    source.seek(0)
+                    with open(destination_path, 'wb') as destination:
+                        shutil.copyfileobj(
+                            source, destination, OBJECTS_CHUNK_SIZE
+                        )
+                os.chmod(destination_path, mode)
+                return
+        write_rendered_file(
+            source_bytes,
+            destination_path,
+            mode=mode,
+            renderer=renderer,
+            encoding=encoding,
+        )
+
+
+def write_rendered_file(
+    source_bytes: bytes,
+    destination_path: str,
+    *,
+    mode: int,
+    renderer: Callable[[str], str],
+    encoding: str,
+) -> None:
+    with profile_span('render_template'):
+        rendered_bytes = render_bytes(
+            source_bytes, renderer=renderer, encoding=encoding
+        )
+    with profile_span('write_file'):
+        if not has_file_contents(destination_path, rendered_bytes):
+            Path(destination_path).write_bytes(rendered_bytes)
+        os.chmod(destination_path, mode)
+
+
+def classify_source(
+    source: IO[bytes], kind: FileKind | None = None
+) -> tuple[FileKind, bytes | None]:
+    if kind is not None:
+        return kind, (source.read() if kind == 'template' else None)
+    with profile_span('detect_binary'):
+        head = source.read(BINARY_FILE_HEAD_SIZE)
+        if is_binary_string(head):
+            return 'binary', None
+    source_bytes = head + source.read()
+    if has_template_syntax(source_bytes):
+        return 'template', source_bytes
+    return 'plain', None
+
+
+def render_bytes(
+    source_bytes: bytes,
+    *,
+    renderer: Callable[[str], str],
+    encoding: str = 'utf-8',
+) -> bytes:
+    return (
+        renderer(source_bytes.decode(encoding))
+        .replace('\n', os.linesep)
+        .encode(encoding)
+    )
+
+
+def has_file_contents(path: str, contents: bytes) -> bool:
+    try:
+        with open(path, 'rb', buffering=0) as file:
+            return (
+                os.fstat(file.fileno()).st_size == len(contents)
+                and file.readall() == contents
+            )
+    except OSError:
+        return False
+
+
+def has_file_stream_contents(
+    path: str, source: IO[bytes], *, size: int
+) -> bool:
+    try:
+        with open(path, 'rb', buffering=0) as file:
+            if os.fstat(file.fileno()).st_size != size:
+                return False
+            for chunk in iter(partial(source.read, OBJECTS_CHUNK_SIZE), b''):
+                if file.read(len(chunk)) != chunk:
+                    return False
+            return file.read(1) == b''
+    except OSError:
+        return False
+
+
+def prepare_destination(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        links_count = os.stat(path, follow_symlinks=False).st_nlink
+    except FileNotFoundError:
+        return
+    if links_count > 1:
+        # writing through a hardlink would modify the linked template file
+        os.unlink(path)
+
+
+def copy_file(
+    source_path: str, destination_path: str, *, link_mode: LinkMode = 'copy'
+) -> None:
+    with open(source_path, 'rb', buffering=0) as source:
+        write_file_copy(source, destination_path, link_mode=link_mode)
+
+
+def write_file_copy(
+    source: io.FileIO, destination_path: str, *, link_mode: LinkMode = 'copy'
 ) -> None:
-    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
-    Path(destination_path).write_text(
-        renderer(Path(source_path).read_text(encoding=encoding)),
-        encoding=encoding,
+    source_path = os.fsdecode(source.name)
+    if link_mode == 'hardlink':
+        try:
+            link_file(source_path, destination_path)
+        except OSError:
+            pass
+        else:
+            return
+    source_stat = os.fstat(source.fileno())
+    if has_file_stream_contents(
+        destination_path, source, size=source_stat.st_size
+    ):
+        os.chmod(destination_path, stat.S_IMODE(source_stat.st_mode))
+        return
+    source.seek(0)
+    with open(destination_path, 'wb', buffering=0) as destination:
+        if not (
+            link_mode == 'reflink' and clone_file_contents(source, destination)
+        ):
+            copy_file_contents(source, destination)
+    os.chmod(destination_path, stat.S_IMODE(source_stat.st_mode))
+
+
+def link_file(source_path: str, destination_path: str) -> None:
+    if os.path.lexists(destination_path):
+        if os.path.samefile(source_path, destination_path):
+            return
+        temporary_path = destination_path + '.monty-link'
+        os.link(source_path, temporary_path)
+        os.replace(temporary_path, destination_path)
+    else:
+        os.link(source_path, destination_path)
+
+
+FILE_CLONE_REQUEST_CODE: Final[int] = 0x40049409
+ZERO_COPY_UNSUPPORTED_ERRORS_CODES: Final[frozenset[int]] = frozenset(
+    {
+        errno.EBADF,
+        errno.EINVAL,
+        errno.ENOSYS,
+        errno.ENOTSUP,
+        errno.EOPNOTSUPP,
+        errno.EXDEV,
+    }
+)
+ZERO_COPY_CHUNK_SIZE: Final[int] = 1 << 30
+
+
+def clone_file_contents(source: BinaryIO, destination: BinaryIO) -> bool:
+    if sys.platform != 'linux':
+        return False
+    import fcntl
+
+    try:
+        fcntl.ioctl(
+            destination.fileno(), FILE_CLONE_REQUEST_CODE, source.fileno()
+        )
+    except OSError:
+        return False
+    return True
+
+
+def copy_file_contents(source: BinaryIO, destination: BinaryIO) -> None:
+    source_descriptor, destination_descriptor = (
+        source.fileno(),
+        destination.fileno(),
     )
-    shutil.copymode(source_path, destination_path)
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while os.copy_file_range(
+                source_descriptor, destination_descriptor, ZERO_COPY_CHUNK_SIZE
+            ):
+                pass
+        except OSError as error:
+            if error.errno not in ZERO_COPY_UNSUPPORTED_ERRORS_CODES:
+                raise
+        else:
+            return
+    if sys.platform == 'linux':
+        try:
+            while os.sendfile(
+                destination_descriptor,
+                source_descriptor,
+                None,
+                ZERO_COPY_CHUNK_SIZE,
+            ):
+                pass
+        except OSError as error:
+            if error.errno not in ZERO_COPY_UNSUPPORTED_ERRORS_CODES:
+                raise
+        else:
+            return
+    shutil.copyfileobj(source, destination)
+
+
+def to_template_name(path: str, template_path: str) -> str:
+    return Path(os.path.relpath(path, template_path)).as_posix()
+
+
+def has_template_syntax(string: str | bytes) -> bool:
+    if isinstance(string, str):
+        return any(marker in string for marker in TEMPLATE_SYNTAX_MARKERS)
+    return any(marker in string for marker in TEMPLATE_SYNTAX_BINARY_MARKERS)
+
+
+def render_path_part(path_part: str, *, renderer: Callable[[str], str]) -> str:
+    return renderer(path_part) if has_template_syntax(path_part) else path_part
 
 
 def render_path_parts(
     *path_parts: str, renderer: Callable[[str], str]
 ) -> Iterator[str]:
     for path in path_parts:
-        yield renderer(path)
+        yield render_path_part(path, renderer=renderer)
 
 
 def replace_files_paths(
@@ -516,20 +4324,82 @@ def replace_files_paths(
     destination: str,
     renderer: Callable[[str], str],
 ) -> Iterator[tuple[str, str]]:
-    def replace_file_path(file_path: str) -> str:
-        root, file_name = os.path.split(file_path)
-        new_file_name = renderer(file_name)
-        new_root_parts = Path(root.replace(source_path, destination)).parts
-        new_root = str(Path(*map(renderer, new_root_parts)))
-        return os.path.join(new_root, new_file_name)
+    rendered_directories_paths: dict[str, str] = {}
+    rendered_relative_directories_paths: dict[str, str] = {'': destination}
 
-    original_paths, source_paths = tee(paths)
-    yield from zip(
-        original_paths, map(replace_file_path, source_paths), strict=False
-    )
+    def replace_directory_path(directory_path: str) -> str:
+        try:
+            return rendered_directories_paths[directory_path]
+        except KeyError:
+            relative_directory_path = os.path.relpath(
+                directory_path, source_path
+            )
+            result = rendered_directories_paths[directory_path] = (
+                replace_relative_directory_path(
+                    ''
+                    if relative_directory_path == os.curdir
+                    else relative_directory_path
+                )
+            )
+            return result
+
+    def replace_relative_directory_path(relative_directory_path: str) -> str:
+        try:
+            return rendered_relative_directories_paths[relative_directory_path]
+        except KeyError:
+            parent_path, directory_name = os.path.split(
+                relative_directory_path
+            )
+            result = rendered_relative_directories_paths[
+                relative_directory_path
+            ] = os.path.join(
+                replace_relative_directory_path(parent_path),
+                render_path_part(directory_name, renderer=renderer),
+            )
+            return result
+
+    for file_path in paths:
+        root, file_name = os.path.split(file_path)
+        yield (
+            file_path,
+            os.path.join(
+                replace_directory_path(root),
+                render_path_part(file_name, renderer=renderer),
+            ),
+        )
 
 
 urljoin = posixpath.join
 
+
+class DefaultCommandGroup(click.Group):
+    def __init__(
+        self, *args: Any, default_command_name: str, **kwargs: Any
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.default_command_name = default_command_name
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if not args or (
+            args[0] not in self.commands
+            and args[0] not in ctx.help_option_names
+        ):
+            args = [self.default_command_name, *args]
+        return super().parse_args(ctx, args)
+
+
+cli = DefaultCommandGroup(
+    'monty',
+    commands={
+        'generate': main,
+        'batch': batch,
+        'cache': cache_command,
+        'serve': serve,
+    },
+    default_command_name='generate',
+    help='Python project generator '
+    '(runs "generate" command if no other command is given).',
+)
+
 if __name__ == '__main__':
-    main()
+    cli()
@@ -1,3 +1,8 @@
+import os
+import shutil
+import tempfile
+from functools import partial
+
 import pytest
 from hypothesis import HealthCheck, settings
 
@@ -9,6 +14,48 @@ settings.register_profile(
 )
 
 
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        '--live-services',
+        action='store_true',
+        default=False,
+        help='Run against real GitHub, DockerHub, PyPI and SPDX services '
+        'instead of local stand-in.',
+    )
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config: pytest.Config) -> None:
+    if config.getoption('live_services'):
+        return
+    # cache directory is resolved from home directory on import
+    home_directory = tempfile.mkdtemp()
+    os.environ['HOME'] = os.environ['USERPROFILE'] = home_directory
+    config.add_cleanup(
+        partial(shutil.rmtree, home_directory, ignore_errors=True)
+    )
+
+    import httpx
+
+    from monty import monty
+    from tests.stand_in import (
+        TEMPLATES_REPOSITORIES_NAMES,
+        build_template_archive,
+        create_application,
+    )
+
+    monty.set_http_transport_factory(
+        partial(
+            httpx.WSGITransport,
+            app=create_application(
+                dict.fromkeys(
+                    TEMPLATES_REPOSITORIES_NAMES, build_template_archive()
+                )
+            ),
+        )
+    )
+
+
 @pytest.hookimpl(trylast=True)
 def pytest_sessionfinish(
     session: pytest.Session, exitstatus: pytest.ExitCode
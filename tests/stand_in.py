@@ -0,0 +1,286 @@
+import hashlib
+import io
+import json
+import posixpath
+import re
+from collections.abc import Callable, Iterable, Mapping
+from http import HTTPStatus
+from typing import Any
+from wsgiref.types import StartResponse, WSGIEnvironment
+from zipfile import ZIP_DEFLATED, ZipFile, ZipInfo
+
+from monty import monty
+
+Application = Callable[[WSGIEnvironment, StartResponse], Iterable[bytes]]
+Response = tuple[HTTPStatus, dict[str, str], bytes]
+
+DEFAULT_COMMIT_DATE = '2024-01-01T00:00:00Z'
+DEFAULT_USERS = {'lycantropos': 'Azat Ibrakov'}
+CLASSIFIERS = (
+    'Development Status :: 5 - Production/Stable',
+    'License :: OSI Approved :: Apache Software License',
+    'License :: OSI Approved :: BSD License',
+    'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
+    'License :: OSI Approved :: MIT License',
+    'License :: OSI Approved :: Mozilla Public License 2.0 (MPL 2.0)',
+    'License :: Public Domain',
+    'Programming Language :: Python :: 3',
+)
+
+TEMPLATE_FILES = {
+    'LICENSE': (b'License text without template syntax.\r\n', 0o100644),
+    'README.md': (b'# {{ project }}\n\n{{ description }}\n', 0o100644),
+    'logo.png': (bytes(range(256)) * 8, 0o100644),
+    'run.sh': (b'#!/bin/sh\necho {{ project }}\n', 0o100755),
+    'docs/index.md': (b'{{ project }} by {{ github_login }}\n', 0o100644),
+    '{{ project }}/__init__.py': (
+        b'"""{{ description }}"""\n\n__version__ = \'{{ version }}\'\n',
+        0o100644,
+    ),
+    '{{ project }}/core/{{ project }}_core.py': (b'VALUE = 1\n', 0o100644),
+}
+TEMPLATES_REPOSITORIES_NAMES = (
+    'lycantropos/monty-cpp-python-template',
+    'lycantropos/monty-cpython-pypy-template',
+    'lycantropos/monty-python-c-api-template',
+    'lycantropos/monty-rust-python-template',
+    'lycantropos/monty-rust-template',
+)
+
+
+def build_template_archive(
+    files: Mapping[str, tuple[bytes, int]] = TEMPLATE_FILES,
+    *,
+    root: str = 'template-master',
+) -> bytes:
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w', ZIP_DEFLATED) as zip_file:
+        for file_name, (content, mode) in files.items():
+            file_info = ZipInfo(f'{root}/{file_name}')
+            file_info.compress_type = ZIP_DEFLATED
+            file_info.external_attr = mode << 16
+            zip_file.writestr(file_info, content)
+    return buffer.getvalue()
+
+
+def load_archive_files(archive: bytes) -> dict[str, tuple[bytes, int]]:
+    with ZipFile(io.BytesIO(archive)) as zip_file:
+        return {
+            file_info.filename.split('/', maxsplit=1)[1]: (
+                zip_file.read(file_info),
+                0o100755
+                if file_info.external_attr >> 16 & 0o111
+                else 0o100644,
+            )
+            for file_info in zip_file.infolist()
+            if not file_info.is_dir()
+        }
+
+
+def to_blob_sha(content: bytes) -> str:
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+
+def create_application(
+    templates_archives: Mapping[str, bytes],
+    *,
+    commit_date: str = DEFAULT_COMMIT_DATE,
+    users: Mapping[str, str] = DEFAULT_USERS,
+) -> Application:
+    spdx_licenses_info = monty.load_bundled_spdx_licenses_info()
+    spdx_licenses_content = json.dumps(
+        {
+            'licenses': [
+                {
+                    'licenseId': identifier,
+                    'name': spdx_license_info['name'],
+                    'isDeprecatedLicenseId': spdx_license_info[
+                        'is_deprecated'
+                    ],
+                    'isOsiApproved': spdx_license_info['osi_approved'],
+                }
+                for identifier, spdx_license_info in spdx_licenses_info.items()
+            ]
+        }
+    ).encode()
+    classifiers_content = '\n'.join(CLASSIFIERS).encode()
+
+    def to_tree_response(repository: str, sha: str) -> Response:
+        if (
+            repository not in templates_archives
+            or hashlib.sha1(templates_archives[repository]).hexdigest() != sha
+        ):
+            return to_not_found_response()
+        files = load_archive_files(templates_archives[repository])
+        directories_paths = {
+            posixpath.dirname(file_path)
+            for file_path in files
+            if posixpath.dirname(file_path)
+        }
+        return to_json_response(
+            {
+                'sha': sha,
+                'tree': [
+                    *[
+                        {
+                            'path': directory_path,
+                            'mode': '040000',
+                            'type': 'tree',
+                        }
+                        for directory_path in sorted(directories_paths)
+                    ],
+                    *[
+                        {
+                            'path': file_path,
+                            'mode': f'{mode:o}',
+                            'type': 'blob',
+                            'sha': to_blob_sha(content),
+                            'size': len(content),
+                        }
+                        for file_path, (content, mode) in files.items()
+                    ],
+                ],
+                'truncated': False,
+            }
+        )
+
+    def to_blob_response(repository: str, sha: str) -> Response:
+        if repository not in templates_archives:
+            return to_not_found_response()
+        for content, _ in load_archive_files(
+            templates_archives[repository]
+        ).values():
+            if to_blob_sha(content) == sha:
+                return to_content_response(
+                    content, 'application/vnd.github.raw'
+                )
+        return to_not_found_response()
+
+    routes: list[tuple[str, re.Pattern[str], Callable[..., Response]]] = [
+        (
+            'api.github.com',
+            re.compile(r'/repos/(?P<repository>[^/]+/[^/]+)/commits'),
+            lambda repository: (
+                to_json_response(
+                    [
+                        {
+                            'sha': hashlib.sha1(
+                                templates_archives[repository]
+                            ).hexdigest(),
+                            'commit': {'committer': {'date': commit_date}},
+                        }
+                    ]
+                )
+                if repository in templates_archives
+                else to_not_found_response()
+            ),
+        ),
+        (
+            'api.github.com',
+            re.compile(
+                r'/repos/(?P<repository>[^/]+/[^/]+)/git/trees/(?P<sha>\w+)'
+            ),
+            to_tree_response,
+        ),
+        (
+            'api.github.com',
+            re.compile(
+                r'/repos/(?P<repository>[^/]+/[^/]+)/git/blobs/(?P<sha>\w+)'
+            ),
+            to_blob_response,
+        ),
+        (
+            'api.github.com',
+            re.compile(r'/users/(?P<login>[^/]+)'),
+            lambda login: (
+                to_json_response({'login': login, 'name': users[login]})
+                if login in users
+                else to_not_found_response()
+            ),
+        ),
+        (
+            'github.com',
+            re.compile(r'/(?P<repository>[^/]+/[^/]+)/archive/master.zip'),
+            lambda repository: (
+                to_content_response(
+                    templates_archives[repository], 'application/zip'
+                )
+                if repository in templates_archives
+                else to_not_found_response()
+            ),
+        ),
+        (
+            'hub.docker.com',
+            re.compile(r'/v2/users/(?P<login>[^/]+)/?'),
+            lambda login: (
+                to_json_response(
+                    {'username': login, 'full_name': users[login]}
+                )
+                if login in users
+                else to_not_found_response()
+            ),
+        ),
+        (
+            'pypi.org',
+            re.compile(r'/pypi'),
+            lambda: to_content_response(
+                classifiers_content, 'text/plain; charset=utf-8'
+            ),
+        ),
+        (
+            'raw.githubusercontent.com',
+            re.compile(r'/spdx/license-list-data/master/json/licenses.json'),
+            lambda: to_content_response(
+                spdx_licenses_content, 'application/json'
+            ),
+        ),
+    ]
+
+    def application(
+        environ: WSGIEnvironment, start_response: StartResponse
+    ) -> Iterable[bytes]:
+        host = environ.get('HTTP_HOST', '').split(':', maxsplit=1)[0]
+        path = environ.get('PATH_INFO', '')
+        status, headers, content = to_not_found_response()
+        for route_host, route_pattern, handler in routes:
+            if route_host != host:
+                continue
+            match = route_pattern.fullmatch(path)
+            if match is not None:
+                status, headers, content = handler(**match.groupdict())
+                break
+        if (
+            status == HTTPStatus.OK
+            and environ.get('HTTP_IF_NONE_MATCH') == headers['ETag']
+        ):
+            status, content = HTTPStatus.NOT_MODIFIED, b''
+        start_response(
+            f'{status.value} {status.phrase}',
+            [*headers.items(), ('Content-Length', str(len(content)))],
+        )
+        return [content]
+
+    return application
+
+
+def to_content_response(content: bytes, content_type: str) -> Response:
+    return (
+        HTTPStatus.OK,
+        {
+            'Content-Type': content_type,
+            'ETag': f'"{hashlib.sha1(content).hexdigest()}"',
+        },
+        content,
+    )
+
+
+def to_json_response(value: Any) -> Response:
+    return to_content_response(json.dumps(value).encode(), 'application/json')
+
+
+def to_not_found_response() -> Response:
+    return (
+        HTTPStatus.NOT_FOUND,
+        {'Content-Type': 'application/json'},
+        b'{"message": "Not Found"}',
+    )
@@ -1,13 +1,27 @@
 from .monty import (
+    archive_formats as archive_formats,
+    binary_files_contents as binary_files_contents,
+    descriptions as descriptions,
+    jobs_backends as jobs_backends,
+    jobs_counts as jobs_counts,
+    lazily_imported_modules_names as lazily_imported_modules_names,
+    link_modes as link_modes,
+    plain_files_contents as plain_files_contents,
+    projects_names as projects_names,
     settings as settings,
+    settings_lists as settings_lists,
+    spdx_licenses_identifiers as spdx_licenses_identifiers,
     template_repositories_names as template_repositories_names,
     templates_directories_paths as templates_directories_paths,
+    templates_relative_files_paths as templates_relative_files_paths,
     temporary_directories as temporary_directories,
 )
 from .services import (
     dockerhub_logins as dockerhub_logins,
+    downloads_contents as downloads_contents,
     github_access_tokens as github_access_tokens,
     github_logins as github_logins,
+    http_retries_counts as http_retries_counts,
     invalid_dockerhub_logins as invalid_dockerhub_logins,
     invalid_github_logins as invalid_github_logins,
 )
@@ -1,8 +1,10 @@
+import os
 import tempfile
 
 from hypothesis import strategies
 
 from monty import monty
+from tests.stand_in import TEMPLATES_REPOSITORIES_NAMES
 
 from .common import ascii_alphanumeric
 from .services import dockerhub_logins, github_logins
@@ -66,14 +68,35 @@ required_settings = {
 settings = strategies.fixed_dictionaries(
     {**required_settings, **optional_settings}
 )
+settings_lists = strategies.lists(settings, min_size=1, max_size=3)
 templates_directories_paths = strategies.builds(tempfile.mkdtemp)
 template_repositories_names = strategies.sampled_from(
-    [
-        'lycantropos/monty-cpp-python-template',
-        'lycantropos/monty-cpython-pypy-template',
-        'lycantropos/monty-python-c-api-template',
-        'lycantropos/monty-rust-python-template',
-        'lycantropos/monty-rust-template',
-    ]
+    TEMPLATES_REPOSITORIES_NAMES
 )
 temporary_directories = strategies.builds(tempfile.TemporaryDirectory)
+plain_paths_parts = strategies.text(
+    alphabet=ascii_alphanumeric + '_-', min_size=1, max_size=10
+)
+templated_paths_parts = strategies.builds(
+    '{}{{{{ project }}}}{}'.format, plain_paths_parts, plain_paths_parts
+)
+paths_parts = plain_paths_parts | templated_paths_parts
+templates_relative_files_paths = strategies.lists(
+    strategies.lists(paths_parts, min_size=1, max_size=5).map(
+        lambda parts: os.path.join(*parts)
+    ),
+    unique=True,
+)
+link_modes = strategies.sampled_from(monty.LINK_MODES)
+plain_files_contents = strategies.text().filter(
+    lambda text: not monty.has_template_syntax(text)
+)
+binary_files_contents = strategies.binary(min_size=1).map(
+    lambda content: b'\x00' + content
+)
+archive_formats = strategies.sampled_from(monty.ARCHIVE_FORMATS)
+jobs_counts = strategies.integers(1, 4)
+jobs_backends = strategies.sampled_from(monty.JOBS_BACKENDS)
+lazily_imported_modules_names = strategies.sampled_from(
+    ['concurrent.futures', 'httpx', 'jinja2', 'strictyaml']
+)
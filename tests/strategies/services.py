@@ -12,6 +12,17 @@ github_access_tokens = strategies.just(
     Secured(os.getenv('GITHUB_ACCESS_TOKEN'))
 )
 github_logins = strategies.just('lycantropos')
+
+url_path_delimiters = '#%/?'
+
+
+def is_url_path_segment(login: str) -> bool:
+    return login not in ('', '.', '..') and not any(
+        character in url_path_delimiters or not character.isprintable()
+        for character in login
+    )
+
+
 invalid_dockerhub_logins_alphabet = strategies.characters(
     blacklist_characters=string.ascii_letters
 )
@@ -19,10 +30,13 @@ invalid_dockerhub_logins = (
     strategies.text(alphabet=invalid_dockerhub_logins_alphabet)
     | strategies.text(max_size=3)
     | strategies.text(min_size=31)
-)
+).filter(is_url_path_segment)
 invalid_github_logins_alphabet = strategies.characters(
     blacklist_characters=ascii_alphanumeric + '-'
 )
-invalid_github_logins = strategies.text(
-    alphabet=invalid_github_logins_alphabet
-) | strategies.text(min_size=40)
+invalid_github_logins = (
+    strategies.text(alphabet=invalid_github_logins_alphabet)
+    | strategies.text(min_size=40)
+).filter(is_url_path_segment)
+http_retries_counts = strategies.integers(0, 5)
+downloads_contents = strategies.binary(min_size=2, max_size=1 << 12)
@@ -1,18 +1,36 @@
+import json
 import os
-from collections.abc import Iterable, Iterator
+import stat
+import tarfile
+import tempfile
+import threading
+from collections.abc import Callable, Iterable, Iterator, Mapping
 from contextlib import ExitStack, contextmanager
 from functools import partial
+from http import HTTPStatus
+from http.client import HTTPConnection
+from pathlib import Path
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from typing import Any
+from wsgiref.types import StartResponse, WSGIEnvironment
+from zipfile import ZipFile
 
 import click
+import httpx
 import pytest
 import strictyaml  # type: ignore[import-untyped]
+from click.testing import CliRunner
 from hypothesis import given
 
 from monty import monty
 from tests import strategies
-from tests.utils import Secured
+from tests.stand_in import (
+    DEFAULT_COMMIT_DATE,
+    TEMPLATE_FILES,
+    build_template_archive,
+    create_application,
+)
+from tests.utils import Secured, recording_exchanges, serving
 
 
 @given(
@@ -21,13 +39,17 @@ from tests.utils import Secured
     strategies.template_repositories_names,
     strategies.temporary_directories,
     strategies.github_access_tokens,
+    strategies.jobs_counts,
+    strategies.jobs_backends,
 )
 def test_main(
     settings: dict[str, str],
     templates_directory_path: str,
-    template_repository_name: str | None,
+    template_repository_name: str,
     temporary_directory: TemporaryDirectory[str],
     github_access_token: Secured,
+    jobs: int,
+    jobs_backend: monty.JobsBackend,
 ) -> None:
     with ExitStack() as stack:
         output_dir = stack.enter_context(temporary_directory)
@@ -37,38 +59,167 @@ def test_main(
         assert callback is not None, callback
         command = partial(
             callback,
-            version=False,
             settings_path=settings_path,
             templates_dir=templates_directory_path,
             output_dir=output_dir,
             github_access_token=github_access_token.value,
             template_repo=template_repository_name,
+            jobs=jobs,
+            jobs_backend=jobs_backend,
         )
 
-        files_count_before = capacity(monty.files_paths(output_dir))
+        files_count_before = capacity(generated_files_paths(output_dir))
 
         command(overwrite=False)
 
         template_directory_files_count = capacity(
-            monty.files_paths(templates_directory_path)
+            monty.files_paths(
+                monty.sync_template(
+                    templates_directory_path,
+                    template_repository_name,
+                    github_access_token.value,
+                    offline=True,
+                )
+            )
         )
 
-        files_count_after = capacity(monty.files_paths(output_dir))
+        files_count_after = capacity(generated_files_paths(output_dir))
+        files_mtimes_after = to_files_mtimes(output_dir)
 
         command(overwrite=True)
 
-        files_count_after_overwrite = capacity(monty.files_paths(output_dir))
+        files_count_after_overwrite = capacity(
+            generated_files_paths(output_dir)
+        )
 
         assert files_count_after == (
             files_count_before + template_directory_files_count
         )
         assert files_count_after_overwrite == files_count_after
+        assert to_files_mtimes(output_dir) == files_mtimes_after
 
         if template_directory_files_count:
             with pytest.raises(click.BadOptionUsage):
                 command(overwrite=False)
 
 
+@given(
+    strategies.settings,
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+)
+def test_main_unchanged_files(
+    settings: dict[str, str],
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+) -> None:
+    with ExitStack() as stack:
+        output_dir = stack.enter_context(temporary_directory)
+        callback = monty.main.callback
+        assert callback is not None, callback
+        command = partial(
+            callback,
+            templates_dir=templates_directory_path,
+            output_dir=output_dir,
+            overwrite=True,
+            github_access_token=github_access_token.value,
+            template_repo=template_repository_name,
+        )
+
+        command(settings_path=stack.enter_context(write_settings(settings)))
+
+        files_contents_before = load_files_contents(output_dir)
+        files_mtimes_before = to_files_mtimes(output_dir)
+
+        command(
+            settings_path=stack.enter_context(
+                write_settings(
+                    {**settings, 'version': settings['version'] + '-alpha'}
+                )
+            )
+        )
+
+        files_contents_after = load_files_contents(output_dir)
+        files_mtimes_after = to_files_mtimes(output_dir)
+
+        os.unlink(os.path.join(output_dir, monty.OUTPUT_MANIFEST_FILE_NAME))
+        command(
+            settings_path=stack.enter_context(
+                write_settings(
+                    {**settings, 'version': settings['version'] + '-alpha'}
+                )
+            )
+        )
+
+        assert files_contents_after.keys() == files_contents_before.keys()
+        assert all(
+            files_mtimes_after[os.path.join(output_dir, file_name)]
+            == files_mtimes_before[os.path.join(output_dir, file_name)]
+            for file_name, contents in files_contents_after.items()
+            if contents == files_contents_before[file_name]
+        )
+        assert to_files_mtimes(output_dir) == files_mtimes_after
+
+
+@given(
+    strategies.settings,
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+)
+def test_main_bytecode_cache(
+    settings: dict[str, str],
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+) -> None:
+    with ExitStack() as stack:
+        directory = stack.enter_context(temporary_directory)
+        callback = monty.main.callback
+        assert callback is not None, callback
+        command = partial(
+            callback,
+            settings_path=stack.enter_context(write_settings(settings)),
+            templates_dir=templates_directory_path,
+            overwrite=False,
+            github_access_token=github_access_token.value,
+            template_repo=template_repository_name,
+        )
+
+        command(output_dir=os.path.join(directory, 'first'))
+
+        template_path = monty.sync_template(
+            templates_directory_path,
+            template_repository_name,
+            github_access_token.value,
+            offline=True,
+        )
+        bytecode_directory_path = monty.to_template_bytecode_directory_path(
+            templates_directory_path, template_path
+        )
+        bytecode_mtimes = to_files_mtimes(bytecode_directory_path)
+
+        command(output_dir=os.path.join(directory, 'second'))
+
+        bytecode_mtimes_after = to_files_mtimes(bytecode_directory_path)
+
+        retired_paths = monty.prune_templates(
+            templates_directory_path, max_size=0
+        )
+
+    assert bytecode_mtimes
+    # cached bytecode is loaded instead of being compiled & saved again
+    assert bytecode_mtimes_after == bytecode_mtimes
+    assert retired_paths == [template_path]
+    assert not os.path.exists(bytecode_directory_path)
+
+
 @contextmanager
 def write_settings(settings: dict[str, str]) -> Iterator[str]:
     file = NamedTemporaryFile(mode='w', encoding='utf8', delete=False)  # noqa: SIM115
@@ -83,3 +234,879 @@ def write_settings(settings: dict[str, str]) -> Iterator[str]:
 
 def capacity(elements: Iterable[Any]) -> int:
     return sum(1 for _ in elements)
+
+
+def generated_files_paths(path: str) -> Iterator[str]:
+    for file_path in monty.files_paths(path):
+        if os.path.relpath(file_path, path) != monty.OUTPUT_MANIFEST_FILE_NAME:
+            yield file_path
+
+
+def to_files_mtimes(path: str) -> dict[str, int]:
+    return {
+        file_path: os.stat(file_path).st_mtime_ns
+        for file_path in generated_files_paths(path)
+    }
+
+
+@given(
+    strategies.settings_lists,
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+)
+def test_generate_projects(
+    settings_list: list[dict[str, str]],
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+) -> None:
+    with ExitStack() as stack:
+        output_dir = stack.enter_context(temporary_directory)
+        projects = [
+            monty.ProjectSpecification(
+                stack.enter_context(write_settings(settings)),
+                template_repository_name,
+                os.path.join(output_dir, str(index)),
+            )
+            for index, settings in enumerate(settings_list)
+        ]
+
+        reports = monty.generate_projects(
+            projects,
+            templates_dir=templates_directory_path,
+            github_access_token=github_access_token.value,
+            jobs=len(projects),
+        )
+
+        template_directory_files_count = capacity(
+            monty.files_paths(
+                monty.sync_template(
+                    templates_directory_path,
+                    template_repository_name,
+                    github_access_token.value,
+                    offline=True,
+                )
+            )
+        )
+
+        assert [report.project for report in reports] == projects
+        assert all(report.succeeded for report in reports)
+        assert all(
+            capacity(generated_files_paths(project.output_dir))
+            == template_directory_files_count
+            for project in projects
+            if project.output_dir is not None
+        )
+
+
+@given(
+    strategies.settings,
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+)
+def test_main_profile(
+    settings: dict[str, str],
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+) -> None:
+    with ExitStack() as stack:
+        directory = stack.enter_context(temporary_directory)
+        output_dir = os.path.join(directory, 'output')
+        profile_dir = os.path.join(directory, 'profile')
+        settings_path = stack.enter_context(write_settings(settings))
+
+        callback = monty.main.callback
+        assert callback is not None, callback
+        callback(
+            settings_path=settings_path,
+            templates_dir=templates_directory_path,
+            output_dir=output_dir,
+            overwrite=False,
+            profile_dir=profile_dir,
+            github_access_token=github_access_token.value,
+            template_repo=template_repository_name,
+        )
+
+        profile = monty.load_json_object(
+            os.path.join(profile_dir, monty.PROFILE_FILE_NAME)
+        )
+        trace = monty.load_json_object(
+            os.path.join(profile_dir, monty.PROFILE_TRACE_FILE_NAME)
+        )
+
+        assert profile is not None
+        assert trace is not None
+        assert profile['phases']['main']['count'] == 1
+        assert profile['files']['count'] == capacity(
+            generated_files_paths(output_dir)
+        )
+        assert all(event['ph'] == 'X' for event in trace['traceEvents'])
+
+
+@given(
+    strategies.settings,
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+)
+def test_serve(
+    settings: dict[str, str],
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+) -> None:
+    with ExitStack() as stack:
+        output_dir = stack.enter_context(temporary_directory)
+        settings_path = stack.enter_context(write_settings(settings))
+        server = stack.enter_context(
+            monty.create_generation_server(
+                monty.GenerationService(
+                    templates_dir=templates_directory_path,
+                    github_access_token=github_access_token.value,
+                    root=tempfile.gettempdir(),
+                ),
+                port=0,
+            )
+        )
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.start()
+        stack.callback(server_thread.join)
+        stack.callback(server.shutdown)
+        client = stack.enter_context(
+            httpx.Client(
+                base_url=(
+                    f'http://{monty.SERVER_DEFAULT_HOST}:'
+                    f'{server.server_address[1]}'
+                ),
+                trust_env=False,
+            )
+        )
+
+        responses = [
+            client.post(
+                '/generate',
+                json={
+                    'settings_path': settings_path,
+                    'template_repo': template_repository_name,
+                    'output_dir': output_dir,
+                    'overwrite': overwrite,
+                },
+            )
+            for overwrite in (False, True)
+        ]
+        conflict_response = client.post(
+            '/generate',
+            json={
+                'settings_path': settings_path,
+                'template_repo': template_repository_name,
+                'output_dir': output_dir,
+            },
+        )
+        metrics = client.get('/metrics').json()
+        connection = HTTPConnection(
+            monty.SERVER_DEFAULT_HOST, server.server_address[1]
+        )
+        stack.callback(connection.close)
+        connection.putrequest('POST', '/generate')
+        connection.putheader('Content-Type', 'application/json')
+        connection.putheader('Content-Length', 'invalid')
+        connection.endheaders()
+        invalid_response_status = connection.getresponse().status
+        request = {
+            'settings_path': settings_path,
+            'template_repo': template_repository_name,
+            'output_dir': output_dir,
+            'overwrite': True,
+        }
+        rejected_responses_statuses = [
+            client.post('/generate', json=request | changes).status_code
+            for changes in (
+                {'settings_path': os.path.join(os.pardir, 'settings.yml')},
+                {'output_dir': os.pardir},
+                {'template_repo': '../..'},
+                {'template_repo': 'lycantropos/../../x'},
+            )
+        ] + [
+            client.post(
+                '/generate', content=json.dumps(request), headers=headers
+            ).status_code
+            for headers in (
+                {'Content-Type': 'text/plain'},
+                {'Content-Type': 'application/x-www-form-urlencoded'},
+                {'Content-Type': 'application/json', 'Origin': 'null'},
+                {
+                    'Content-Type': 'application/json',
+                    'Origin': 'https://example.com',
+                },
+                {
+                    'Content-Type': 'application/json',
+                    'Host': 'rebound.example.com',
+                },
+            )
+        ]
+
+        assert all(response.status_code == 200 for response in responses)
+        assert conflict_response.status_code == 409
+        assert invalid_response_status == 400
+        assert rejected_responses_statuses == [
+            403,
+            403,
+            400,
+            400,
+            415,
+            415,
+            403,
+            403,
+            403,
+        ]
+        assert metrics['requests']['total'] == len(responses) + 1
+        assert metrics['requests']['failed'] == 1
+        assert metrics['caches']['templates'] == {'hits': 2, 'misses': 1}
+        assert metrics['caches']['licenses'] == {'hits': 2, 'misses': 1}
+
+
+@given(
+    strategies.settings,
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+    strategies.archive_formats,
+)
+def test_main_archive(
+    settings: dict[str, str],
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+    archive_format: monty.ArchiveFormat,
+) -> None:
+    with ExitStack() as stack:
+        directory = stack.enter_context(temporary_directory)
+        archive_path = os.path.join(directory, f'project.{archive_format}')
+        settings_path = stack.enter_context(write_settings(settings))
+
+        callback = monty.main.callback
+        assert callback is not None, callback
+        callback(
+            settings_path=settings_path,
+            templates_dir=templates_directory_path,
+            output_dir=None,
+            overwrite=False,
+            archive=archive_path,
+            github_access_token=github_access_token.value,
+            template_repo=template_repository_name,
+        )
+
+        template_dir = monty.sync_template(
+            templates_directory_path,
+            template_repository_name,
+            github_access_token.value,
+            offline=True,
+        )
+        archive_modes = load_archive_modes(archive_path, archive_format)
+
+        assert len(archive_modes) == capacity(monty.files_paths(template_dir))
+        assert all(
+            name.startswith(settings['project'] + '/')
+            for name in archive_modes
+        )
+        assert sorted(archive_modes.values()) == sorted(
+            stat.S_IMODE(os.stat(file_path).st_mode)
+            for file_path in monty.files_paths(template_dir)
+        )
+
+
+@given(
+    strategies.settings,
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+    strategies.jobs_counts,
+    strategies.jobs_backends,
+)
+def test_main_templates_archive_backend(
+    settings: dict[str, str],
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+    jobs: int,
+    jobs_backend: monty.JobsBackend,
+) -> None:
+    with ExitStack() as stack:
+        directory = stack.enter_context(temporary_directory)
+        settings_path = stack.enter_context(write_settings(settings))
+
+        callback = monty.main.callback
+        assert callback is not None, callback
+        outputs_dirs = {}
+        for templates_backend in monty.TEMPLATES_BACKENDS:
+            output_dir = outputs_dirs[templates_backend] = os.path.join(
+                directory, templates_backend
+            )
+            callback(
+                settings_path=settings_path,
+                templates_dir=os.path.join(
+                    templates_directory_path, templates_backend
+                ),
+                output_dir=output_dir,
+                overwrite=False,
+                templates_backend=templates_backend,
+                jobs=jobs,
+                jobs_backend=jobs_backend,
+                github_access_token=github_access_token.value,
+                template_repo=template_repository_name,
+            )
+
+        template_path = monty.sync_template(
+            os.path.join(templates_directory_path, 'archive'),
+            template_repository_name,
+            github_access_token.value,
+            offline=True,
+        )
+
+        assert not os.path.exists(template_path)
+        assert os.path.isfile(monty.to_template_archive_path(template_path))
+        assert load_files_contents(
+            outputs_dirs['archive']
+        ) == load_files_contents(outputs_dirs['tree'])
+
+
+@given(
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.temporary_directories,
+    strategies.github_access_tokens,
+    strategies.jobs_counts,
+)
+def test_sync_template_concurrently(
+    templates_directory_path: str,
+    template_repository_name: str,
+    temporary_directory: TemporaryDirectory[str],
+    github_access_token: Secured,
+    jobs: int,
+) -> None:
+    from concurrent.futures import ThreadPoolExecutor
+
+    with temporary_directory as profile_dir:
+        with (
+            monty.profiling(profile_dir),
+            ThreadPoolExecutor(max_workers=jobs) as executor,
+        ):
+            templates_paths = list(
+                executor.map(
+                    lambda _: monty.sync_template(
+                        templates_directory_path,
+                        template_repository_name,
+                        github_access_token.value,
+                    ),
+                    range(jobs),
+                )
+            )
+            with monty.lock_template_version(templates_paths[0]):
+                retired_paths_while_locked = monty.prune_templates(
+                    templates_directory_path, max_size=0
+                )
+            retired_paths = monty.prune_templates(
+                templates_directory_path, max_size=0
+            )
+        profile = monty.load_json_object(
+            os.path.join(profile_dir, monty.PROFILE_FILE_NAME)
+        )
+
+    assert len(set(templates_paths)) == 1
+    assert profile is not None
+    assert profile['phases']['download_archive']['count'] == 1
+    assert not retired_paths_while_locked
+    assert retired_paths == templates_paths[:1]
+    assert not monty.has_template_version(templates_paths[0])
+
+
+@given(strategies.templates_directories_paths)
+def test_load_templates_versions_while_retiring(
+    templates_directory_path: str,
+) -> None:
+    templates_paths = [
+        os.path.join(
+            templates_directory_path, 'lycantropos', 'template', str(index)
+        )
+        for index in range(30)
+    ]
+    os.makedirs(os.path.dirname(templates_paths[0]))
+    for index, template_path in enumerate(templates_paths):
+        if index % 3 == 0:
+            Path(monty.to_template_archive_path(template_path)).write_bytes(
+                b'archive'
+            )
+        else:
+            for file_index in range(20):
+                file_path = os.path.join(
+                    template_path, 'nested', str(file_index)
+                )
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                Path(file_path).write_bytes(b'file')
+        if index % 3 != 2:
+            monty.save_json_object(
+                monty.to_template_manifest_path(template_path),
+                {'version': monty.TEMPLATE_MANIFEST_VERSION, 'files': []},
+            )
+
+    def retire_templates_versions() -> None:
+        for template_path in templates_paths:
+            monty.retire_template_version(
+                templates_directory_path, template_path
+            )
+
+    retiring_thread = threading.Thread(target=retire_templates_versions)
+    scans_results = []
+
+    retiring_thread.start()
+    while retiring_thread.is_alive():
+        scans_results.append(
+            monty.load_templates_versions(templates_directory_path)
+        )
+    retiring_thread.join()
+
+    assert all(
+        {version.path for version in versions} <= set(templates_paths)
+        for versions in scans_results
+    )
+    assert not monty.load_templates_versions(templates_directory_path)
+
+
+@given(strategies.templates_directories_paths, strategies.github_access_tokens)
+def test_sync_template_incrementally(
+    templates_directory_path: str, github_access_token: Secured
+) -> None:
+    repository_name = 'lycantropos/monty-delta-template'
+    requests_paths: list[str] = []
+
+    def serve(
+        files: dict[str, tuple[bytes, int]], commit_date: str
+    ) -> Callable[[], httpx.BaseTransport]:
+        application = create_application(
+            {repository_name: build_template_archive(files)},
+            commit_date=commit_date,
+        )
+
+        def recording_application(
+            environ: WSGIEnvironment, start_response: StartResponse
+        ) -> Iterable[bytes]:
+            requests_paths.append(environ['PATH_INFO'])
+            return application(environ, start_response)
+
+        return partial(httpx.WSGITransport, app=recording_application)
+
+    sync_template = partial(
+        monty.sync_template,
+        templates_directory_path,
+        repository_name,
+        github_access_token.value,
+        incremental=True,
+    )
+    changed_files = {
+        **TEMPLATE_FILES,
+        'README.md': (b'# {{ project }}\n', 0o100644),
+        'docs/usage.md': (b'Usage of {{ project }}.\n', 0o100644),
+    }
+    rewritten_files = {
+        file_path: (content + b'\n', mode)
+        for file_path, (content, mode) in changed_files.items()
+    }
+    previous_factory = monty.set_http_transport_factory(
+        serve(TEMPLATE_FILES, '2024-01-01T00:00:00Z')
+    )
+    try:
+        previous_template_path = sync_template()
+        monty.set_http_transport_factory(
+            serve(changed_files, '2024-02-01T00:00:00Z')
+        )
+        requests_paths.clear()
+        template_path = sync_template()
+        delta_requests_paths = list(requests_paths)
+        monty.set_http_transport_factory(
+            serve(rewritten_files, '2024-03-01T00:00:00Z')
+        )
+        requests_paths.clear()
+        rewritten_template_path = sync_template()
+    finally:
+        monty.set_http_transport_factory(previous_factory)
+
+    assert load_files_contents(template_path) == {
+        os.path.join(*file_path.split('/')): (content, stat.S_IMODE(mode))
+        for file_path, (content, mode) in changed_files.items()
+    }
+    assert not any(path.endswith('.zip') for path in delta_requests_paths)
+    assert sum('/git/blobs/' in path for path in delta_requests_paths) == len(
+        changed_files.items() - TEMPLATE_FILES.items()
+    )
+    assert os.path.samefile(
+        os.path.join(previous_template_path, 'LICENSE'),
+        os.path.join(template_path, 'LICENSE'),
+    )
+    assert load_files_contents(rewritten_template_path) == {
+        os.path.join(*file_path.split('/')): (content, stat.S_IMODE(mode))
+        for file_path, (content, mode) in rewritten_files.items()
+    }
+    assert any(path.endswith('.zip') for path in requests_paths)
+
+
+@given(strategies.templates_directories_paths, strategies.github_access_tokens)
+def test_sync_template_revalidating(
+    templates_directory_path: str, github_access_token: Secured
+) -> None:
+    repository_name = 'lycantropos/monty-revalidated-template'
+    sync_template = partial(
+        monty.sync_template,
+        templates_directory_path,
+        repository_name,
+        github_access_token.value,
+    )
+    load_template_timestamps = partial(
+        monty.load_template_timestamps,
+        os.path.join(templates_directory_path, repository_name),
+    )
+
+    with (
+        serving_templates(
+            {repository_name: TEMPLATE_FILES},
+            commit_date='2024-01-01T00:00:00Z',
+        ),
+        recording_exchanges() as exchanges,
+    ):
+        template_path = sync_template()
+        fetched_exchanges = list(exchanges)
+        timestamps = load_template_timestamps()
+        exchanges.clear()
+        revalidated_template_path = sync_template(ttl=0)
+        revalidated_exchanges = list(exchanges)
+        revalidated_timestamps = load_template_timestamps()
+        exchanges.clear()
+        fresh_template_path = sync_template(ttl=3600)
+        fresh_exchanges = list(exchanges)
+    with (
+        serving_templates(
+            {repository_name: TEMPLATE_FILES},
+            commit_date='2024-02-01T00:00:00Z',
+        ),
+        recording_exchanges() as exchanges,
+    ):
+        # commits list changed, so previous ETag does not match
+        updated_template_path = sync_template(ttl=0)
+        updated_exchanges = list(exchanges)
+        exchanges.clear()
+        offline_template_path = sync_template(offline=True)
+        offline_exchanges = list(exchanges)
+
+    (commits_request, commits_response), *_ = fetched_exchanges
+    assert 'If-None-Match' not in commits_request.headers
+    assert any(
+        request.url.path.endswith('.zip') for request, _ in fetched_exchanges
+    )
+    assert revalidated_template_path == template_path
+    assert [
+        (
+            request.url.path,
+            request.headers.get('If-None-Match'),
+            response.status_code,
+        )
+        for request, response in revalidated_exchanges
+    ] == [
+        (
+            commits_request.url.path,
+            commits_response.headers['ETag'],
+            HTTPStatus.NOT_MODIFIED,
+        )
+    ]
+    assert revalidated_timestamps == timestamps
+    assert fresh_template_path == template_path
+    assert not fresh_exchanges
+    assert updated_template_path != template_path
+    assert [
+        (request.headers.get('If-None-Match'), response.status_code)
+        for request, response in updated_exchanges[:1]
+    ] == [(commits_response.headers['ETag'], HTTPStatus.OK)]
+    assert offline_template_path == updated_template_path
+    assert not offline_exchanges
+    assert load_template_timestamps() == [
+        *timestamps,
+        int(os.path.basename(updated_template_path)),
+    ]
+
+
+@given(strategies.templates_directories_paths, strategies.github_access_tokens)
+def test_sync_template_incrementally_within_rate_limit(
+    templates_directory_path: str, github_access_token: Secured
+) -> None:
+    repository_name = 'lycantropos/monty-rate-limited-template'
+    changed_files = {
+        **TEMPLATE_FILES,
+        'README.md': (b'# {{ project }}\n', 0o100644),
+        'docs/usage.md': (b'Usage of {{ project }}.\n', 0o100644),
+    }
+    transport = httpx.WSGITransport(
+        app=create_application(
+            {repository_name: build_template_archive(changed_files)},
+            commit_date='2024-02-01T00:00:00Z',
+        )
+    )
+
+    def handle_rate_limited(request: httpx.Request) -> httpx.Response:
+        response = transport.handle_request(request)
+        # leaves quota for a single blob only
+        response.headers['X-RateLimit-Remaining'] = '4'
+        return response
+
+    sync_template = partial(
+        monty.sync_template,
+        templates_directory_path,
+        repository_name,
+        github_access_token.value,
+        incremental=True,
+    )
+
+    with serving_templates(
+        {repository_name: TEMPLATE_FILES}, commit_date='2024-01-01T00:00:00Z'
+    ):
+        previous_template_path = sync_template()
+    with serving(handle_rate_limited), recording_exchanges() as exchanges:
+        template_path = sync_template()
+
+    requests_paths = [request.url.path for request, _ in exchanges]
+    assert template_path != previous_template_path
+    assert load_files_contents(template_path) == {
+        os.path.join(*file_path.split('/')): (content, stat.S_IMODE(mode))
+        for file_path, (content, mode) in changed_files.items()
+    }
+    assert any('/git/trees/' in path for path in requests_paths)
+    assert not any('/git/blobs/' in path for path in requests_paths)
+    assert any(path.endswith('.zip') for path in requests_paths)
+
+
+@given(strategies.templates_directories_paths, strategies.github_access_tokens)
+def test_sync_templates_sharing_objects(
+    templates_directory_path: str, github_access_token: Secured
+) -> None:
+    first_repository_name = 'lycantropos/monty-first-template'
+    second_repository_name = 'lycantropos/monty-second-template'
+    changed_files = {
+        **TEMPLATE_FILES,
+        'README.md': (b'# {{ project }}\n', 0o100644),
+    }
+    sync_template = partial(
+        monty.sync_template,
+        templates_directory_path,
+        github_access_token=github_access_token.value,
+        cache_size=None,
+    )
+
+    with serving_templates(
+        {
+            first_repository_name: TEMPLATE_FILES,
+            second_repository_name: TEMPLATE_FILES,
+        },
+        commit_date='2024-01-01T00:00:00Z',
+    ):
+        first_template_path = sync_template(first_repository_name)
+        second_template_path = sync_template(second_repository_name)
+    with serving_templates(
+        {first_repository_name: changed_files},
+        commit_date='2024-02-01T00:00:00Z',
+    ):
+        updated_template_path = sync_template(first_repository_name)
+
+    assert updated_template_path != first_template_path
+    assert all(
+        os.path.samefile(
+            os.path.join(first_template_path, file_name),
+            os.path.join(template_path, file_name),
+        )
+        for file_name in generated_files_names(first_template_path)
+        if file_name != 'README.md'
+        for template_path in (second_template_path, updated_template_path)
+    )
+    assert not os.path.samefile(
+        os.path.join(first_template_path, 'README.md'),
+        os.path.join(updated_template_path, 'README.md'),
+    )
+
+
+@given(strategies.templates_directories_paths, strategies.github_access_tokens)
+def test_sync_template_evicting_least_recently_used(
+    templates_directory_path: str, github_access_token: Secured
+) -> None:
+    # same sized licenses make versions occupy the same space
+    first_repository_name, second_repository_name, third_repository_name = (
+        f'lycantropos/monty-{name}-template'
+        for name in ('alpha', 'bravo', 'delta')
+    )
+    sync_template = partial(
+        monty.sync_template,
+        templates_directory_path,
+        github_access_token=github_access_token.value,
+        cache_size=None,
+    )
+
+    with serving_templates(
+        {
+            repository_name: {
+                **TEMPLATE_FILES,
+                'LICENSE': (repository_name.encode(), 0o100644),
+            }
+            for repository_name in (
+                first_repository_name,
+                second_repository_name,
+                third_repository_name,
+            )
+        }
+    ):
+        first_template_path = sync_template(first_repository_name)
+        second_template_path = sync_template(second_repository_name)
+        cache_size = monty.load_templates_cache_statistics(
+            templates_directory_path
+        )['size']
+        reused_template_path = sync_template(
+            first_repository_name, cache_size=cache_size
+        )
+        third_template_path = sync_template(
+            third_repository_name, cache_size=cache_size
+        )
+
+    assert reused_template_path == first_template_path
+    assert {
+        version.path
+        for version in monty.load_templates_versions(templates_directory_path)
+    } == {first_template_path, third_template_path}
+    assert not monty.has_template_version(second_template_path)
+    assert (
+        monty.load_templates_cache_statistics(templates_directory_path)['size']
+        <= cache_size
+    )
+
+
+@given(strategies.templates_directories_paths, strategies.github_access_tokens)
+def test_cache_commands(
+    templates_directory_path: str, github_access_token: Secured
+) -> None:
+    repositories_names = [
+        'lycantropos/monty-first-template',
+        'lycantropos/monty-second-template',
+    ]
+    runner = CliRunner()
+    invoke_cache_command = partial(runner.invoke, monty.cache_command)
+
+    with serving_templates(dict.fromkeys(repositories_names, TEMPLATE_FILES)):
+        templates_paths = [
+            monty.sync_template(
+                templates_directory_path,
+                repository_name,
+                github_access_token.value,
+                cache_size=None,
+            )
+            for repository_name in repositories_names
+        ]
+    stats_result = invoke_cache_command(
+        ['stats', '--templates-dir', templates_directory_path]
+    )
+    prune_result = invoke_cache_command(
+        ['prune', '--templates-dir', templates_directory_path]
+    )
+    pruned_stats_result = invoke_cache_command(
+        ['stats', '--templates-dir', templates_directory_path]
+    )
+
+    objects_sizes = [len(content) for content, _ in TEMPLATE_FILES.values()]
+    assert stats_result.exit_code == 0, stats_result.output
+    assert parse_cache_statistics(stats_result.output) == {
+        'versions': len(templates_paths),
+        'objects': len(objects_sizes),
+        'size': sum(objects_sizes),
+        'logical_size': len(templates_paths) * sum(objects_sizes),
+    }
+    assert prune_result.exit_code == 0, prune_result.output
+    assert sorted(prune_result.output.splitlines()) == sorted(
+        f'Removed {template_path}' for template_path in templates_paths
+    )
+    assert parse_cache_statistics(pruned_stats_result.output) == {
+        'versions': 0,
+        'objects': 0,
+        'size': 0,
+        'logical_size': 0,
+    }
+
+
+def parse_cache_statistics(output: str) -> dict[str, int]:
+    return {
+        name: int(value)
+        for name, value in (
+            line.split(': ', maxsplit=1) for line in output.splitlines()
+        )
+    }
+
+
+def generated_files_names(path: str) -> list[str]:
+    return [
+        os.path.relpath(file_path, path)
+        for file_path in generated_files_paths(path)
+    ]
+
+
+@contextmanager
+def serving_templates(
+    templates_files: Mapping[str, Mapping[str, tuple[bytes, int]]],
+    *,
+    commit_date: str = DEFAULT_COMMIT_DATE,
+) -> Iterator[None]:
+    previous_factory = monty.set_http_transport_factory(
+        partial(
+            httpx.WSGITransport,
+            app=create_application(
+                {
+                    repository_name: build_template_archive(files)
+                    for repository_name, files in templates_files.items()
+                },
+                commit_date=commit_date,
+            ),
+        )
+    )
+    try:
+        yield
+    finally:
+        monty.set_http_transport_factory(previous_factory)
+
+
+def load_files_contents(path: str) -> dict[str, tuple[bytes, int]]:
+    return {
+        os.path.relpath(file_path, path): (
+            Path(file_path).read_bytes(),
+            stat.S_IMODE(os.stat(file_path).st_mode),
+        )
+        for file_path in generated_files_paths(path)
+    }
+
+
+def load_archive_modes(
+    path: str, archive_format: monty.ArchiveFormat
+) -> dict[str, int]:
+    if archive_format == 'zip':
+        with ZipFile(path) as zip_file:
+            return {
+                file_info.filename: stat.S_IMODE(file_info.external_attr >> 16)
+                for file_info in zip_file.infolist()
+            }
+    with tarfile.open(path) as tar_file:
+        return {
+            file_info.name: file_info.mode
+            for file_info in tar_file.getmembers()
+        }
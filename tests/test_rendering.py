@@ -0,0 +1,202 @@
+import os
+from collections import Counter
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from hypothesis import given
+
+from monty import monty
+from tests import strategies
+
+
+@given(
+    strategies.binary_files_contents,
+    strategies.link_modes,
+    strategies.temporary_directories,
+)
+def test_render_binary_file(
+    content: bytes,
+    link_mode: monty.LinkMode,
+    temporary_directory: TemporaryDirectory[str],
+) -> None:
+    with temporary_directory as directory:
+        source_path = os.path.join(directory, 'source')
+        destination_path = os.path.join(directory, 'nested', 'destination')
+        Path(source_path).write_bytes(content)
+        os.chmod(source_path, 0o755)
+
+        def renderer(source: str) -> str:
+            raise AssertionError(source)
+
+        monty.render_file(
+            source_path,
+            destination_path,
+            renderer=renderer,
+            link_mode=link_mode,
+        )
+
+        assert Path(destination_path).read_bytes() == content
+        assert (
+            os.stat(destination_path).st_mode == os.stat(source_path).st_mode
+        )
+
+
+@given(
+    strategies.plain_files_contents,
+    strategies.link_modes,
+    strategies.temporary_directories,
+)
+def test_render_file_without_template_syntax(
+    content: str,
+    link_mode: monty.LinkMode,
+    temporary_directory: TemporaryDirectory[str],
+) -> None:
+    with temporary_directory as directory:
+        source_path = os.path.join(directory, 'source')
+        destination_path = os.path.join(directory, 'nested', 'destination')
+        Path(source_path).write_bytes(content.encode('utf-8', 'surrogatepass'))
+
+        def renderer(source: str) -> str:
+            raise AssertionError(source)
+
+        monty.render_file(
+            source_path,
+            destination_path,
+            renderer=renderer,
+            link_mode=link_mode,
+        )
+
+        assert (
+            Path(destination_path).read_bytes()
+            == Path(source_path).read_bytes()
+        )
+
+
+@given(strategies.descriptions, strategies.temporary_directories)
+def test_render_unchanged_file(
+    content: str, temporary_directory: TemporaryDirectory[str]
+) -> None:
+    with temporary_directory as directory:
+        source_path = os.path.join(directory, 'source')
+        destination_path = os.path.join(directory, 'destination')
+        Path(source_path).write_text('{{ content }}', encoding='utf-8')
+
+        def renderer(_source: str) -> str:
+            return content
+
+        monty.render_file(source_path, destination_path, renderer=renderer)
+        destination_stat = os.stat(destination_path)
+        os.utime(
+            destination_path,
+            ns=(
+                destination_stat.st_atime_ns,
+                destination_stat.st_mtime_ns - 1,
+            ),
+        )
+        destination_mtime = os.stat(destination_path).st_mtime_ns
+
+        monty.render_file(source_path, destination_path, renderer=renderer)
+
+        assert os.stat(destination_path).st_mtime_ns == destination_mtime
+
+
+@given(strategies.templates_relative_files_paths, strategies.projects_names)
+def test_replace_files_paths(
+    relative_files_paths: list[str], project_name: str
+) -> None:
+    source_path, destination = 'template', 'output'
+    rendered_paths_parts: Counter[str] = Counter()
+
+    def renderer(source: str) -> str:
+        rendered_paths_parts[source] += 1
+        return monty.render(source, {'project': project_name})
+
+    result = list(
+        monty.replace_files_paths(
+            [
+                os.path.join(source_path, relative_file_path)
+                for relative_file_path in relative_files_paths
+            ],
+            source_path=source_path,
+            destination=destination,
+            renderer=renderer,
+        )
+    )
+
+    assert [file_path for file_path, _ in result] == [
+        os.path.join(source_path, relative_file_path)
+        for relative_file_path in relative_files_paths
+    ]
+    assert [new_file_path for _, new_file_path in result] == [
+        os.path.join(
+            destination,
+            *monty.render_path_parts(
+                *relative_file_path.split(os.sep),
+                renderer=partial(
+                    monty.render, settings={'project': project_name}
+                ),
+            ),
+        )
+        for relative_file_path in relative_files_paths
+    ]
+    assert all(
+        monty.has_template_syntax(part) for part in rendered_paths_parts
+    )
+    assert sum(rendered_paths_parts.values()) <= len(
+        {
+            os.path.join(*parts[: index + 1])
+            for relative_file_path in relative_files_paths
+            for parts in [relative_file_path.split(os.sep)]
+            for index in range(len(parts))
+        }
+    )
+
+
+@given(
+    strategies.templates_directories_paths,
+    strategies.template_repositories_names,
+    strategies.projects_names,
+)
+def test_plan_template_files(
+    templates_directory_path: str,
+    template_repository_name: str,
+    project_name: str,
+) -> None:
+    template_dir = monty.sync_template(
+        templates_directory_path, template_repository_name, None
+    )
+    manifest = monty.load_template_manifest(template_dir)
+    destination = 'output'
+    renderer = partial(monty.render, settings={'project': project_name})
+
+    result = monty.plan_template_files(
+        template_dir,
+        destination=destination,
+        renderer=renderer,
+        manifest=manifest,
+    )
+
+    assert manifest is not None
+    assert manifest['version'] == monty.TEMPLATE_MANIFEST_VERSION
+    assert sorted(
+        (file_path, new_file_path) for file_path, new_file_path, _ in result
+    ) == sorted(
+        monty.replace_files_paths(
+            monty.files_paths(template_dir),
+            source_path=template_dir,
+            destination=destination,
+            renderer=renderer,
+        )
+    )
+    assert all(
+        file_kind
+        == (
+            'binary'
+            if monty.is_binary_file(file_path)
+            else 'template'
+            if monty.has_template_syntax(Path(file_path).read_bytes())
+            else 'plain'
+        )
+        for file_path, _, file_kind in result
+    )
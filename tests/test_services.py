@@ -1,4 +1,10 @@
+import os
+from collections.abc import Iterator
 from http import HTTPStatus
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+from uuid import uuid4
 
 import httpx
 import pytest
@@ -6,7 +12,7 @@ from hypothesis import given
 
 from monty import monty
 from tests import strategies
-from tests.utils import Secured
+from tests.utils import Secured, recording_exchanges, serving
 
 
 @given(strategies.dockerhub_logins)
@@ -24,6 +30,48 @@ def test_load_invalid_dockerhub_user(invalid_dockerhub_login: str) -> None:
     assert error_ctx.value.response.status_code == HTTPStatus.NOT_FOUND
 
 
+@given(strategies.dockerhub_logins)
+def test_load_cached_dockerhub_user(dockerhub_login: str) -> None:
+    with recording_exchanges() as exchanges:
+        user = monty.load_dockerhub_user(dockerhub_login, ttl=0)
+        fetched_exchanges = list(exchanges)
+        exchanges.clear()
+        cached_user = monty.load_dockerhub_user(dockerhub_login)
+        cached_exchanges = list(exchanges)
+        exchanges.clear()
+        # cache entry is expired right away with zero TTL
+        revalidated_user = monty.load_dockerhub_user(dockerhub_login, ttl=0)
+        revalidated_exchanges = list(exchanges)
+
+    assert cached_user == revalidated_user == user
+    assert len(fetched_exchanges) == 1
+    assert not cached_exchanges
+    assert [
+        (request.headers.get('If-None-Match'), response.status_code)
+        for request, response in revalidated_exchanges
+    ] == [(fetched_exchanges[0][1].headers['ETag'], HTTPStatus.NOT_MODIFIED)]
+
+
+@given(strategies.invalid_dockerhub_logins)
+def test_load_cached_invalid_dockerhub_user(
+    invalid_dockerhub_login: str,
+) -> None:
+    with recording_exchanges() as exchanges:
+        with pytest.raises(httpx.HTTPStatusError):
+            monty.load_dockerhub_user(invalid_dockerhub_login, ttl=0)
+        fetched_exchanges = list(exchanges)
+        exchanges.clear()
+        with pytest.raises(httpx.HTTPStatusError) as error_ctx:
+            monty.load_dockerhub_user(invalid_dockerhub_login)
+        cached_exchanges = list(exchanges)
+
+    assert [response.status_code for _, response in fetched_exchanges] == [
+        HTTPStatus.NOT_FOUND
+    ]
+    assert not cached_exchanges
+    assert error_ctx.value.response.status_code == HTTPStatus.NOT_FOUND
+
+
 @given(strategies.github_logins, strategies.github_access_tokens)
 def test_load_valid_github_user(
     github_login: str, github_access_token: Secured
@@ -44,4 +92,296 @@ def test_load_invalid_github_user(
             invalid_github_login, access_token=github_access_token.value
         )
 
-    assert error_ctx.value.response.status_code == HTTPStatus.FORBIDDEN
+    assert error_ctx.value.response.status_code == HTTPStatus.NOT_FOUND
+
+
+@given(
+    strategies.github_logins,
+    strategies.dockerhub_logins,
+    strategies.github_access_tokens,
+)
+def test_load_offline_user_full_name(
+    github_login: str, dockerhub_login: str, github_access_token: Secured
+) -> None:
+    with recording_exchanges() as exchanges:
+        full_name = monty.load_user_full_name(
+            github_login,
+            dockerhub_login,
+            github_access_token=github_access_token.value,
+            ttl=0,
+        )
+        exchanges.clear()
+        # expired cache entries are used as is without network access
+        offline_full_name = monty.load_user_full_name(
+            github_login,
+            dockerhub_login,
+            github_access_token=github_access_token.value,
+            ttl=0,
+            offline=True,
+        )
+        offline_exchanges = list(exchanges)
+        with pytest.raises(ValueError, match='No cached user'):
+            monty.load_user_full_name(
+                github_login + '-' + uuid4().hex,
+                dockerhub_login,
+                github_access_token=github_access_token.value,
+                offline=True,
+            )
+        missing_exchanges = list(exchanges)
+
+    assert offline_full_name == full_name
+    assert not offline_exchanges
+    assert not missing_exchanges
+
+
+@given(strategies.spdx_licenses_identifiers)
+def test_load_cached_spdx_licenses_info(spdx_license_identifier: str) -> None:
+    cache_file_path = (
+        monty.CACHE_DIRECTORY_PATH / monty.SPDX_LICENSES_CACHE_FILE_NAME
+    )
+    cache_file_path.unlink(missing_ok=True)
+
+    with recording_exchanges() as exchanges:
+        spdx_licenses_info = monty.load_spdx_licenses_info()
+        fetched_exchanges = list(exchanges)
+        cache_info = monty.load_json_object(str(cache_file_path))
+        exchanges.clear()
+        cached_spdx_licenses_info = monty.load_spdx_licenses_info()
+        cached_exchanges = list(exchanges)
+        exchanges.clear()
+        # cache entry is expired right away with zero TTL
+        revalidated_spdx_licenses_info = monty.load_spdx_licenses_info(ttl=0)
+        revalidated_exchanges = list(exchanges)
+
+    assert [response.status_code for _, response in fetched_exchanges] == [
+        HTTPStatus.OK
+    ]
+    assert cache_info is not None
+    assert cache_info['value'] == spdx_licenses_info
+    assert not cached_exchanges
+    assert [
+        (request.headers.get('If-None-Match'), response.status_code)
+        for request, response in revalidated_exchanges
+    ] == [(fetched_exchanges[0][1].headers['ETag'], HTTPStatus.NOT_MODIFIED)]
+    assert (
+        cached_spdx_licenses_info
+        == revalidated_spdx_licenses_info
+        == spdx_licenses_info
+    )
+    assert spdx_licenses_info[spdx_license_identifier].keys() == {
+        'name',
+        'is_deprecated',
+        'osi_approved',
+    }
+
+
+@given(strategies.spdx_licenses_identifiers)
+def test_load_licenses_info(spdx_license_identifier: str) -> None:
+    licenses_info = monty.load_licenses_info()
+
+    assert spdx_license_identifier in licenses_info.spdx_licenses_info
+    assert all(
+        licenses_info.trove_licenses_index.get(identifier, [])
+        == scan_trove_licenses_classifiers(
+            spdx_license_info, licenses_info.trove_licenses_classifiers
+        )
+        for identifier, spdx_license_info in (
+            licenses_info.spdx_licenses_info.items()
+        )
+    )
+
+
+@given(strategies.http_retries_counts, strategies.http_retries_counts)
+def test_retrying_transport(retries: int, failures_count: int) -> None:
+    responses_statuses = [HTTPStatus.SERVICE_UNAVAILABLE] * failures_count
+    transport = monty.RetryingTransport(
+        httpx.MockTransport(
+            lambda _request: httpx.Response(
+                responses_statuses.pop()
+                if responses_statuses
+                else HTTPStatus.OK
+            )
+        ),
+        retries=retries,
+        initial_backoff=0,
+    )
+
+    with httpx.Client(transport=transport) as client:
+        response = client.get('https://example.com')
+
+    assert isinstance(transport, httpx.BaseTransport)
+    assert response.status_code == (
+        HTTPStatus.OK
+        if failures_count <= retries
+        else HTTPStatus.SERVICE_UNAVAILABLE
+    )
+
+
+DOWNLOAD_URL = 'https://example.com/archive.zip'
+DOWNLOAD_ETAG = '"archive"'
+
+
+@given(strategies.downloads_contents, strategies.temporary_directories)
+def test_download_file_resume(
+    content: bytes, temporary_directory: TemporaryDirectory[str]
+) -> None:
+    offset = len(content) // 2
+    requests: list[httpx.Request] = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            return httpx.Response(
+                HTTPStatus.OK,
+                headers={
+                    'Content-Length': str(len(content)),
+                    'ETag': DOWNLOAD_ETAG,
+                },
+                stream=InterruptedStream(content[:offset]),
+            )
+        return to_range_response(request, content)
+
+    with temporary_directory as directory, serving(handle):
+        destination_path = os.path.join(directory, 'archive.zip')
+
+        monty.download_file(DOWNLOAD_URL, destination_path, chunk_size=1)
+
+        downloaded_content = Path(destination_path).read_bytes()
+        leftover_paths = os.listdir(directory)
+
+    assert downloaded_content == content
+    assert leftover_paths == ['archive.zip']
+    assert 'Range' not in requests[0].headers
+    assert requests[1].headers['Range'] == f'bytes={offset}-'
+    assert requests[1].headers['If-Range'] == DOWNLOAD_ETAG
+    assert len(requests) == 2
+
+
+@given(strategies.downloads_contents, strategies.temporary_directories)
+def test_download_file_range_not_satisfiable(
+    content: bytes, temporary_directory: TemporaryDirectory[str]
+) -> None:
+    requests: list[httpx.Request] = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if 'Range' in request.headers:
+            return httpx.Response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        return httpx.Response(
+            HTTPStatus.OK, headers={'ETag': DOWNLOAD_ETAG}, content=content
+        )
+
+    with temporary_directory as directory, serving(handle):
+        destination_path = os.path.join(directory, 'archive.zip')
+        # partial download is longer than the current version of file
+        write_partial_download(destination_path, content + content)
+
+        monty.download_file(DOWNLOAD_URL, destination_path)
+
+        downloaded_content = Path(destination_path).read_bytes()
+
+    assert downloaded_content == content
+    assert [request.headers.get('Range') for request in requests] == [
+        f'bytes={2 * len(content)}-',
+        None,
+    ]
+
+
+@given(strategies.downloads_contents, strategies.temporary_directories)
+def test_download_file_replaces_stale_partial_file(
+    content: bytes, temporary_directory: TemporaryDirectory[str]
+) -> None:
+    requests: list[httpx.Request] = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        # file has changed since partial download, so range is ignored
+        return httpx.Response(
+            HTTPStatus.OK, headers={'ETag': '"changed"'}, content=content
+        )
+
+    with temporary_directory as directory, serving(handle):
+        destination_path = os.path.join(directory, 'archive.zip')
+        write_partial_download(destination_path, b'stale')
+
+        monty.download_file(DOWNLOAD_URL, destination_path)
+
+        downloaded_content = Path(destination_path).read_bytes()
+
+    assert downloaded_content == content
+    assert requests[0].headers['If-Range'] == DOWNLOAD_ETAG
+    assert len(requests) == 1
+
+
+@given(strategies.downloads_contents, strategies.temporary_directories)
+def test_download_file_content_length_mismatch(
+    content: bytes, temporary_directory: TemporaryDirectory[str]
+) -> None:
+    def handle(_request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            HTTPStatus.OK,
+            headers={'Content-Length': str(len(content) + 1)},
+            stream=httpx.ByteStream(content),
+        )
+
+    with temporary_directory as directory, serving(handle):
+        destination_path = os.path.join(directory, 'archive.zip')
+
+        with pytest.raises(ValueError, match='expected'):
+            monty.download_file(DOWNLOAD_URL, destination_path)
+
+        downloaded = os.path.exists(destination_path)
+
+    assert not downloaded
+
+
+class InterruptedStream(httpx.SyncByteStream):
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.content
+        raise httpx.ReadError('Connection reset by peer.')
+
+
+def scan_trove_licenses_classifiers(
+    spdx_license_info: dict[str, Any], trove_licenses_classifiers: list[str]
+) -> list[str]:
+    separator = monty.TROVE_CLASSIFIER_SEPARATOR
+    return [
+        classifier
+        for classifier in trove_licenses_classifiers
+        if (
+            spdx_license_info['name']
+            in classifier.rsplit(separator, maxsplit=1)[1]
+            and (
+                classifier.split(separator, maxsplit=2)[1]
+                == monty.OSI_APPROVED_TROVE_LICENSES_GROUP
+            )
+            is spdx_license_info['osi_approved']
+        )
+    ]
+
+
+def to_range_response(
+    request: httpx.Request, content: bytes
+) -> httpx.Response:
+    assert request.headers['If-Range'] == DOWNLOAD_ETAG, request.headers
+    offset = int(
+        request.headers['Range'].removeprefix('bytes=').removesuffix('-')
+    )
+    return httpx.Response(
+        HTTPStatus.PARTIAL_CONTENT,
+        headers={
+            'Content-Range': (
+                f'bytes {offset}-{len(content) - 1}/{len(content)}'
+            ),
+            'ETag': DOWNLOAD_ETAG,
+        },
+        content=content[offset:],
+    )
+
+
+def write_partial_download(path: str, content: bytes) -> None:
+    Path(path).write_bytes(content)
+    monty.save_json_object(path + '.json', {'etag': DOWNLOAD_ETAG})
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+from tempfile import TemporaryDirectory
+
+from hypothesis import given
+
+from tests import strategies
+
+
+@given(strategies.lazily_imported_modules_names)
+def test_lazy_imports(module_name: str) -> None:
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            (
+                'import sys\n'
+                'import monty.monty\n'
+                f'sys.exit({module_name!r} in sys.modules)'
+            ),
+        ],
+        check=False,
+    )
+
+    assert result.returncode == 0
+
+
+@given(strategies.temporary_directories)
+def test_version(temporary_directory: TemporaryDirectory[str]) -> None:
+    with temporary_directory as home_directory:
+        result = subprocess.run(
+            [sys.executable, '-m', 'monty.monty', '--version'],
+            capture_output=True,
+            check=True,
+            env={**os.environ, 'HOME': home_directory},
+            text=True,
+        )
+
+        assert result.stdout
+        assert not os.listdir(home_directory)
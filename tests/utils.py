@@ -1,5 +1,11 @@
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
 from typing import Any
 
+import httpx
+
+from monty import monty
+
 
 class Secured:
     def __init__(self, value: Any) -> None:
@@ -7,3 +13,54 @@ class Secured:
 
     def __repr__(self) -> str:
         return '...' if self.value is not None else repr(self.value)
+
+
+@contextmanager
+def serving(
+    handler: Callable[[httpx.Request], httpx.Response],
+) -> Iterator[None]:
+    previous_factory = monty.set_http_transport_factory(
+        lambda: httpx.MockTransport(handler)
+    )
+    try:
+        yield
+    finally:
+        monty.set_http_transport_factory(previous_factory)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(
+        self,
+        transport: httpx.BaseTransport,
+        exchanges: list[tuple[httpx.Request, httpx.Response]],
+    ) -> None:
+        self.exchanges = exchanges
+        self.transport = transport
+
+    def close(self) -> None:
+        self.transport.close()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self.transport.handle_request(request)
+        self.exchanges.append((request, response))
+        return response
+
+
+@contextmanager
+def recording_exchanges() -> Iterator[
+    list[tuple[httpx.Request, httpx.Response]]
+]:
+    exchanges: list[tuple[httpx.Request, httpx.Response]] = []
+    previous_factory = monty.set_http_transport_factory(None)
+    monty.set_http_transport_factory(
+        lambda: RecordingTransport(
+            httpx.HTTPTransport()
+            if previous_factory is None
+            else previous_factory(),
+            exchanges,
+        )
+    )
+    try:
+        yield exchanges
+    finally:
+        monty.set_http_transport_factory(previous_factory)